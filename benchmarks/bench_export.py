@@ -0,0 +1,144 @@
+"""Benchmark complete export_website.py runs against a local synthetic WordPress site.
+
+Serves the site of synthetic_site.py on a free local port, runs export_website.py against it
+in a subprocess (--repeat times, each into a fresh temporary folder) and reports pages/sec,
+asset throughput, peak RSS and CPU time, with the wall-clock time, CPU time and peak RSS of
+every stage and the time spent in every phase from export_metrics.json. No network access
+is needed.
+
+Usage:
+    python benchmarks/bench_export.py --pages 500 --sitemaps 10 --env PARSE_WORKERS=4
+    python benchmarks/bench_export.py --slow-rate 0.1 --fail-rate 0.02 --json result.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_site import add_site_arguments, make_site, start_server
+
+EXPORTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "export_website.py")
+
+
+def run_export(host, env_overrides, python):
+    """Run one export against the site at host and return its measurements"""
+    work_dir = tempfile.mkdtemp(prefix="bench_export_")
+    export_folder = os.path.join(work_dir, "export")
+    env = dict(os.environ)
+    env.update({
+        "TARGET_DOMAIN": host,
+        "SITEMAP_URL": f"http://{host}/sitemap_index.xml",
+        "URL_TO_REPLACE": "https://static.example.org/",
+        "EXPORT_FOLDER": export_folder,
+        "INCREMENTAL": "false",
+    })
+    env.update(env_overrides)
+    try:
+        with open(os.path.join(work_dir, "export.log"), "wb") as log:
+            started = time.perf_counter()
+            # The exporter runs in its own folder, so its log and any allow-urls.txt stay out of the way
+            process = subprocess.Popen([python, os.path.abspath(EXPORTER)], cwd=work_dir, env=env,
+                                       stdout=log, stderr=subprocess.STDOUT)
+            # wait4() reports the resources of this export alone, including its worker processes
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            elapsed = time.perf_counter() - started
+        if process.returncode != 0:
+            with open(os.path.join(work_dir, "export.log"), encoding="utf-8", errors="replace") as log:
+                tail = log.readlines()[-20:]
+            raise RuntimeError(f"export_website.py exited with {process.returncode}:\n{''.join(tail)}")
+
+        with open(os.path.join(export_folder, "export_statistics.json"), encoding="utf-8") as f:
+            stats = json.load(f)
+        with open(os.path.join(export_folder, "export_metrics.json"), encoding="utf-8") as f:
+            metrics = json.load(f)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    asset_bytes = metrics["phases"].get("asset", {}).get("bytes", 0)
+    return {
+        "seconds": round(elapsed, 3),
+        "pages": stats["pages_processed"],
+        "pages_per_second": round(stats["pages_processed"] / elapsed, 2),
+        "assets": stats["assets_downloaded"],
+        "assets_per_second": round(stats["assets_downloaded"] / elapsed, 2),
+        "asset_mb_per_second": round(asset_bytes / 1e6 / elapsed, 2),
+        "errors": stats["errors"],
+        "requests_per_second": stats.get("effective_request_rate", 0),
+        "requests_retried": stats.get("requests_retried", 0),
+        "requests_throttled": stats.get("requests_throttled", 0),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        "peak_rss_mb": round(usage.ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3), 1),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "stages": metrics["stages"],
+        "stages_cpu": metrics.get("stages_cpu", {}),
+        "stages_peak_rss_mb": metrics.get("stages_peak_rss_mb", {}),
+        "phases": {phase: {"count": values["count"], "seconds": values["seconds"], "mean_seconds": values["mean_seconds"]}
+                   for phase, values in metrics["phases"].items()},
+    }
+
+
+def print_run(result):
+    """Print the summary of one export run"""
+    print(f"{result['seconds']:8.2f} s  {result['pages_per_second']:8.1f} pages/s  "
+          f"{result['assets_per_second']:8.1f} assets/s  {result['asset_mb_per_second']:6.2f} MB/s  "
+          f"peak RSS {result['peak_rss_mb']:7.1f} MB  CPU {result['cpu_seconds']:7.2f} s  "
+          f"errors {result['errors']}  {result['requests_per_second']:.1f} requests/s "
+          f"({result['requests_retried']} retried, {result['requests_throttled']} throttled)")
+
+
+def print_breakdown(result):
+    """Print the per-stage and per-phase times of one export run"""
+    print("stage          wall s    cpu s  peak RSS MB")
+    for stage, seconds in result["stages"].items():
+        print(f"{stage:<12} {seconds:8.3f} {result['stages_cpu'].get(stage, 0):8.3f} "
+              f"{result['stages_peak_rss_mb'].get(stage, 0):12.1f}")
+    print("phase           count  total s   mean ms")
+    for phase, values in sorted(result["phases"].items()):
+        print(f"{phase:<12} {values['count']:8d} {values['seconds']:8.3f} {values['mean_seconds'] * 1000:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_site_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3, help="export runs, the fastest one is broken down")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="environment variable for the exporter, e.g. PARSE_WORKERS=4 (repeatable)")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter running the exporter")
+    parser.add_argument("--json", metavar="FILE", help="also write every run's measurements to FILE")
+    args = parser.parse_args()
+
+    env_overrides = dict(setting.split("=", 1) for setting in args.env)
+    site = make_site(args)
+    server = start_server(site)
+    print(f"Synthetic site on http://{site.host}/: {args.pages} pages, {args.links} links and "
+          f"{args.images} srcset images per page, {args.sitemaps} sitemaps")
+
+    results = []
+    try:
+        for _ in range(args.repeat):
+            result = run_export(site.host, env_overrides, args.python)
+            print_run(result)
+            results.append(result)
+    finally:
+        server.shutdown()
+
+    best = min(results, key=lambda result: result["seconds"])
+    print(f"median {statistics.median(result['seconds'] for result in results):.2f} s, "
+          f"best {best['seconds']:.2f} s ({best['pages_per_second']:.1f} pages/s)")
+    print_breakdown(best)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"site": {name: value for name, value in vars(args).items()
+                                if name not in ("repeat", "env", "python", "json")},
+                       "env": env_overrides, "runs": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
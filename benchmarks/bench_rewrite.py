@@ -0,0 +1,67 @@
+"""Benchmark the page rewrite engines of export_website.py on synthetic WordPress pages.
+
+Runs render_page_bs4() and render_page_lxml() over the same pages, generated by the
+SyntheticSite of synthetic_site.py that bench_export.py serves, and reports pages/sec and
+MB/sec for each. No network access is needed.
+
+Usage:
+    python benchmarks/bench_rewrite.py --pages 200 --links 150 --images 20
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+DOMAIN = "bench.example.com"
+
+# export_website reads its configuration from the environment when it is imported
+os.environ.setdefault("TARGET_DOMAIN", DOMAIN)
+os.environ.setdefault("URL_TO_REPLACE", "https://static.example.org/")
+os.environ.setdefault("EXPORT_FOLDER", tempfile.mkdtemp(prefix="bench_rewrite_"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import export_website  # noqa: E402
+from synthetic_site import SyntheticSite  # noqa: E402
+
+
+def run_engine(render, site, pages, repeat):
+    """Render every page of site repeat times and return the best elapsed time in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i, html in enumerate(pages):
+            render(html, f"http://{DOMAIN}{site.page_path(i)}")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100, help="number of synthetic pages")
+    parser.add_argument("--links", type=int, default=150, help="navigation links per page")
+    parser.add_argument("--images", type=int, default=20, help="srcset images per page")
+    parser.add_argument("--paragraphs", type=int, default=30, help="paragraphs per page")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per engine, the best one is reported")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    site = SyntheticSite(pages=args.pages, links=args.links, images=args.images, paragraphs=args.paragraphs)
+    site.host = DOMAIN
+    pages = [site.render_page(i) for i in range(args.pages)]
+    total_mb = sum(len(html.encode("utf-8")) for html in pages) / 1e6
+    print(f"{args.pages} pages, {total_mb:.1f} MB of HTML")
+
+    results = {}
+    for name, render in (("bs4", export_website.render_page_bs4), ("lxml", export_website.render_page_lxml)):
+        elapsed = run_engine(render, site, pages, args.repeat)
+        results[name] = elapsed
+        print(f"{name:>5}: {elapsed:7.3f} s  {args.pages / elapsed:8.1f} pages/s  {total_mb / elapsed:6.2f} MB/s")
+
+    print(f"lxml speedup: {results['bs4'] / results['lxml']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
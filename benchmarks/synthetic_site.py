@@ -0,0 +1,275 @@
+"""Serve a synthetic WordPress site over HTTP for benchmarking export_website.py without a network.
+
+The site has a sitemap index with a configurable number of child sitemaps, posts with
+navigation links, srcset-heavy images, shared theme/plugin CSS and JS, and optionally
+slow or failing responses. Everything is generated from the request path and --seed, so
+every run serves exactly the same site.
+
+Usage:
+    python benchmarks/synthetic_site.py --port 8000 --pages 1000 --sitemaps 10
+    TARGET_DOMAIN=127.0.0.1:8000 SITEMAP_URL=http://127.0.0.1:8000/sitemap_index.xml python export_website.py
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Body of every synthetic image, repeated up to the configured image size
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+
+class SyntheticSite:
+    """Deterministic WordPress-like site: pages, sitemaps and assets generated on request"""
+
+    def __init__(self, pages=200, links=50, images=10, sitemaps=4, plugins=8, image_size=20000,
+                 slow_rate=0.0, slow_delay=0.5, fail_rate=0.0, fail_count=0, max_rps=0, seed=0, paragraphs=20):
+        self.pages = pages
+        self.links = links
+        self.images = images
+        self.paragraphs = paragraphs
+        self.sitemaps = max(1, sitemaps)
+        self.plugins = plugins
+        self.image_size = image_size
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.fail_rate = fail_rate
+        self.fail_count = fail_count
+        self.failures = {}
+        self.max_rps = max_rps
+        self.seed = seed
+        self.host = None
+        self.second = 0
+        self.second_requests = 0
+        self.lock = threading.Lock()
+
+    def is_rate_limited(self):
+        """Count a request and return True if it exceeds max_rps requests in the current second"""
+        if not self.max_rps:
+            return False
+        with self.lock:
+            second = int(time.monotonic())
+            if second != self.second:
+                self.second, self.second_requests = second, 0
+            self.second_requests += 1
+            return self.second_requests > self.max_rps
+
+    def keeps_failing(self, path):
+        """Count a failed request to a failing path and return False once fail_count of them failed"""
+        if not self.fail_count:
+            return True
+        with self.lock:
+            if self.failures.get(path, 0) == self.fail_count:
+                return False
+            self.failures[path] = self.failures.get(path, 0) + 1
+            return True
+
+    def random(self, path):
+        """Return a random generator seeded by the path, so responses are the same on every run"""
+        return random.Random(f"{self.seed}:{path}")
+
+    def page_path(self, index):
+        """Return the permalink path of page index; page 0 is the home page"""
+        return "/" if index == 0 else f"/post-{index}/"
+
+    def page_lastmod(self, index):
+        """Return the time page index was last modified, as in its sitemap entry"""
+        return f"2024-01-{1 + index % 28:02d}T00:00:00+00:00"
+
+    def render_page(self, index):
+        """Return the HTML of a synthetic post"""
+        host = self.host
+        rng = self.random(index)
+        head = "".join(
+            f'<link rel="stylesheet" href="http://{host}/wp-content/plugins/plugin-{i}/style.css?ver=6.4">\n'
+            f'<script src="/wp-includes/js/script-{i}.js?ver=6.4"></script>\n'
+            for i in range(self.plugins)
+        )
+        nav = "".join(
+            f'<li><a href="http://{host}{self.page_path(rng.randrange(self.pages))}">Post {i}</a></li>\n'
+            for i in range(self.links)
+        )
+        body = "".join(
+            f"<p>Paragraph {i} of post {index} with an <a href=\"{self.page_path((index + i + 1) % self.pages)}\">"
+            f"inline link</a> and some text about http://{host}/ that goes on for a while.</p>\n"
+            for i in range(self.paragraphs)
+        )
+        imgs = "".join(
+            f'<img src="/wp-content/uploads/2024/01/image-{index}-{i}.jpg" '
+            f'srcset="/wp-content/uploads/2024/01/image-{index}-{i}-300x200.jpg 300w, '
+            f'/wp-content/uploads/2024/01/image-{index}-{i}-768x512.jpg 768w, '
+            f'/wp-content/uploads/2024/01/image-{index}-{i}.jpg 1200w" sizes="(max-width: 1200px) 100vw, 1200px">\n'
+            for i in range(self.images)
+        )
+        return f"""<!DOCTYPE html>
+<html lang="en-US"><head><meta charset="UTF-8">
+<title>Post {index} - Synthetic Site</title>
+<meta name="description" content="Description of post {index}">
+<meta name="author" content="Author {index % 5}">
+<meta property="article:published_time" content="{self.page_lastmod(index)}">
+<meta property="og:image" content="http://{host}/wp-content/uploads/2024/01/image-{index}-0.jpg">
+{head}
+<style>body {{ background: url(http://{host}/wp-content/themes/theme/bg.png); }}</style>
+<script>var settings = {{"ajaxurl": "http://{host}/wp-admin/admin-ajax.php"}};</script>
+</head><body class="post-template-default">
+<nav><ul>{nav}</ul></nav>
+<article class="post"><div class="entry-content">
+{body}{imgs}
+<a rel="category tag" href="/category/category-{index % 7}/">Category {index % 7}</a>
+<a rel="tag" href="/tag/tag-{index % 11}/">Tag {index % 11}</a>
+</div></article>
+<!-- Cached by http://{host}/ -->
+</body></html>
+"""
+
+    def render_sitemap_index(self):
+        """Return the sitemap index listing every child sitemap"""
+        sitemaps = "".join(
+            f"<sitemap><loc>http://{self.host}/post-sitemap{i + 1}.xml</loc></sitemap>"
+            for i in range(self.sitemaps)
+        )
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>')
+
+    def render_sitemap(self, number):
+        """Return child sitemap number, which lists every sitemaps-th page that exists"""
+        urls = "".join(
+            f"<url><loc>http://{self.host}{self.page_path(index)}</loc>"
+            f"<lastmod>{self.page_lastmod(index)}</lastmod></url>"
+            for index in range(number - 1, self.pages, self.sitemaps)
+            if self.get_page_index(self.page_path(index)) is not None
+        )
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>')
+
+    def get_page_index(self, path):
+        """Return the page index of a permalink path, or None if it is not a page"""
+        if path == "/":
+            return 0
+        if path.startswith("/post-") and path.endswith("/"):
+            try:
+                index = int(path[len("/post-"):-1])
+            except ValueError:
+                return None
+            return index if 0 < index < self.pages else None
+        return None
+
+    def respond(self, path):
+        """Return (status, content type, body) for a request path, after any injected delay"""
+        path = path.split("?")[0].split("#")[0]
+        rng = self.random(path)
+        if rng.random() < self.slow_rate:
+            time.sleep(self.slow_delay)
+        if path == "/sitemap_index.xml":
+            return 200, "application/xml", self.render_sitemap_index()
+        if path.startswith("/post-sitemap") and path.endswith(".xml"):
+            number = path[len("/post-sitemap"):-len(".xml")]
+            if number.isdigit() and 1 <= int(number) <= self.sitemaps:
+                return 200, "application/xml", self.render_sitemap(int(number))
+        if rng.random() < self.fail_rate and self.keeps_failing(path):
+            return 500, "text/html", "<h1>Internal Server Error</h1>"
+        index = self.get_page_index(path)
+        if index is not None:
+            return 200, "text/html; charset=UTF-8", self.render_page(index)
+        if path.startswith(("/category/", "/tag/")):
+            return 200, "text/html; charset=UTF-8", self.render_page(rng.randrange(self.pages))
+        if path.endswith(".css"):
+            return 200, "text/css", f"/* {path} */\n" + "body { color: #333; margin: 0 auto; }\n" * 200
+        if path.endswith(".js"):
+            return 200, "application/javascript", f"/* {path} */\n" + "console.log('synthetic');\n" * 200
+        if path.endswith((".jpg", ".png")):
+            return 200, "image/jpeg", JPEG_HEADER + path.encode() * (self.image_size // len(path) + 1)
+        return 404, "text/html", "<h1>Not Found</h1>"
+
+
+def make_handler(site):
+    """Return a request handler class serving site"""
+
+    class SyntheticSiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if site.is_rate_limited():
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, content_type, body = site.respond(self.path)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return SyntheticSiteHandler
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """HTTP server that does not print tracebacks when a client drops its connection"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(site, port=0):
+    """Serve site on 127.0.0.1:port (a free port when 0) from a background thread and return the server"""
+    server = QuietHTTPServer(("127.0.0.1", port), make_handler(site))
+    site.host = f"127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_site_arguments(parser):
+    """Add the options describing the synthetic site to an argument parser"""
+    parser.add_argument("--pages", type=int, default=200, help="number of pages")
+    parser.add_argument("--links", type=int, default=50, help="navigation links per page")
+    parser.add_argument("--images", type=int, default=10, help="srcset images per page")
+    parser.add_argument("--sitemaps", type=int, default=4, help="child sitemaps in the sitemap index")
+    parser.add_argument("--plugins", type=int, default=8, help="plugin CSS/JS files referenced by every page")
+    parser.add_argument("--image-size", type=int, default=20000, help="size of every image in bytes")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of responses that are delayed")
+    parser.add_argument("--slow-delay", type=float, default=0.5, help="delay of slow responses in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of pages and assets answered with 500")
+    parser.add_argument("--fail-count", type=int, default=0,
+                        help="requests to a failing path answered with 500 before it recovers (0: it never does)")
+    parser.add_argument("--max-rps", type=int, default=0,
+                        help="answer requests beyond this many per second with 429 and Retry-After (0: no limit)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the link structure and injected faults")
+
+
+def make_site(args):
+    """Return the SyntheticSite described by parsed add_site_arguments() options"""
+    return SyntheticSite(pages=args.pages, links=args.links, images=args.images, sitemaps=args.sitemaps,
+                         plugins=args.plugins, image_size=args.image_size, slow_rate=args.slow_rate,
+                         slow_delay=args.slow_delay, fail_rate=args.fail_rate, fail_count=args.fail_count,
+                         max_rps=args.max_rps, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = make_site(args)
+    server = start_server(site, args.port)
+    print(f"Serving a synthetic site with {args.pages} pages on http://{site.host}/ (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,95 @@
 import os
+import io
+import sys
+import gzip
+import zlib
+import argparse
+import atexit
+import bisect
+import cProfile
+import pstats
+import queue
+import random
+import hashlib
+import heapq
+import multiprocessing
+import shutil
+import unicodedata
+import sqlite3
+import tarfile
+import threading
+from collections import Counter
+from itertools import chain, groupby, islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, Comment, NavigableString
+import lxml.html
+from urllib3 import HTTPResponse
+from urllib.parse import urljoin, urlparse, urlunparse, unquote
+from html import unescape
 import time
 import logging
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timezone
+from http.client import responses as http_reasons
+from email.utils import parsedate_to_datetime
 import json
 import re
 import xml.etree.ElementTree as ET
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('wordpress_export.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging. Threads only put records on a queue; a listener thread formats them
+# and writes them to the log file and the console, so logging never blocks a worker on I/O.
+log_handlers = [
+    logging.FileHandler('wordpress_export.log'),
+    logging.StreamHandler()
+]
+for log_handler in log_handlers:
+    log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers)
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # Domain configuration from .env file
 TARGET_DOMAIN = os.getenv("TARGET_DOMAIN")
@@ -40,29 +108,220 @@ RELATIVE_URL = os.getenv("RELATIVE_URL")
 # For production: url_to_replace = RELATIVE_URL
 url_to_replace = os.getenv("URL_TO_REPLACE")  # Change this to local_host for local testing
 
-# Create export folder with timestamp
+# Crawl mode: "single-pass" fetches and parses every page once, discovering links and
+# exporting it in the same step; "two-pass" collects all links first, then re-fetches
+# every page to export it
+CRAWL_MODE = os.getenv("CRAWL_MODE", "single-pass")
+
+# HTML engine used to parse and rewrite pages: "bs4" (BeautifulSoup with html.parser,
+# pretty-printed output) or "lxml" (single pass over an lxml tree, written out directly)
+HTML_ENGINE = os.getenv("HTML_ENGINE", "bs4")
+
+# Layout of the exported HTML: "pretty" (indented by BeautifulSoup's prettify(); the lxml
+# engine keeps the page's own layout), "compact" (whitespace collapsed outside <pre>,
+# <textarea>, <script> and <style>) or "minify" (compact, without comments, and with inline
+# CSS/JS minified when rcssmin/rjsmin are installed)
+HTML_OUTPUT = os.getenv("HTML_OUTPUT", "pretty")
+HTML_OUTPUT_MODES = ("pretty", "compact", "minify")
+
+# Number of pages fetched and exported concurrently
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
+
+# Number of worker processes that parse, extract and rewrite pages. 0 renders pages on
+# the fetching threads, which keeps all parsing on one core because of the GIL.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+
+# Number of assets (CSS, JS, images) downloaded concurrently in the background
+ASSET_WORKERS = int(os.getenv("ASSET_WORKERS", "8"))
+
+# Number of child sitemaps of a sitemap index fetched and parsed concurrently
+SITEMAP_WORKERS = int(os.getenv("SITEMAP_WORKERS", "8"))
+
+# Precompression stage: gzip (and brotli, if the brotli package is installed) variants of
+# text files of at least PRECOMPRESS_MIN_SIZE bytes, served by nginx gzip_static/brotli_static
+PRECOMPRESS = os.getenv("PRECOMPRESS", "true").lower() == "true"
+PRECOMPRESS_MIN_SIZE = int(os.getenv("PRECOMPRESS_MIN_SIZE", "1024"))
+PRECOMPRESS_WORKERS = int(os.getenv("PRECOMPRESS_WORKERS", "0")) or os.cpu_count() or 1
+PRECOMPRESS_EXTENSIONS = (".html", ".htm", ".css", ".js", ".mjs", ".xml", ".svg", ".json")
+PRECOMPRESS_MANIFEST_FILE = "precompress_manifest.json"
+# Reports that are rewritten after the precompression stage, so variants of them would be stale
+PRECOMPRESS_EXCLUDED_FILES = (PRECOMPRESS_MANIFEST_FILE, "export_statistics.json", "export_metrics.json")
+
+# Image stage (needs Pillow): WebP/AVIF variants of downloaded JPEG and PNG images, written
+# next to them (image.jpg.webp) and offered to browsers through <picture> elements.
+# IMAGE_FORMATS lists the formats to write, e.g. "avif webp"; the stage is off when empty.
+IMAGE_FORMATS = os.getenv("IMAGE_FORMATS", "").lower().split()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0")) or os.cpu_count() or 1
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Formats offered in <picture> elements, smallest first
+IMAGE_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+# Client-side search index (see build_search_index()) written to the SEARCH_FOLDER folder of
+# the export: an inverted index split into one file per SEARCH_PREFIX_LENGTH-character term
+# prefix, built in blocks of at most SEARCH_BLOCK_POSTINGS postings to bound memory use
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "true").lower() == "true"
+SEARCH_PREFIX_LENGTH = int(os.getenv("SEARCH_PREFIX_LENGTH", "2"))
+SEARCH_BLOCK_POSTINGS = int(os.getenv("SEARCH_BLOCK_POSTINGS", "1000000"))
+SEARCH_FOLDER = "search"
+SEARCH_DOCS_PER_FILE = 500
+SEARCH_EXCERPT_LENGTH = 200
+# Weight of a term occurrence in each field of a page
+SEARCH_FIELD_WEIGHTS = (("title", 5), ("categories", 3), ("tags", 3), ("excerpt", 2), ("content", 1))
+# Client for the index, copied next to it
+SEARCH_CLIENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "search.js")
+SEARCH_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+SEARCH_COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+SEARCH_STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how i if in into is it its itself just me more most my
+myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with you your
+yours yourself yourselves
+""".split())
+# Suffix-stripping stemmer rules (suffix, replacement), the first match wins. The same rules
+# and stopwords are written to search/meta.json, so the client stems queries identically.
+SEARCH_STEM_RULES = (
+    ("ational", "ate"), ("ization", "ize"), ("iveness", "ive"), ("fulness", "ful"), ("ousness", "ous"),
+    ("sses", "ss"), ("ies", "y"), ("ments", ""), ("ment", ""), ("ness", ""), ("ings", ""), ("ing", ""),
+    ("edly", ""), ("ed", ""), ("ly", ""), ("ss", "ss"), ("us", "us"), ("is", "is"), ("s", "")
+)
+SEARCH_MIN_STEM_LENGTH = 3
+
+# Content-addressed asset store shared by every export (see AssetStore), kept outside the
+# export folders. Assets are materialised from it by hardlink, reflink or copy, and assets
+# downloaded by an earlier export are revalidated with a conditional GET instead of being
+# downloaded again. The store is off when ASSET_STORE_DIR is empty.
+ASSET_STORE_DIR = os.getenv("ASSET_STORE_DIR", "")
+# Blobs used within this many seconds are never garbage collected (see AssetStore.gc())
+ASSET_STORE_GC_MIN_AGE = float(os.getenv("ASSET_STORE_GC_MIN_AGE", "3600"))
+# Encoded image variants shared by every export, keyed by the SHA-1 of the image, the format
+# and IMAGE_QUALITY (see optimize_image()). Kept in the asset store when there is one.
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "") or (
+    os.path.join(ASSET_STORE_DIR, "images") if ASSET_STORE_DIR else "image_cache")
+# Linux ioctl that clones a file's extents (copy-on-write reflink on Btrfs and XFS)
+FICLONE = 0x40049409
+
+# Record/replay cache of HTTP responses under all fetches (see HTTPCache), kept outside the
+# export folders: "record" stores every response, "replay" answers every request from the
+# cache without any network access, so a re-run only costs CPU time. Off when HTTP_CACHE_MODE is "off".
+HTTP_CACHE_MODES = ("off", "record", "replay")
+HTTP_CACHE_MODE = os.getenv("HTTP_CACHE_MODE", "off").lower()
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "http_cache")
+# Response headers that describe the encoding on the wire, not the decoded body the cache keeps
+HTTP_CACHE_DROPPED_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+# Deterministic tar archive of the finished export (see write_export_archive()); .tar.gz
+# and .tar.zst (needs the optional zstandard package) are compressed, "-" is standard output.
+# Members are sorted, with their mtime set to SOURCE_DATE_EPOCH (default 0) and no owner.
+ARCHIVE_OUTPUT = os.getenv("ARCHIVE_OUTPUT", "")
+ARCHIVE_MTIME = int(os.getenv("SOURCE_DATE_EPOCH", "0"))
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+
+# Maximum number of open keep-alive connections to a single host, by default one for every
+# page and asset worker, so pages and assets on the same host do not wait for each other
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("MAX_CONNECTIONS_PER_HOST", "0")) or MAX_WORKERS + ASSET_WORKERS
+
+# Shared HTTP session so every request reuses pooled keep-alive connections.
+# pool_block makes worker threads wait for a free connection instead of opening
+# more than MAX_CONNECTIONS_PER_HOST connections to the same host.
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=16, pool_maxsize=MAX_CONNECTIONS_PER_HOST, pool_block=True)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+# Politeness controller of every host, shared by its page, sitemap and asset fetches (see
+# RateController and get_rate_controller()). Requests in flight start at
+# MAX_CONNECTIONS_PER_HOST and the request rate is unlimited unless MAX_REQUESTS_PER_SECOND
+# is set; both are halved when the host fails (RETRY_STATUS_CODES, timeouts) or responds slower
+# than LATENCY_TARGET seconds, and grow back additively.
+MAX_REQUESTS_PER_SECOND = float(os.getenv("MAX_REQUESTS_PER_SECOND", "0"))
+LATENCY_TARGET = float(os.getenv("LATENCY_TARGET", "2"))
+# Failed GETs (connection errors, timeouts and the RETRY_STATUS_CODES) are retried up to
+# MAX_RETRIES times, after the server's Retry-After or a jittered exponential backoff of
+# RETRY_BACKOFF * 2^attempt seconds (at most RETRY_BACKOFF_MAX)
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "30"))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Longest Retry-After delay honoured, in seconds
+RETRY_AFTER_MAX = 300
+
+# Incremental mode re-exports into a persistent folder, re-rendering only pages that
+# changed since the previous run (see export_manifest.json)
+INCREMENTAL = os.getenv("INCREMENTAL", "false").lower() == "true"
+
+# Export folder with timestamp, or the persistent EXPORT_FOLDER (created when the export starts)
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-export_folder = f"exported_site_{timestamp}"
-os.makedirs(export_folder, exist_ok=True)
+export_folder = os.getenv("EXPORT_FOLDER") or ("exported_site" if INCREMENTAL else f"exported_site_{timestamp}")
+
+# Sharded export (see --shard): the URL space is split by a stable hash of canonical URLs
+# over the shard count, each worker exports its shard into EXPORT_FOLDER/shards/<index>
+# and forwards links of other shards through the SQLite queue SHARD_QUEUE (default
+# EXPORT_FOLDER/shard_queue.sqlite) on storage shared by all workers. SHARD is "index/count".
+# SQLite relies on POSIX file locks, which NFS and SMB/CIFS mounts do not reliably provide,
+# so the queue must not be on one of NETWORK_FILESYSTEMS.
+SHARD = os.getenv("SHARD", "")
+SHARD_QUEUE = os.getenv("SHARD_QUEUE", "")
+SHARD_POLL_INTERVAL = float(os.getenv("SHARD_POLL_INTERVAL", "1"))
+SHARDS_FOLDER = "shards"
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "smbfs")
+shard_index = None
+shard_count = None
+shard_queue = None
 
-# Create WordPress export structure
+# Number of frontier changes, and seconds, between two checkpoints of the crawl state
+CHECKPOINT_BATCH_SIZE = int(os.getenv("CHECKPOINT_BATCH_SIZE", "500"))
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "10"))
+
+# Canonical form of crawled URLs (see canonicalize_url()): scheme, host, and the query
+# parameters that are dropped. Names ending in * are prefixes.
+CANONICAL_SCHEME = os.getenv("CANONICAL_SCHEME") or urlparse(sitemap_url).scheme or "https"
+TARGET_HOST = (TARGET_DOMAIN or "").lower()
+STRIP_QUERY_PARAMS = os.getenv(
+    "STRIP_QUERY_PARAMS", "utm_* fbclid gclid dclid msclkid mc_cid mc_eid _ga _gl replytocom share").split()
+
+# Crawl rules, as whitespace-separated regular expressions searched in canonical URLs.
+# With URL_INCLUDE set only matching URLs are crawled; URL_EXCLUDE defaults to WordPress
+# endpoints that are not pages. URL_CAPS entries are pattern=N, admitting at most N
+# matching URLs (e.g. "/page/[0-9]+/$=50" for paginated archives).
+URL_INCLUDE = [re.compile(pattern) for pattern in os.getenv("URL_INCLUDE", "").split()]
+URL_EXCLUDE = [re.compile(pattern) for pattern in os.getenv(
+    "URL_EXCLUDE",
+    r"/wp-admin/ /wp-login\.php /xmlrpc\.php /wp-json/ /feed/$ /embed/$ /trackback/$ /comment-page-[0-9]+/$ [?&]s="
+).split()]
+URL_CAPS = [(re.compile(pattern), int(cap))
+            for pattern, cap in (rule.rsplit("=", 1) for rule in os.getenv("URL_CAPS", "").split())]
+url_cap_counts = [0] * len(URL_CAPS)
+
+# Create WordPress export structure. Page, post and media records are not kept in memory:
+# they are streamed to wordpress_export.ndjson as they are produced (see add_content_item())
+# and wordpress_export.json is assembled from that file at the end of the run.
 wordpress_data = {
     "site_info": {
         "name": "",
         "description": "",
         "url": "",
-        "export_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # SOURCE_DATE_EPOCH pins the date too, so a reproducible export does not change with it
+        "export_date": (datetime.fromtimestamp(ARCHIVE_MTIME, timezone.utc) if os.getenv("SOURCE_DATE_EPOCH")
+                        else datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
     },
     "content": {
-        "pages": [],
-        "posts": [],
-        "categories": [],
-        "tags": [],
-        "media": [],
-        "menus": []
+        "categories": set(),
+        "tags": set()
     }
 }
 
+# Streaming export files: one JSON record per line, and an index of
+# [content_type, key, byte offset, byte length] lines for random access to the records
+EXPORT_STREAM_FILE = "wordpress_export.ndjson"
+EXPORT_INDEX_FILE = "wordpress_export.index.ndjson"
+export_stream = None
+export_index_stream = None
+export_stream_lock = threading.Lock()
+
 # Statistics
 stats = {
     "pages_processed": 0,
@@ -70,9 +329,581 @@ stats = {
     "errors": 0,
     "posts_found": 0,
     "categories_found": 0,
-    "tags_found": 0
+    "tags_found": 0,
+    "assets_failed": 0,
+    "pages_unchanged": 0,
+    "assets_unchanged": 0,
+    "fetches_avoided": 0,
+    "files_precompressed": 0,
+    "precompressed_unchanged": 0,
+    "html_bytes_fetched": 0,
+    "html_bytes_written": 0,
+    "html_bytes_saved": 0,
+    "images_optimized": 0,
+    "images_unchanged": 0,
+    "image_bytes_saved": 0,
+    "assets_from_store": 0,
+    "requests_sent": 0,
+    "requests_retried": 0,
+    "requests_throttled": 0,
+    "effective_request_rate": 0,
+    "orphan_pages": 0,
+    "broken_links": 0,
+    "peak_rss_mb": 0,
+    "peak_rss_workers_mb": 0,
+    "requests_replayed": 0
 }
 
+# The sitemap entries (loc, lastmod, changefreq, priority) read from the sitemap are stored in the crawl
+# frontier, keyed by canonical URL
+SITEMAP_NAMESPACE = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+# The manifest of exported pages and assets, with their HTTP validators and content hashes,
+# is stored in the crawl frontier together with the manifest and the streaming export index
+# of the last run in the same folder (see CrawlFrontier)
+
+# Locks guarding the shared accumulators, which are updated from worker threads
+stats_lock = threading.Lock()
+wordpress_data_lock = threading.Lock()
+
+# Background asset downloads: in-flight downloads keyed by save path, an in-memory index of
+# completed paths and a negative cache of URLs that failed during this run
+# (start_thread_profiler() is defined below, hence the lambda)
+asset_executor = ThreadPoolExecutor(max_workers=ASSET_WORKERS, thread_name_prefix="asset",
+                                    initializer=lambda: start_thread_profiler())
+asset_lock = threading.Lock()
+in_flight_assets = {}
+completed_asset_paths = set()
+failed_asset_urls = set()
+
+# Timings of the export phases (see record_timing()): for each phase the number of timed
+# operations, their total seconds and bytes, and a latency histogram with these bucket
+# bounds in seconds. stage_durations and stage_cpu_times hold the wall-clock and CPU time
+# (of this process, not of worker processes) of each stage of the run, stage_peak_rss the
+# peak resident set size of this process in MB at the end of each stage.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+phase_metrics = {}
+stage_durations = {}
+stage_cpu_times = {}
+stage_peak_rss = {}
+stage_started = time.perf_counter()
+stage_cpu_started = time.process_time()
+metrics_lock = threading.Lock()
+
+# Profilers of the threads that ran while --profile was given, see start_thread_profiler()
+thread_profilers = None
+thread_profilers_lock = threading.Lock()
+
+# Shared asset store, opened by open_asset_store() when ASSET_STORE_DIR is set
+asset_store = None
+
+# HTTP response cache, opened when HTTP_CACHE_MODE is record or replay
+http_cache = None
+
+# Process pool running the CPU-bound parse/extract/rewrite stage, see start_render_pool()
+render_pool = None
+# Worker processes are spawned, not forked: forking copies locks held by the crawl, asset
+# and log threads, which would then never be released in the child
+process_context = multiprocessing.get_context("spawn")
+
+# Image formats offered in <picture> elements, see get_image_formats()
+image_formats = None
+
+# Persistent crawl frontier (see CrawlFrontier) and whether it comes from the run being resumed
+FRONTIER_FILE = "crawl_frontier.sqlite"
+crawl_frontier = None
+resuming_crawl = False
+
+# Page-to-page link graph of the crawl (see LinkGraph), kept in the export folder, the graph
+# of the previous incremental run while it is read, and the orphan page and broken link
+# report written from it
+LINK_GRAPH_FILE = "link_graph.sqlite"
+PREVIOUS_LINK_GRAPH_FILE = "link_graph.previous.sqlite"
+LINK_REPORT_FILE = "link_report.json"
+link_graph = None
+
+def increment_stat(name, amount=1):
+    """Thread-safely add amount to a counter in stats"""
+    with stats_lock:
+        stats[name] += amount
+
+def record_timing(phase, seconds, size=0):
+    """Thread-safely add one timed operation of seconds (and size bytes) to a phase"""
+    with metrics_lock:
+        metrics = phase_metrics.get(phase)
+        if metrics is None:
+            metrics = phase_metrics[phase] = {"count": 0, "seconds": 0.0, "bytes": 0,
+                                              "buckets": [0] * (len(METRICS_BUCKETS) + 1)}
+        metrics["count"] += 1
+        metrics["seconds"] += seconds
+        metrics["bytes"] += size
+        metrics["buckets"][bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+
+def end_stage(name):
+    """Record the wall-clock and CPU time since the previous stage ended as the duration of a stage"""
+    global stage_started, stage_cpu_started
+    now, cpu_now = time.perf_counter(), time.process_time()
+    stage_durations[name] = stage_durations.get(name, 0) + now - stage_started
+    stage_cpu_times[name] = stage_cpu_times.get(name, 0) + cpu_now - stage_cpu_started
+    stage_peak_rss[name] = get_peak_rss_mb()
+    stage_started, stage_cpu_started = now, cpu_now
+
+def get_peak_rss_mb(who=None):
+    """Return the peak resident set size in MB of this process, or 0 where it cannot be measured
+
+    With who=resource.RUSAGE_CHILDREN, return that of the largest worker process that has exited.
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1e6 if sys.platform == "darwin" else 1e3), 1)
+
+def start_thread_profiler():
+    """Profile the calling thread when --profile was given (thread pool initializer)
+
+    cProfile only sees the thread it was enabled in, so every worker thread gets its own
+    profiler; save_profile() merges them.
+    """
+    if thread_profilers is None:
+        return
+    profiler = cProfile.Profile()
+    with thread_profilers_lock:
+        thread_profilers.append(profiler)
+    profiler.enable()
+
+def save_profile(path):
+    """Merge the profiles of all threads and write them to path (read with python -m pstats)"""
+    profiles = [profiler for profiler in thread_profilers if profiler.getstats()]
+    pstats.Stats(*profiles).dump_stats(path)
+    logging.info(f"Saved profile of {len(profiles)} threads to {path}")
+
+def configure_worker_logging():
+    """Log straight to the log handlers in worker processes (process pool initializer)
+
+    Worker processes import this module again, and exit without running atexit handlers,
+    so records left on the log queue of their own listener would be lost.
+    """
+    logging.getLogger().handlers = log_handlers
+
+def truncate_partial_line(path):
+    """Cut off a last line left half-written by an interrupted run"""
+    with open(path, "rb+") as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
+
+def restore_export_stream():
+    """Rebuild the in-memory state (terms, media keys) and the index of the streaming export of a resumed run
+
+    A record is flushed before its index line is written, so an interrupted run can leave
+    records without an index line (or a half-written last line in either file). The index
+    is written again from the records, so it lists exactly the records in the stream.
+    """
+    stream_path = os.path.join(export_folder, EXPORT_STREAM_FILE)
+    index_path = os.path.join(export_folder, EXPORT_INDEX_FILE)
+    truncate_partial_line(stream_path)
+    offset = 0
+    with open(stream_path, "rb") as f, open(f"{index_path}.part", "w", encoding="utf-8") as index:
+        for line in f:
+            record = json.loads(line)
+            key = get_record_key(record["type"], record["data"])
+            if record["type"] == "media":
+                crawl_frontier.add_media(key)
+            else:
+                add_terms(record["data"].get("categories", []), record["data"].get("tags", []))
+            index.write(json.dumps([record["type"], key, offset, len(line)]) + "\n")
+            offset += len(line)
+    os.replace(f"{index_path}.part", index_path)
+
+def open_export_stream(resume=False):
+    """Start new streaming export files in the export folder, or append to them when resuming"""
+    global export_stream, export_index_stream
+    stream_path = os.path.join(export_folder, EXPORT_STREAM_FILE)
+    index_path = os.path.join(export_folder, EXPORT_INDEX_FILE)
+    mode = "w"
+    if resume and os.path.exists(stream_path):
+        restore_export_stream()
+        mode = "a"
+    export_stream = open(stream_path, mode + "b")
+    export_index_stream = open(index_path, mode, encoding="utf-8")
+
+def close_export_stream():
+    """Flush and close the streaming export files"""
+    global export_stream, export_index_stream
+    with export_stream_lock:
+        if export_stream is not None:
+            export_stream.close()
+            export_index_stream.close()
+            export_stream = export_index_stream = None
+
+def get_record_key(content_type, item):
+    """Return the key of a streamed record in the export index: its local path for media, else its URL"""
+    return item["local_path"] if content_type == "media" else item["url"]
+
+def add_content_item(content_type, item):
+    """Thread-safely append a page, post or media record to the streaming export and its index"""
+    key = get_record_key(content_type, item)
+    line = (json.dumps({"type": content_type, "data": item}) + "\n").encode("utf-8")
+    with export_stream_lock:
+        if export_stream is None:
+            open_export_stream()
+        if content_type == "media" and not crawl_frontier.add_media(key):
+            return
+        offset = export_stream.tell()
+        # Flush every record so a crash never loses what was already exported
+        export_stream.write(line)
+        export_stream.flush()
+        export_index_stream.write(json.dumps([content_type, key, offset, len(line)]) + "\n")
+        export_index_stream.flush()
+
+def load_export_index(index_path):
+    """Load a streaming export index into a {key: (content_type, offset, length)} dict"""
+    index = {}
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            content_type, key, offset, length = json.loads(line)
+            index[key] = (content_type, offset, length)
+    return index
+
+def read_export_record(stream_path, offset, length):
+    """Read one record of a streaming export by its byte offset, returning (content_type, data)"""
+    with open(stream_path, "rb") as f:
+        f.seek(offset)
+        record = json.loads(f.read(length))
+    return record["type"], record["data"]
+
+def add_terms(categories, tags):
+    """Thread-safely record categories and tags and refresh their counts in stats"""
+    with wordpress_data_lock:
+        wordpress_data["content"]["categories"].update(categories)
+        wordpress_data["content"]["tags"].update(tags)
+        categories_found = len(wordpress_data["content"]["categories"])
+        tags_found = len(wordpress_data["content"]["tags"])
+    with stats_lock:
+        stats["categories_found"] = categories_found
+        stats["tags_found"] = tags_found
+
+class RateController:
+    """AIMD controller of the requests sent to one host
+
+    acquire() blocks until a request may be sent: fewer than limit requests in flight, the
+    next slot of the request rate reached and no Retry-After pause pending. release()
+    reports how the request went. Throttling responses, timeouts and slow responses halve
+    the concurrency limit and the rate (at most once per second, so a burst of failures
+    counts as one signal); every other response increases them additively, by about one
+    request in flight per window of limit responses and one request/s per second.
+    """
+
+    def __init__(self, max_concurrency, max_rate=0, latency_target=2):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.max_rate = max_rate or float("inf")
+        self.rate = self.max_rate
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.next_slot = 0
+        self.paused_until = 0
+        self.last_decrease = 0
+        self.first_request = None
+        self.last_request = None
+        self.requests = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free request slot and claim it"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+            self.requests += 1
+            delay = 0
+            if self.rate != float("inf"):
+                delay = max(0, self.next_slot - now)
+                self.next_slot = max(now, self.next_slot) + 1 / self.rate
+            # The request is sent once its slot is reached
+            if self.first_request is None:
+                self.first_request = now + delay
+            self.last_request = now + delay
+        if delay:
+            time.sleep(delay)
+
+    def release(self, latency=None, throttled=False):
+        """Free a request slot, adapting the limits to how the request went"""
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled or (latency is not None and latency > self.latency_target):
+                if now - self.last_decrease >= 1:
+                    self.last_decrease = now
+                    self.limit = max(1.0, self.limit / 2)
+                    if self.rate == float("inf"):
+                        # Start limiting at half the rate the origin could not sustain
+                        self.rate = self.get_effective_rate()
+                    self.rate = max(0.5, self.rate / 2)
+                    logging.warning(f"Origin is throttling, slowing down to {int(self.limit)} requests "
+                                    f"in flight and {self.rate:.1f} requests/s")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                if self.rate != float("inf"):
+                    self.rate = min(self.max_rate, self.rate + 1 / max(self.rate, 1))
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Send no request for the next seconds, as asked by a Retry-After header"""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def get_effective_rate(self):
+        """Return the average number of requests sent per second between the first and the last one"""
+        if self.first_request is None:
+            return 0
+        elapsed = self.last_request - self.first_request
+        return self.requests / elapsed if elapsed > 0 else float(self.requests)
+
+rate_controllers = {}
+rate_controllers_lock = threading.Lock()
+
+def get_rate_controller(url):
+    """Return the rate controller of the host of url, creating it for the first request to the host"""
+    host = urlparse(url).netloc
+    with rate_controllers_lock:
+        if host not in rate_controllers:
+            rate_controllers[host] = RateController(MAX_CONNECTIONS_PER_HOST, MAX_REQUESTS_PER_SECOND, LATENCY_TARGET)
+        return rate_controllers[host]
+
+def get_effective_request_rate():
+    """Return the average number of requests sent per second to all hosts, or None before the first"""
+    with rate_controllers_lock:
+        controllers = [controller for controller in rate_controllers.values() if controller.requests]
+    if not controllers:
+        return None
+    requests_sent = sum(controller.requests for controller in controllers)
+    elapsed = (max(controller.last_request for controller in controllers)
+               - min(controller.first_request for controller in controllers))
+    return requests_sent / elapsed if elapsed > 0 else float(requests_sent)
+
+def get_retry_after(response):
+    """Return the delay in seconds asked by a Retry-After header (seconds or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def get_backoff_delay(attempt):
+    """Return a jittered exponential backoff delay for a retry (full jitter)"""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+class HTTPCache:
+    """Cache of HTTP responses for recording a crawl once and replaying it offline
+
+    The status, final URL and headers of the last response to every request URL are kept
+    in index.sqlite, and bodies once under bodies/ by the SHA-1 of their content, like the
+    asset store. Bodies are stored decoded, so Content-Encoding is dropped. Replayed
+    responses are regular requests responses built from the recorded parts; a conditional
+    request whose validator matches the recorded one gets a 304 Not Modified.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "bodies"), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                final_url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                recorded TEXT NOT NULL
+            );
+        """)
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def body_path(self, content_hash):
+        """Return the path of the body with the given content hash"""
+        return os.path.join(self.path, "bodies", content_hash[:2], content_hash[2:])
+
+    def temp_body_path(self):
+        """Return a temporary path for a body being written by this thread"""
+        return os.path.join(self.path, "bodies", f"{os.getpid()}.{threading.get_ident()}.part")
+
+    def store_body(self, temp_path, content_hash):
+        """Move a body written to temp_path under its content hash, unless it is already stored"""
+        body_path = self.body_path(content_hash)
+        if os.path.exists(body_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            os.replace(temp_path, body_path)
+
+    def record(self, url, response, content_hash):
+        """Record the status, final URL and headers of a response whose body is stored"""
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in HTTP_CACHE_DROPPED_HEADERS}
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, status, final_url, headers, hash, recorded) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, response.status_code, response.url, json.dumps(headers), content_hash, datetime.now().isoformat()))
+            self.connection.commit()
+
+    def put(self, url, response):
+        """Record a response to a GET of url, reading its whole body"""
+        body = response.content
+        temp_path = self.temp_body_path()
+        with open(temp_path, "wb") as f:
+            f.write(body)
+        content_hash = hashlib.sha1(body).hexdigest()
+        self.store_body(temp_path, content_hash)
+        self.record(url, response, content_hash)
+
+    def tee(self, url, response):
+        """Record a streamed response to a GET of url as its caller reads it
+
+        The body is written to the cache chunk by chunk from response.iter_content (which
+        response.content also reads), so it is never held in memory; the response is recorded
+        once it has been read to the end, and not at all if the caller stops early.
+        """
+        iter_content = response.iter_content
+
+        def iter_recorded_content(chunk_size=1, decode_unicode=False):
+            temp_path = self.temp_body_path()
+            content_hash = hashlib.sha1()
+            try:
+                with open(temp_path, "wb") as f:
+                    for chunk in iter_content(chunk_size, decode_unicode):
+                        f.write(chunk)
+                        content_hash.update(chunk)
+                        yield chunk
+                self.store_body(temp_path, content_hash.hexdigest())
+                self.record(url, response, content_hash.hexdigest())
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        response.iter_content = iter_recorded_content
+
+    def get(self, url, headers=None):
+        """Return the recorded response to a GET of url, or None if it was not recorded"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status, final_url, headers, hash FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.body_path(row[3])):
+            return None
+        status, final_url, recorded_headers, content_hash = row[0], row[1], json.loads(row[2]), row[3]
+        request_headers = {name.lower(): value for name, value in (headers or {}).items()}
+        validators = {name.lower(): value for name, value in recorded_headers.items()}
+        if status == 200 and any(
+                request_headers.get(header) and request_headers.get(header) == validators.get(validator)
+                for header, validator in (("if-none-match", "etag"), ("if-modified-since", "last-modified"))):
+            status, body = 304, io.BytesIO()
+        else:
+            with open(self.body_path(content_hash), "rb") as f:
+                body = io.BytesIO(f.read())
+        raw = HTTPResponse(body=body, headers=recorded_headers, status=status, reason=http_reasons.get(status, ""),
+                           preload_content=False, decode_content=False)
+        response = adapter.build_response(requests.Request("GET", url).prepare(), raw)
+        response.url = final_url
+        return response
+
+    def close(self):
+        """Close the index"""
+        with self.lock:
+            self.connection.close()
+
+def open_http_cache():
+    """Open the HTTP cache in HTTP_CACHE_DIR"""
+    global http_cache
+    http_cache = HTTPCache(HTTP_CACHE_DIR)
+    logging.info(f"HTTP cache in {HTTP_CACHE_DIR}: {HTTP_CACHE_MODE} mode")
+    return http_cache
+
+def http_get(url, **kwargs):
+    """GET a URL through the shared pooled session, under the rate controller of its host
+
+    Connection errors, timeouts and RETRY_STATUS_CODES responses are retried up to
+    MAX_RETRIES times, waiting for the server's Retry-After (which also pauses every other
+    request to the host) or a jittered exponential backoff; the last response or error is
+    returned or raised. The time to the response headers is recorded as the "ttfb" phase (it includes
+    DNS lookup and connecting when no pooled connection was free), and the whole request as
+    the "fetch" phase unless the body is streamed, in which case the caller times it.
+
+    With HTTP_CACHE_MODE=record the final response is also stored in the HTTP cache (except
+    304 Not Modified, which has no body), a streamed 200 response as the caller reads its
+    body; with replay it comes from the cache alone, and a URL that was never recorded
+    fails like an unreachable server.
+    """
+    if HTTP_CACHE_MODE == "replay":
+        response = http_cache.get(url, kwargs.get("headers"))
+        if response is None:
+            raise requests.ConnectionError(f"{url} is not in the HTTP cache {HTTP_CACHE_DIR}")
+        increment_stat("requests_replayed")
+        return response
+    kwargs.setdefault("timeout", 30)
+    rate_controller = get_rate_controller(url)
+    started = time.perf_counter()
+    for attempt in range(MAX_RETRIES + 1):
+        rate_controller.acquire()
+        increment_stat("requests_sent")
+        try:
+            response = session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            rate_controller.release(throttled=True)
+            if attempt == MAX_RETRIES:
+                raise
+            delay = get_backoff_delay(attempt)
+            logging.warning(f"Retrying {url} in {delay:.1f}s after {type(e).__name__}")
+        else:
+            latency = response.elapsed.total_seconds()
+            # An overloaded origin answers 5xx as often as 429, so every retried status slows down
+            throttled = response.status_code in RETRY_STATUS_CODES
+            rate_controller.release(latency, throttled)
+            record_timing("ttfb", latency)
+            if throttled:
+                increment_stat("requests_throttled")
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                break
+            response.close()
+            retry_after = get_retry_after(response)
+            if retry_after is not None:
+                delay = min(retry_after, RETRY_AFTER_MAX)
+                rate_controller.pause(delay)
+            else:
+                delay = get_backoff_delay(attempt)
+            logging.warning(f"Retrying {url} in {delay:.1f}s after status {response.status_code}")
+        increment_stat("requests_retried")
+        time.sleep(delay)
+    if HTTP_CACHE_MODE == "record" and response.status_code != 304:
+        if kwargs.get("stream") and response.status_code == 200:
+            http_cache.tee(url, response)
+        else:
+            http_cache.put(url, response)
+    if not kwargs.get("stream"):
+        record_timing("fetch", time.perf_counter() - started, len(response.content))
+    return response
+
 def extract_wordpress_data(soup, url):
     """Extract WordPress-specific data from the page"""
     data = {
@@ -117,10 +948,8 @@ def extract_wordpress_data(soup, url):
     for term in soup.find_all("a", {"rel": "category tag"}):
         if "category" in term.get("rel", []):
             data["categories"].append(term.text.strip())
-            wordpress_data["content"]["categories"].add(term.text.strip())
         if "tag" in term.get("rel", []):
             data["tags"].append(term.text.strip())
-            wordpress_data["content"]["tags"].add(term.text.strip())
 
     # Extract featured image
     featured_img = soup.find("meta", {"property": "og:image"})
@@ -130,324 +959,2470 @@ def extract_wordpress_data(soup, url):
     # Extract main content
     content_div = soup.find("div", {"class": "entry-content"}) or soup.find("article")
     if content_div:
-        data["content"] = content_div.get_text(strip=True)
+        # Text of separate elements is joined with spaces, so words never run together
+        data["content"] = content_div.get_text(" ", strip=True)
         # Try to get excerpt
         excerpt = content_div.find("div", {"class": "entry-summary"})
         if excerpt:
-            data["excerpt"] = excerpt.get_text(strip=True)
+            data["excerpt"] = excerpt.get_text(" ", strip=True)
 
     return data
 
+def conditional_headers(previous):
+    """Return If-None-Match/If-Modified-Since headers for a resource exported by an earlier run"""
+    headers = {}
+    if previous:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+    return headers
+
+def set_manifest_entry(kind, key, entry):
+    """Record a page or asset in the manifest, checkpointed with the crawl frontier"""
+    crawl_frontier.save_manifest_entry(kind, key, entry)
+
+def read_previous_record(key):
+    """Read a record of the previous export in this folder, returning (content_type, data)"""
+    _, offset, length = crawl_frontier.get_previous_record(key)
+    return read_export_record(os.path.join(export_folder, f"{EXPORT_STREAM_FILE}.previous"), offset, length)
+
+def keep_previous_asset(asset_path):
+    """Carry an asset exported by an earlier run over into this run's manifest and export"""
+    previous = crawl_frontier.get_manifest_entry("assets", asset_path, previous=True)
+    if previous is None or crawl_frontier.get_manifest_entry("assets", asset_path) is not None:
+        return
+    set_manifest_entry("assets", asset_path, previous)
+
+    # Keep its media record from the previous export
+    local_path = os.path.join(export_folder, asset_path)
+    if crawl_frontier.get_previous_record(local_path):
+        add_content_item(*read_previous_record(local_path))
+
+class AssetStore:
+    """Content-addressed store of downloaded assets shared by all exports
+
+    Blobs are stored read-only under objects/ by the SHA-1 of their content, the same hash
+    the export manifest records, so an asset shared by several pages, paths or exports is
+    kept once. An SQLite index remembers the validators and hash of every asset URL so a
+    later export can revalidate it with a conditional GET, and a registry of the export
+    folders built from the store tells gc() which blobs are still referenced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(path, "tmp"), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, hash TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS exports (folder TEXT PRIMARY KEY, registered TEXT NOT NULL);
+        """)
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def blob_path(self, content_hash):
+        """Return the path of the blob with the given content hash"""
+        return os.path.join(self.path, "objects", content_hash[:2], content_hash[2:])
+
+    def temp_path(self):
+        """Return a fresh path in the store to download a new blob to"""
+        return os.path.join(self.path, "tmp", f"{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.part")
+
+    def lookup(self, url):
+        """Return the validators and hash stored for an asset URL, or None if its blob is missing"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[2])):
+            return None
+        return {"etag": row[0], "last_modified": row[1], "hash": row[2]}
+
+    def record(self, url, etag, last_modified, content_hash):
+        """Remember the validators and content hash of an asset URL"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO urls (url, etag, last_modified, hash) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash))
+            self.connection.commit()
+
+    def add_blob(self, temp_path, content_hash):
+        """Move a downloaded file into the store, dropping it if the blob is already there"""
+        blob_path = self.blob_path(content_hash)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+            return blob_path
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, blob_path)
+        return blob_path
+
+    def materialize(self, content_hash, save_path):
+        """Create save_path from a blob: hardlink, else reflink, else copy"""
+        blob_path = self.blob_path(content_hash)
+        materialize_file(blob_path, save_path)
+        # The modification time marks the blob as recently used for gc()
+        os.utime(blob_path)
+
+    def register_export(self, folder):
+        """Record an export folder whose assets come from the store"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO exports (folder, registered) VALUES (?, ?)",
+                (os.path.abspath(folder), datetime.now().isoformat()))
+            self.connection.commit()
+
+    def referenced_hashes(self):
+        """Return the blob hashes referenced by the manifests of registered exports that still exist
+
+        Folders that were deleted are dropped from the registry.
+        """
+        with self.lock:
+            folders = [row[0] for row in self.connection.execute("SELECT folder FROM exports")]
+        hashes = set()
+        for folder in folders:
+            if not os.path.isdir(folder):
+                with self.lock:
+                    self.connection.execute("DELETE FROM exports WHERE folder = ?", (folder,))
+                    self.connection.commit()
+                logging.info(f"Export folder no longer exists, unregistered: {folder}")
+                continue
+            manifest_path = os.path.join(folder, "export_manifest.json")
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                export_manifest = json.load(f)
+            hashes.update(entry["hash"] for entry in export_manifest.get("assets", {}).values() if entry.get("hash"))
+        return hashes
+
+    def gc(self):
+        """Delete blobs that no registered export references and return (blobs, bytes) removed
+
+        A blob is kept when a registered export's manifest lists its hash, when it is still
+        hardlinked from somewhere (e.g. an export whose manifest is not written yet) or when
+        it was used within ASSET_STORE_GC_MIN_AGE seconds. Cached image variants are kept
+        when they are hardlinked or were used within that time.
+        """
+        referenced = self.referenced_hashes()
+        cutoff = time.time() - ASSET_STORE_GC_MIN_AGE
+        removed, removed_bytes = 0, 0
+        objects_path = os.path.join(self.path, "objects")
+        for prefix in os.listdir(objects_path):
+            prefix_path = os.path.join(objects_path, prefix)
+            for name in os.listdir(prefix_path):
+                blob_path = os.path.join(prefix_path, name)
+                blob_stat = os.stat(blob_path)
+                if prefix + name in referenced or blob_stat.st_nlink > 1 or blob_stat.st_mtime > cutoff:
+                    continue
+                os.remove(blob_path)
+                removed += 1
+                removed_bytes += blob_stat.st_size
+            try:
+                os.rmdir(prefix_path)
+            except OSError:
+                pass
+        # Image variants cached in the store (see optimize_image()) are kept on the same terms
+        for folder, _, names in os.walk(os.path.join(self.path, "images")):
+            for name in names:
+                variant_path = os.path.join(folder, name)
+                variant_stat = os.stat(variant_path)
+                if variant_stat.st_nlink > 1 or variant_stat.st_mtime > cutoff:
+                    continue
+                os.remove(variant_path)
+                removed += 1
+                removed_bytes += variant_stat.st_size
+        # Forget URLs whose blob is gone, and downloads left behind by interrupted runs
+        with self.lock:
+            stored = self.connection.execute("SELECT url, hash FROM urls").fetchall()
+            self.connection.executemany(
+                "DELETE FROM urls WHERE url = ?",
+                [(url,) for url, content_hash in stored if not os.path.exists(self.blob_path(content_hash))])
+            self.connection.commit()
+        tmp_path = os.path.join(self.path, "tmp")
+        for name in os.listdir(tmp_path):
+            if os.stat(os.path.join(tmp_path, name)).st_mtime <= cutoff:
+                os.remove(os.path.join(tmp_path, name))
+        return removed, removed_bytes
+
+    def close(self):
+        """Close the index"""
+        with self.lock:
+            self.connection.close()
+
+def reflink_file(source_path, target_path):
+    """Clone source_path to target_path with the FICLONE ioctl and return True if it worked"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, "rb") as source, open(target_path, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        return False
+
+def materialize_file(source_path, save_path):
+    """Create save_path from a file of a shared store: hardlink, else reflink, else copy"""
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    temp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        # Hardlinks need the export folder on the same filesystem as the store
+        if not reflink_file(source_path, temp_path):
+            shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, save_path)
+
+def open_asset_store():
+    """Open the asset store and register the export folder in it"""
+    global asset_store
+    asset_store = AssetStore(ASSET_STORE_DIR)
+    asset_store.register_export(export_folder)
+    return asset_store
+
+def record_media_file(file_url, save_path):
+    """Add a downloaded media file to the WordPress export"""
+    add_content_item("media", {
+        "url": file_url,
+        "local_path": save_path,
+        "type": os.path.splitext(save_path)[1][1:].lower()
+    })
+
 def download_file(file_url, save_path, file_type="asset"):
     try:
         # Skip external CDNs and non-target domain URLs
-        parsed_url = urlparse(file_url)
-        if TARGET_DOMAIN not in parsed_url.netloc:
+        if not is_target_host(urlparse(file_url).netloc, include_subdomains=True):
             logging.info(f"Skipping external URL: {file_url}")
             return False
             
-        # Check if file already exists
-        if os.path.exists(save_path):
-            logging.info(f"File already exists, skipping download: {file_url}")
-            return True
+        asset_path = os.path.relpath(save_path, export_folder)
+        previous = crawl_frontier.get_manifest_entry("assets", asset_path, previous=True)
+        headers = {}
+        stored = None
+        
+        # Check if file already exists. In incremental mode it is revalidated with a
+        # conditional GET when the previous run stored validators for it. A resumed run
+        # downloads again the files written after its last checkpoint, which have no
+        # manifest entry to keep.
+        unrecorded = (resuming_crawl and previous is None
+                      and crawl_frontier.get_manifest_entry("assets", asset_path) is None)
+        if os.path.exists(save_path) and not unrecorded:
+            headers = conditional_headers(previous) if INCREMENTAL else {}
+            if not headers:
+                logging.info(f"File already exists, skipping download: {file_url}")
+                keep_previous_asset(asset_path)
+                return True
+        elif asset_store is not None:
+            # An earlier export stored this asset: revalidate it instead of downloading it again
+            stored = asset_store.lookup(file_url)
+            headers = conditional_headers(stored) if stored else {}
             
-        # time.sleep(0.5)
-        response = requests.get(file_url, stream=True, timeout=30)
-        if response.status_code == 200:
+        started = time.perf_counter()
+        with http_get(file_url, stream=True, headers=headers) as response:
+            if response.status_code == 304 and stored:
+                asset_store.materialize(stored["hash"], save_path)
+                increment_stat("assets_from_store")
+                set_manifest_entry("assets", asset_path, {"url": file_url, **stored})
+                if file_type == "media":
+                    record_media_file(file_url, save_path)
+                logging.info(f"Asset not modified, linked from the asset store: {file_url}")
+                return True
+            if response.status_code == 304:
+                logging.info(f"Asset not modified since last export: {file_url}")
+                keep_previous_asset(asset_path)
+                increment_stat("assets_unchanged")
+                return True
+            if response.status_code != 200:
+                logging.warning(f"Failed to download {file_url}: Status code {response.status_code}")
+                return False
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            with open(save_path, "wb") as file:
-                for chunk in response.iter_content(1024):
+            # Write to a temporary file first so other threads never see a partial download
+            if asset_store is not None:
+                temp_path = asset_store.temp_path()
+            else:
+                temp_path = f"{save_path}.{threading.get_ident()}.part"
+            content_hash = hashlib.sha1()
+            size = 0
+            with open(temp_path, "wb") as file:
+                for chunk in response.iter_content(65536):
                     file.write(chunk)
-            stats["assets_downloaded"] += 1
+                    content_hash.update(chunk)
+                    size += len(chunk)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if asset_store is not None:
+                asset_store.add_blob(temp_path, content_hash.hexdigest())
+                asset_store.materialize(content_hash.hexdigest(), save_path)
+                asset_store.record(file_url, etag, last_modified, content_hash.hexdigest())
+            else:
+                os.replace(temp_path, save_path)
+            record_timing("asset", time.perf_counter() - started, size)
+            increment_stat("assets_downloaded")
+            
+            set_manifest_entry("assets", asset_path, {
+                "url": file_url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "hash": content_hash.hexdigest()
+            })
             
             # Track media files
             if file_type == "media":
-                wordpress_data["content"]["media"].append({
-                    "url": file_url,
-                    "local_path": save_path,
-                    "type": os.path.splitext(save_path)[1][1:].lower()
-                })
+                record_media_file(file_url, save_path)
             
             logging.info(f"Downloaded: {file_url}")
             return True
-        else:
-            logging.warning(f"Failed to download {file_url}: Status code {response.status_code}")
     except Exception as e:
         logging.error(f"Error downloading {file_url}: {e}")
-        stats["errors"] += 1
+        increment_stat("errors")
     return False
 
+def schedule_asset_download(file_url, save_path, file_type="asset"):
+    """Queue an asset for background download and return True if the page should link to the local copy
+
+    Requests for a path that is already downloaded or in flight are collapsed into one
+    download, and URLs that failed earlier in this run are not requested again. Pages are
+    rewritten before their downloads finish, so every internal asset is linked locally;
+    a failed one would otherwise be rewritten to the same host by replace_domain_urls().
+    """
+    if not is_target_host(urlparse(file_url).netloc, include_subdomains=True):
+        logging.info(f"Skipping external URL: {file_url}")
+        return False
+
+    with asset_lock:
+        if file_url in failed_asset_urls:
+            return True
+        if save_path in completed_asset_paths or save_path in in_flight_assets:
+            return True
+        future = asset_executor.submit(download_file, file_url, save_path, file_type)
+        in_flight_assets[save_path] = future
+        # A page can be checkpointed as done before its assets are; --resume downloads them
+        if crawl_frontier is not None:
+            crawl_frontier.queue_asset(save_path, file_url, file_type)
+
+    future.add_done_callback(lambda done: finish_asset_download(file_url, save_path, done))
+    return True
+
+def finish_asset_download(file_url, save_path, future):
+    """Move a finished download from the in-flight table to the completed index or the negative cache"""
+    if crawl_frontier is not None:
+        crawl_frontier.finish_asset(save_path)
+    with asset_lock:
+        in_flight_assets.pop(save_path, None)
+        if future.result():
+            completed_asset_paths.add(save_path)
+            return
+        failed_asset_urls.add(file_url)
+    increment_stat("assets_failed")
+
+def resume_asset_downloads():
+    """Schedule again the asset downloads that were queued or in flight when the previous run stopped"""
+    pending = crawl_frontier.pending_assets()
+    for file_url, save_path, file_type in pending:
+        schedule_asset_download(file_url, save_path, file_type)
+    if pending:
+        logging.info(f"Resuming {len(pending)} unfinished asset downloads")
+
+def wait_for_asset_downloads():
+    """Block until every queued asset download has finished"""
+    asset_executor.shutdown(wait=True)
+    logging.info(f"Asset downloads finished: {len(completed_asset_paths)} available, {len(failed_asset_urls)} failed")
+
+# Pattern matching every protocol variation of TARGET_DOMAIN, built on first use
+domain_pattern = None
+domain_replacements = {}
+
+def replace_domain_text(text):
+    """Replace every URL containing TARGET_DOMAIN in a string with url_to_replace in a single scan"""
+    global domain_pattern
+    if TARGET_DOMAIN not in text:
+        return text
+    if domain_pattern is None:
+        target = url_to_replace.rstrip('/')
+        # Replace all instances of the domain with protocol variations
+        domain_replacements.update({
+            f"https://{TARGET_DOMAIN}": target,
+            f"http://{TARGET_DOMAIN}": target,
+            f"//{TARGET_DOMAIN}": target.replace('http:', '').replace('https:', ''),
+            TARGET_DOMAIN: target.replace('http://', '').replace('https://', '')
+        })
+        # Longer variations come first so the alternation matches them before the bare domain
+        domain_pattern = re.compile("|".join(re.escape(old) for old in domain_replacements))
+    return domain_pattern.sub(lambda match: domain_replacements[match.group(0)], text)
+
 def replace_domain_urls(soup, page_url):
     """Replace all URLs containing TARGET_DOMAIN with url_to_replace in one shot"""
-    logging.info(f"Replacing domain URLs with {url_to_replace} for {page_url}")
+    logging.debug("Replacing domain URLs with %s for %s", url_to_replace, page_url)
     
     # Convert the entire HTML to string
-    html_str = str(soup)
-    
-    # Replace all instances of the domain with protocol variations
-    replacements = [
-        (f"https://{TARGET_DOMAIN}", url_to_replace.rstrip('/')),
-        (f"http://{TARGET_DOMAIN}", url_to_replace.rstrip('/')),
-        (f"//{TARGET_DOMAIN}", url_to_replace.rstrip('/').replace('http:', '').replace('https:', '')),
-        (TARGET_DOMAIN, url_to_replace.rstrip('/').replace('http://', '').replace('https://', ''))
-    ]
-    
-    for old, new in replacements:
-        html_str = html_str.replace(old, new)
+    html_str = replace_domain_text(str(soup))
     
     # Parse the modified HTML back to BeautifulSoup
     return BeautifulSoup(html_str, 'html.parser')
 
+def split_host(netloc):
+    """Split a URL's netloc into a lowercase host name and port, dropping credentials and default ports"""
+    host, _, port = netloc.lower().rpartition("@")[2].partition(":")
+    if port in ("80", "443"):
+        port = ""
+    return host.rstrip("."), port
+
+def is_target_host(netloc, include_subdomains=False):
+    """Return True if a URL's netloc is TARGET_DOMAIN or its www. variant
+
+    With include_subdomains, subdomains such as cdn.target-domain.com match too; assets are
+    downloaded from them, but pages on them are not crawled.
+    """
+    host, port = split_host(netloc)
+    target_host, target_port = split_host(TARGET_HOST)
+    if not host or port != target_port:
+        return False
+    bare_target = target_host[4:] if target_host.startswith("www.") else target_host
+    if host in (bare_target, f"www.{bare_target}"):
+        return True
+    return include_subdomains and host.endswith(f".{bare_target}")
+
+def is_stripped_param(name):
+    """Return True if a query parameter is dropped from canonical URLs (tracking and reply parameters)"""
+    name = unquote(name).lower()
+    return any(name.startswith(param[:-1]) if param.endswith("*") else name == param
+               for param in STRIP_QUERY_PARAMS)
+
+def canonicalize_url(url):
+    """Return the canonical form of an internal page URL
+
+    The scheme becomes CANONICAL_SCHEME and the host TARGET_DOMAIN (collapsing http/https,
+    www. and default-port variants), the fragment and STRIP_QUERY_PARAMS are dropped, the
+    remaining query parameters are sorted, repeated slashes are collapsed and paths whose
+    last segment has no file extension get the trailing slash WordPress permalinks use.
+    Canonical URLs are returned unchanged.
+    """
+    parsed = urlparse(url)
+    scheme, netloc = parsed.scheme.lower(), parsed.netloc.lower()
+    if is_target_host(netloc):
+        scheme, netloc = CANONICAL_SCHEME, TARGET_HOST
+    path = re.sub(r"/{2,}", "/", parsed.path) or "/"
+    last_segment = path.rsplit("/", 1)[-1]
+    if last_segment and "." not in last_segment:
+        path += "/"
+    params = (param for param in parsed.query.split("&") if param)
+    query = "&".join(sorted(param for param in params if not is_stripped_param(param.split("=", 1)[0])))
+    return urlunparse((scheme, netloc, path, parsed.params, query, ""))
+
+def get_url_rejection(url, frontier, admitted):
+    """Return why a canonical URL must not be crawled, or None to crawl it
+
+    URLs not matching URL_INCLUDE or matching URL_EXCLUDE are rejected. A URL matching a
+    URL_CAPS pattern counts against its cap the first time it is admitted, i.e. when it is
+    neither in the frontier nor in admitted, and is rejected once the cap is reached.
+    """
+    if URL_INCLUDE and not any(pattern.search(url) for pattern in URL_INCLUDE):
+        return "not included"
+    if any(pattern.search(url) for pattern in URL_EXCLUDE):
+        return "excluded"
+    capped = [index for index, (pattern, _) in enumerate(URL_CAPS) if pattern.search(url)]
+    if capped and url not in admitted and not frontier.contains(url):
+        if any(url_cap_counts[index] >= URL_CAPS[index][1] for index in capped):
+            return "capped"
+        for index in capped:
+            url_cap_counts[index] += 1
+    return None
+
+def admit_urls(frontier, urls):
+    """Canonicalise URLs entering the crawl and return the ones to queue
+
+    Every raw URL that is not queued as it is, because it is a non-canonical variant or its
+    canonical form is rejected by the crawl rules, is recorded as skipped in the frontier
+    and counted once in the fetches_avoided statistic.
+    """
+    admitted = {}
+    skipped = []
+    for url in dict.fromkeys(urls):
+        canonical = canonicalize_url(url)
+        reason = get_url_rejection(canonical, frontier, admitted)
+        if reason:
+            skipped.append((url, reason))
+            continue
+        if canonical != url:
+            skipped.append((url, "variant"))
+        admitted[canonical] = None
+    increment_stat("fetches_avoided", frontier.skip(skipped))
+    return list(admitted)
+
+def restore_url_cap_counts(urls):
+    """Count the URLs already in the frontier of a resumed run against the URL_CAPS caps"""
+    for url in urls:
+        for index, (pattern, _) in enumerate(URL_CAPS):
+            if pattern.search(url):
+                url_cap_counts[index] += 1
+
+def get_internal_link(href, base_url):
+    """Return the absolute URL of an internal link, or None for anchors, scripts and external links"""
+    # Skip empty links, anchors, and external links
+    if not href or href.startswith("#") or href.startswith("javascript:"):
+        return None
+        
+    # Make the URL absolute if it's relative
+    absolute_url = urljoin(base_url, href)
+    
+    # Only include http(s) links to the target host itself, not mailto: links or subdomains
+    parsed_url = urlparse(absolute_url)
+    if parsed_url.scheme in ("http", "https") and is_target_host(parsed_url.netloc):
+        logging.debug("Found internal link: %s", absolute_url)
+        return absolute_url
+    return None
+
 def get_all_internal_links(soup, base_url):
     """Extract all internal links from a page"""
     internal_links = set()
     
     # Find all links on the page
     for link in soup.find_all("a", href=True):
-        href = link["href"]
-        
-        # Skip empty links, anchors, and external links
-        if not href or href.startswith("#") or href.startswith("javascript:"):
-            continue
-            
-        # Make the URL absolute if it's relative
-        absolute_url = urljoin(base_url, href)
-        
-        # Only include links from the same domain
-        if TARGET_DOMAIN in absolute_url:
+        absolute_url = get_internal_link(link["href"], base_url)
+        if absolute_url:
             internal_links.add(absolute_url)
-            logging.info(f"Found internal link: {absolute_url}")
     
     return internal_links
 
-def collect_all_internal_links():
-    """Collect all internal links from the sitemap and return them as a unique list"""
-    all_internal_links = set()
-    
-    # Get links from the sitemap
-    sitemap_links = get_sitemap_links(sitemap_url)
-    all_internal_links.update(sitemap_links)
-    logging.info(f"Found {len(sitemap_links)} links in sitemap")
-    
-    # Process each sitemap link to find additional internal links
-    processed_urls = set()
-    urls_to_process = set(sitemap_links)
-    
-    while urls_to_process:
-        current_url = urls_to_process.pop()
-        if current_url in processed_urls:
-            continue
-            
-        processed_urls.add(current_url)
-        
-        try:
-            logging.info(f"Fetching links from: {current_url}")
-            response = requests.get(current_url, timeout=30)
-            if response.status_code != 200:
-                logging.error(f"Failed to fetch {current_url}: {response.status_code}")
-                continue
-                
-            soup = BeautifulSoup(response.text, "html.parser")
-            internal_links = get_all_internal_links(soup, current_url)
-            
-            # Add new links to the processing queue
-            new_links = internal_links - processed_urls
-            urls_to_process.update(new_links)
-            all_internal_links.update(internal_links)
-            
-            logging.info(f"Found {len(internal_links)} internal links on {current_url}")
-            logging.info(f"Added {len(new_links)} new links to process")
-            logging.info(f"Total unique links found so far: {len(all_internal_links)}")
-            
-        except Exception as e:
-            logging.error(f"Error processing {current_url}: {e}")
-    
-    logging.info(f"Total unique links found across the site: {len(all_internal_links)}")
-    return list(all_internal_links)
+class CrawlFrontier:
+    """Crawl frontier persisted in SQLite (WAL mode) so an interrupted export can be resumed
 
-def process_srcset_images(soup, page_url):
-    """Process all images with srcset attributes and download them"""
-    for img in soup.find_all("img", srcset=True):
-        srcset = img["srcset"]
-        new_srcset = []
-        
-        # Split the srcset into individual sources
-        sources = [s.strip() for s in srcset.split(",")]
-        
-        for source in sources:
-            # Split into URL and size descriptor
-            parts = source.strip().split(" ")
-            if len(parts) >= 1:
-                img_url = parts[0]
-                size_descriptor = " ".join(parts[1:]) if len(parts) > 1 else ""
-                
-                # Make the URL absolute if it's relative
-                img_url = urljoin(page_url, img_url)
-                
-                # Get the path after the domain
-                img_path = urlparse(img_url).path.lstrip("/")
-                
-                # Create the full path in export folder maintaining original structure
-                img_file_path = os.path.join(export_folder, img_path)
-                
-                if download_file(img_url, img_file_path, "media"):
-                    # Update src to point to the root level path
-                    new_url = f"{url_to_replace}{img_path}"
-                    new_srcset.append(f"{new_url} {size_descriptor}".strip())
-        
-        # Update the srcset attribute with the new URLs
-        if new_srcset:
-            img["srcset"] = ", ".join(new_srcset)
+    Every URL has a state (queued, fetching, done or failed), a crawl priority, an attempt
+    count and the page it was first discovered from. URLs that were not queued (see admit_urls()),
+    asset downloads that have not finished, manifest entries and run metadata such as the
+    statistics are stored alongside, and so is the per-URL state of the run that would otherwise
+    grow with the site in memory: the sitemap entries, the manifest and streamed records of the
+    previous export, the claimed page folders and the recorded media files.
+    Changes are committed in batches by checkpoint_crawl().
+    """
 
-def process_page(page_url):
-    """Process a single page and save it to the export folder"""
-    try:
-        # Skip if not from target domain
-        if TARGET_DOMAIN not in urlparse(page_url).netloc:
-            logging.info(f"Skipping external page: {page_url}")
-            return
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'queued',
+                priority REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                discovered_from TEXT
+            );
+            CREATE INDEX IF NOT EXISTS urls_state ON urls (state, priority DESC);
+            CREATE TABLE IF NOT EXISTS skipped (url TEXT PRIMARY KEY, reason TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS assets (path TEXT PRIMARY KEY, url TEXT NOT NULL, file_type TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS manifest (
+                kind TEXT, key TEXT, path TEXT NOT NULL, hash TEXT, entry TEXT NOT NULL, PRIMARY KEY (kind, key));
+            CREATE INDEX IF NOT EXISTS manifest_path ON manifest (path);
+            CREATE TABLE IF NOT EXISTS previous_manifest (
+                kind TEXT, key TEXT, path TEXT NOT NULL, hash TEXT, entry TEXT NOT NULL, PRIMARY KEY (kind, key));
+            CREATE INDEX IF NOT EXISTS previous_manifest_path ON previous_manifest (path);
+            CREATE TABLE IF NOT EXISTS previous_records (
+                key TEXT PRIMARY KEY, content_type TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS sitemap (
+                url TEXT PRIMARY KEY, loc TEXT NOT NULL, lastmod TEXT, changefreq TEXT, priority REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS page_folders (folder TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS media (path TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self.connection.commit()
+        self.lock = threading.Lock()
+        self.uncommitted_changes = 0
+        self.last_commit = time.monotonic()
+        # Number of URLs in each state, kept up to date by every state change so that progress
+        # reports do not scan the table
+        self.state_counts = Counter(dict(
+            self.connection.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall()))
 
-        # Get the path from the URL and create the folder structure
-        path = urlparse(page_url).path.strip("/")
-        if not path:  # Homepage
-            page_folder = export_folder
-        else:
-            # Create the full path maintaining the original structure
-            page_folder = os.path.join(export_folder, path)
-        
-        # Check if the page has already been processed
-        if os.path.exists(os.path.join(page_folder, "index.html")):
-            logging.info(f"Page already processed, skipping: {page_url}")
-            return
+    def add(self, urls, discovered_from=None, priorities=None):
+        """Queue URLs that are not in the frontier yet and return the new ones
 
-        logging.info(f"Processing page: {page_url}")
-        response = requests.get(page_url, timeout=30)
-        if response.status_code != 200:
-            logging.error(f"Failed to fetch {page_url}: {response.status_code}")
-            return
+        priorities maps URLs to their crawl priority; URLs with a higher priority are
+        claimed first, the others (priority 0) in the order they were queued.
+        """
+        new_urls = []
+        priorities = priorities or {}
+        with self.lock:
+            for url in urls:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO urls (url, priority, discovered_from) VALUES (?, ?, ?)",
+                    (url, priorities.get(url, 0), discovered_from))
+                if cursor.rowcount:
+                    new_urls.append(url)
+            self.uncommitted_changes += len(new_urls)
+            self.state_counts["queued"] += len(new_urls)
+        return new_urls
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        os.makedirs(page_folder, exist_ok=True)
+    def contains(self, url):
+        """Return True if a URL is in the frontier, whatever its state"""
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
 
-        # Extract WordPress data
-        page_data = extract_wordpress_data(soup, page_url)
-        
-        # Determine if it's a post or page
-        is_post = bool(soup.find("article", {"class": "post"}))
-        content_type = "posts" if is_post else "pages"
-        wordpress_data["content"][content_type].append(page_data)
-        
-        if is_post:
-            stats["posts_found"] += 1
-        stats["categories_found"] = len(wordpress_data["content"]["categories"])
-        stats["tags_found"] = len(wordpress_data["content"]["tags"])
-
-        # Process CSS
-        for link in soup.find_all("link", rel="stylesheet"):
-            if "href" in link.attrs:
-                css_url = urljoin(page_url, link["href"])
-                # Get the path after the domain
-                css_path = urlparse(css_url).path.lstrip("/")
-                # Create the full path in export folder maintaining original structure
-                css_file_path = os.path.join(export_folder, css_path)
-                if download_file(css_url, css_file_path):
-                    # Update href to point to the root level path
-                    link["href"] = f"{url_to_replace}{css_path}"
-
-        # Process JS
-        for script in soup.find_all("script", src=True):
-            if "src" in script.attrs:
-                js_url = urljoin(page_url, script["src"])
-                # Get the path after the domain
-                js_path = urlparse(js_url).path.lstrip("/")
-                # Create the full path in export folder maintaining original structure
-                js_file_path = os.path.join(export_folder, js_path)
-                if download_file(js_url, js_file_path):
-                    # Update src to point to the root level path
-                    script["src"] = f"{url_to_replace}{js_path}"
-
-        # Process Images
-        for img in soup.find_all("img", src=True):
-            if "src" in img.attrs:
-                img_url = urljoin(page_url, img["src"])
-                # Get the path after the domain
-                img_path = urlparse(img_url).path.lstrip("/")
-                # Create the full path in export folder maintaining original structure
-                img_file_path = os.path.join(export_folder, img_path)
-                if download_file(img_url, img_file_path, "media"):
-                    # Update src to point to the root level path
-                    img["src"] = f"{url_to_replace}{img_path}"
-        
-        # Process srcset images
-        process_srcset_images(soup, page_url)
+    def skip(self, urls):
+        """Record (url, reason) pairs of URLs that are not crawled and return how many are new"""
+        skipped = 0
+        with self.lock:
+            for url, reason in urls:
+                cursor = self.connection.execute("INSERT OR IGNORE INTO skipped (url, reason) VALUES (?, ?)", (url, reason))
+                skipped += cursor.rowcount
+            self.uncommitted_changes += skipped
+        return skipped
 
-        # Replace all domain URLs with url_to_replace in one shot
-        soup = replace_domain_urls(soup, page_url)
+    def skipped_counts(self):
+        """Return the number of skipped URLs for each reason"""
+        with self.lock:
+            return dict(self.connection.execute("SELECT reason, COUNT(*) FROM skipped GROUP BY reason").fetchall())
 
-        # Save Modified HTML
-        html_path = os.path.join(page_folder, "index.html")
-        with open(html_path, "w", encoding="utf-8") as file:
-            file.write(soup.prettify())
+    def claim(self, limit):
+        """Move up to limit queued URLs, highest priority first, to the fetching state and return them"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT url FROM urls WHERE state = 'queued' ORDER BY priority DESC, rowid LIMIT ?", (limit,)).fetchall()
+            urls = [row[0] for row in rows]
+            self.connection.executemany(
+                "UPDATE urls SET state = 'fetching', attempts = attempts + 1 WHERE url = ?", rows)
+            self.uncommitted_changes += len(urls)
+            self.state_counts["queued"] -= len(urls)
+            self.state_counts["fetching"] += len(urls)
+        return urls
 
-        stats["pages_processed"] += 1
-        logging.info(f"Page exported: {html_path}")
+    def mark(self, url, state):
+        """Set the state of a URL, e.g. done or failed"""
+        with self.lock:
+            row = self.connection.execute("SELECT state FROM urls WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            self.connection.execute("UPDATE urls SET state = ? WHERE url = ?", (state, url))
+            self.uncommitted_changes += 1
+            self.state_counts[row[0]] -= 1
+            self.state_counts[state] += 1
 
-    except Exception as e:
-        logging.error(f"Error processing page {page_url}: {e}")
-        stats["errors"] += 1
+    def state(self, url):
+        """Return the state of a URL, or None if it is not in the frontier"""
+        with self.lock:
+            row = self.connection.execute("SELECT state FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
 
-def get_sitemap_links(sitemap_url):
-    try:
-        # Skip if not from target domain
-        if TARGET_DOMAIN not in urlparse(sitemap_url).netloc:
-            logging.info(f"Skipping external sitemap: {sitemap_url}")
-            return []
+    def requeue_interrupted(self):
+        """Queue the URLs that were being fetched when the previous run stopped and return them"""
+        with self.lock:
+            urls = [row[0] for row in self.connection.execute("SELECT url FROM urls WHERE state = 'fetching'")]
+            self.connection.execute("UPDATE urls SET state = 'queued' WHERE state = 'fetching'")
+            self.connection.commit()
+            self.state_counts["queued"] += len(urls)
+            self.state_counts["fetching"] -= len(urls)
+        return urls
 
-        sitemap_response = requests.get(sitemap_url, timeout=30)
-        if sitemap_response.status_code != 200:
-            logging.error(f"Failed to fetch sitemap: {sitemap_url}")
-            return []
+    def queue_asset(self, path, url, file_type):
+        """Record an asset download that was scheduled, committed with the next checkpoint"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO assets (path, url, file_type) VALUES (?, ?, ?)", (path, url, file_type))
+            self.uncommitted_changes += 1
 
-        # Parse XML properly
-        root = ET.fromstring(sitemap_response.content)
-        urls = []
-        
-        # Handle both sitemap index and regular sitemaps
-        for elem in root.findall(".//{http://www.sitemaps.org/schemas/sitemap/0.9}loc"):
-            url = elem.text.strip()
-            if url.endswith(".xml"):
-                urls.extend(get_sitemap_links(url))
-            else:
-                urls.append(url)
+    def finish_asset(self, path):
+        """Forget an asset download once it has completed or failed"""
+        with self.lock:
+            self.connection.execute("DELETE FROM assets WHERE path = ?", (path,))
+            self.uncommitted_changes += 1
 
-        return urls
-    except Exception as e:
-        logging.error(f"Error processing sitemap {sitemap_url}: {e}")
-        return []
+    def pending_assets(self):
+        """Return (url, path, file_type) of the asset downloads the previous run did not finish"""
+        with self.lock:
+            return self.connection.execute("SELECT url, path, file_type FROM assets ORDER BY rowid").fetchall()
 
-def save_wordpress_export():
-    """Save the complete WordPress export data"""
-    # Convert sets to lists for JSON serialization
-    wordpress_data["content"]["categories"] = list(wordpress_data["content"]["categories"])
-    wordpress_data["content"]["tags"] = list(wordpress_data["content"]["tags"])
-    
-    # Save the complete WordPress export
-    export_path = os.path.join(export_folder, "wordpress_export.json")
-    with open(export_path, "w", encoding="utf-8") as f:
-        json.dump(wordpress_data, f, indent=4)
-    
-    # Save statistics
-    stats_path = os.path.join(export_folder, "export_statistics.json")
-    with open(stats_path, "w", encoding="utf-8") as f:
-        json.dump(stats, f, indent=4)
+    # The manifest of this run is in the manifest table, the one of the previous run in
+    # previous_manifest; path is the exported file of an entry and hash its content hash
 
-def download_allow_urls():
-    """Read URLs from the local allow-urls.txt file and download their content"""
-    try:
-        # Check if the file exists
-        if not os.path.exists("allow-urls.txt"):
-            logging.error("allow-urls.txt file not found in the current directory")
+    def save_manifest_entry(self, kind, key, entry):
+        """Store a manifest entry, committed with the next checkpoint"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO manifest (kind, key, path, hash, entry) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, entry["path"] if kind == "pages" else key, entry.get("hash"), json.dumps(entry)))
+            self.uncommitted_changes += 1
+
+    def load_previous_manifest(self, entries):
+        """Replace the previous manifest with (kind, key, entry) triples and commit it"""
+        with self.lock:
+            self.connection.execute("DELETE FROM previous_manifest")
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO previous_manifest (kind, key, path, hash, entry) VALUES (?, ?, ?, ?, ?)",
+                ((kind, key, entry["path"] if kind == "pages" else key, entry.get("hash"), json.dumps(entry))
+                 for kind, key, entry in entries))
+            self.connection.commit()
+
+    def get_manifest_entry(self, kind, key, previous=False):
+        """Return a manifest entry of this run, or of the previous one, or None"""
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT entry FROM {'previous_manifest' if previous else 'manifest'} WHERE kind = ? AND key = ?",
+                (kind, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count_manifest(self, kind, previous=False):
+        """Return the number of manifest entries of a kind"""
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM {'previous_manifest' if previous else 'manifest'} WHERE kind = ?",
+                (kind,)).fetchone()[0]
+
+    def iter_manifest(self, kind, previous=False):
+        """Yield (key, entry) of the committed manifest entries of a kind, sorted by key"""
+        for key, entry in self.iter_query(
+                f"SELECT key, entry FROM {'previous_manifest' if previous else 'manifest'} WHERE kind = ? ORDER BY key",
+                (kind,)):
+            yield key, json.loads(entry)
+
+    def keep_previous_manifest(self):
+        """Copy the previous manifest entries that this run did not replace into its manifest"""
+        with self.lock:
+            self.connection.execute("INSERT OR IGNORE INTO manifest SELECT * FROM previous_manifest")
+            self.uncommitted_changes += 1
+
+    def iter_manifest_changes(self, change):
+        """Yield the sorted paths the committed manifest added, modified or removed since the previous one"""
+        queries = {
+            "added": "SELECT DISTINCT path FROM manifest WHERE path NOT IN (SELECT path FROM previous_manifest)",
+            "modified": "SELECT DISTINCT manifest.path FROM manifest JOIN previous_manifest USING (path) "
+                        "WHERE manifest.hash IS NOT previous_manifest.hash",
+            "removed": "SELECT DISTINCT path FROM previous_manifest WHERE path NOT IN (SELECT path FROM manifest)"
+        }
+        for (path,) in self.iter_query(f"{queries[change]} ORDER BY path"):
+            yield path
+
+    def load_previous_records(self, index_path):
+        """Replace the index of the previous streaming export with the one in index_path and commit it"""
+        with open(index_path, "r", encoding="utf-8") as f, self.lock:
+            self.connection.execute("DELETE FROM previous_records")
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO previous_records (content_type, key, offset, length) VALUES (?, ?, ?, ?)",
+                (json.loads(line) for line in f))
+            self.connection.commit()
+
+    def get_previous_record(self, key):
+        """Return (content_type, offset, length) of a record of the previous streaming export, or None"""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT content_type, offset, length FROM previous_records WHERE key = ?", (key,)).fetchone()
+
+    def add_sitemap_entries(self, entries):
+        """Record the sitemap entries of a sitemap file, keyed by canonical URL"""
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sitemap (url, loc, lastmod, changefreq, priority) VALUES (?, ?, ?, ?, ?)",
+                [(canonicalize_url(entry["loc"]), entry["loc"], entry["lastmod"], entry["changefreq"],
+                  get_entry_priority(entry))
+                 for entry in entries])
+            self.uncommitted_changes += len(entries)
+
+    def get_sitemap_lastmod(self, url):
+        """Return the <lastmod> of a canonical URL in the sitemap, or None"""
+        with self.lock:
+            row = self.connection.execute("SELECT lastmod FROM sitemap WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def get_sitemap_priorities(self, urls):
+        """Return the <priority> of the URLs listed in the sitemap, keyed by URL"""
+        priorities = {}
+        with self.lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for start in range(0, len(urls), 500):
+                batch = urls[start:start + 500]
+                priorities.update(self.connection.execute(
+                    f"SELECT url, priority FROM sitemap WHERE url IN ({','.join('?' * len(batch))})", batch))
+        return priorities
+
+    def iter_sitemap_links(self):
+        """Yield the committed sitemap URLs, highest <priority> first and most recently modified first within a priority"""
+        for (loc,) in self.iter_query("SELECT loc FROM sitemap ORDER BY priority DESC, COALESCE(lastmod, '') DESC, rowid"):
+            yield loc
+
+    def claim_page_folder(self, folder):
+        """Reserve a page folder for this run, returning False if it was already claimed"""
+        with self.lock:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO page_folders (folder) VALUES (?)", (folder,))
+            self.uncommitted_changes += cursor.rowcount
+        return bool(cursor.rowcount)
+
+    def release_page_folders(self):
+        """Forget the page folders claimed by an interrupted run"""
+        with self.lock:
+            self.connection.execute("DELETE FROM page_folders")
+            self.connection.commit()
+
+    def add_media(self, path):
+        """Record a media file of the streaming export, returning False if it was already recorded"""
+        with self.lock:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO media (path) VALUES (?)", (path,))
+            self.uncommitted_changes += cursor.rowcount
+        return bool(cursor.rowcount)
+
+    def set_meta(self, key, value):
+        """Store a JSON-serialisable value, committed with the next checkpoint"""
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        """Return a value stored with set_meta()"""
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def checkpoint_due(self):
+        """Return True when enough changes or time have accumulated since the last commit"""
+        return (self.uncommitted_changes >= CHECKPOINT_BATCH_SIZE
+                or time.monotonic() - self.last_commit >= CHECKPOINT_INTERVAL)
+
+    def commit(self):
+        """Commit every pending change in one transaction"""
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted_changes = 0
+            self.last_commit = time.monotonic()
+
+    def iter_query(self, query, parameters=()):
+        """Yield the rows of a query over the committed state without loading them all in memory
+
+        A separate connection reads them, so the frontier stays usable meanwhile.
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            yield from connection.execute(query, parameters)
+        finally:
+            connection.close()
+
+    def iter_urls(self, sort=False):
+        """Yield every committed URL, in crawl order or sorted"""
+        for (url,) in self.iter_query(f"SELECT url FROM urls ORDER BY {'url' if sort else 'rowid'}"):
+            yield url
+
+    def count(self):
+        """Return the number of URLs in the frontier"""
+        with self.lock:
+            return sum(self.state_counts.values())
+
+    def counts(self):
+        """Return the number of URLs in each state, without querying the database"""
+        with self.lock:
+            return {state: count for state, count in sorted(self.state_counts.items()) if count}
+
+    def close(self):
+        """Commit and close the database"""
+        self.commit()
+        with self.lock:
+            self.connection.close()
+
+def open_crawl_frontier(resume=False):
+    """Open the crawl frontier of the export folder, starting a new one unless resuming"""
+    global crawl_frontier, resuming_crawl
+    os.makedirs(export_folder, exist_ok=True)
+    frontier_path = os.path.join(export_folder, FRONTIER_FILE)
+    if not resume:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(frontier_path + suffix):
+                os.remove(frontier_path + suffix)
+    crawl_frontier = CrawlFrontier(frontier_path)
+    if resume:
+        interrupted = crawl_frontier.requeue_interrupted()
+        crawl_frontier.release_page_folders()
+        resuming_crawl = True
+        restore_url_cap_counts(crawl_frontier.iter_urls())
+        logging.info(f"Resuming crawl: {crawl_frontier.counts()}, {len(interrupted)} interrupted pages requeued")
+    return crawl_frontier
+
+class LinkGraph:
+    """Page-to-page link graph of a crawl in SQLite, for the orphan page and broken link report
+
+    Page URLs are interned once in the pages table and every link is a (source, target) pair
+    of their integer ids in a WITHOUT ROWID table, a few bytes per link on disk instead of two
+    URL strings in memory. Crawled pages have a state, done or failed; pages only linked to
+    have none. The graphs of shard exports are combined with merge().
+
+    Pages an incremental run does not parse again copy their links from the graph of the
+    previous run, previous_path, with keep_links().
+    """
+
+    def __init__(self, path, previous_path=None):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, state TEXT);
+            CREATE TABLE IF NOT EXISTS links (
+                source INTEGER NOT NULL,
+                target INTEGER NOT NULL,
+                PRIMARY KEY (source, target)
+            ) WITHOUT ROWID;
+        """)
+        self.connection.commit()
+        self.previous = previous_path is not None
+        if self.previous:
+            self.connection.execute("ATTACH DATABASE ? AS previous", (previous_path,))
+        self.lock = threading.Lock()
+
+    def intern(self, urls):
+        """Return the ids of page URLs as a {url: id} dict, adding the new ones"""
+        urls = list(urls)
+        self.connection.executemany("INSERT OR IGNORE INTO pages (url) VALUES (?)", [(url,) for url in urls])
+        ids = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            ids.update(self.connection.execute(
+                f"SELECT url, id FROM pages WHERE url IN ({','.join('?' * len(batch))})", batch))
+        return ids
+
+    def add_links(self, source, targets):
+        """Record the links of a crawled page to the canonical target URLs and mark the page done"""
+        with self.lock:
+            ids = self.intern([source, *targets])
+            self.connection.execute("UPDATE pages SET state = 'done' WHERE id = ?", (ids[source],))
+            self.connection.executemany("INSERT OR IGNORE INTO links (source, target) VALUES (?, ?)",
+                                        [(ids[source], ids[target]) for target in targets if target != source])
+
+    def keep_links(self, source):
+        """Record the links a page had in the previous run's graph and mark the page done"""
+        targets = []
+        if self.previous:
+            with self.lock:
+                targets = [url for (url,) in self.connection.execute("""
+                    SELECT target_page.url FROM previous.links
+                    JOIN previous.pages AS source_page ON source_page.id = previous.links.source
+                    JOIN previous.pages AS target_page ON target_page.id = previous.links.target
+                    WHERE source_page.url = ?
+                """, (source,))]
+        self.add_links(source, targets)
+
+    def set_state(self, url, state):
+        """Set the state of a page, e.g. failed"""
+        with self.lock:
+            page_id = self.intern([url])[url]
+            self.connection.execute("UPDATE pages SET state = ? WHERE id = ?", (state, page_id))
+
+    def merge(self, path):
+        """Add the pages, states and links of another link graph file, re-interning its ids"""
+        with self.lock:
+            self.connection.commit()
+            self.connection.execute("ATTACH DATABASE ? AS other", (path,))
+            self.connection.executescript("""
+                INSERT OR IGNORE INTO pages (url) SELECT url FROM other.pages;
+                UPDATE pages SET state = (SELECT state FROM other.pages WHERE other.pages.url = pages.url)
+                    WHERE url IN (SELECT url FROM other.pages WHERE state IS NOT NULL);
+                INSERT OR IGNORE INTO links (source, target)
+                    SELECT source_page.id, target_page.id FROM other.links
+                    JOIN other.pages AS other_source ON other_source.id = other.links.source
+                    JOIN other.pages AS other_target ON other_target.id = other.links.target
+                    JOIN pages AS source_page ON source_page.url = other_source.url
+                    JOIN pages AS target_page ON target_page.url = other_target.url;
+                DETACH DATABASE other;
+            """)
+
+    def counts(self):
+        """Return the number of pages and of links"""
+        with self.lock:
+            return (self.connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0],
+                    self.connection.execute("SELECT COUNT(*) FROM links").fetchone()[0])
+
+    # The report queries stream their rows and must only run once the crawl no longer adds links
+
+    def iter_orphan_pages(self):
+        """Yield the URLs of crawled pages that no other page links to, sorted"""
+        self.connection.execute("CREATE INDEX IF NOT EXISTS links_target ON links (target)")
+        self.connection.commit()
+        for (url,) in self.connection.execute("""
+            SELECT url FROM pages WHERE state = 'done'
+            AND NOT EXISTS (SELECT 1 FROM links WHERE links.target = pages.id)
+            ORDER BY url
+        """):
+            yield url
+
+    def iter_broken_links(self):
+        """Yield (target URL, source URL) of every link to a page that failed, sorted by target"""
+        yield from self.connection.execute("""
+            SELECT target_page.url, source_page.url FROM links
+            JOIN pages AS target_page ON target_page.id = links.target
+            JOIN pages AS source_page ON source_page.id = links.source
+            WHERE target_page.state = 'failed'
+            ORDER BY target_page.url, source_page.url
+        """)
+
+    def commit(self):
+        """Commit every pending change"""
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """Commit and close the database"""
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+def open_link_graph(resume=False):
+    """Open the link graph of the export folder, starting a new one unless resuming
+
+    An incremental run keeps the graph of the previous run for the pages it does not parse again.
+    """
+    global link_graph
+    graph_path = os.path.join(export_folder, LINK_GRAPH_FILE)
+    previous_path = os.path.join(export_folder, PREVIOUS_LINK_GRAPH_FILE)
+    if not resume:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(previous_path + suffix):
+                os.remove(previous_path + suffix)
+            if INCREMENTAL and os.path.exists(graph_path + suffix):
+                os.replace(graph_path + suffix, previous_path + suffix)
+            elif os.path.exists(graph_path + suffix):
+                os.remove(graph_path + suffix)
+    link_graph = LinkGraph(graph_path, previous_path if os.path.exists(previous_path) else None)
+    return link_graph
+
+def save_link_report():
+    """Write the orphan pages and broken links of the link graph to link_report.json and close it
+
+    Orphan pages were crawled (from the sitemap) but no crawled page links to them; broken
+    links point to pages that could not be fetched, listed with the pages linking to them.
+    """
+    global link_graph
+    page_count, link_count = link_graph.counts()
+    orphan_count = 0
+    broken_count = 0
+    report_path = os.path.join(export_folder, LINK_REPORT_FILE)
+    # Written entry by entry, so the report is never held in memory
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(f'{{\n    "pages": {page_count},\n    "links": {link_count},\n    "orphan_pages": [')
+        for url in link_graph.iter_orphan_pages():
+            f.write(("," if orphan_count else "") + "\n        " + json.dumps(url))
+            orphan_count += 1
+        f.write("\n    ],\n" if orphan_count else "],\n")
+        f.write('    "broken_links": [')
+        for target, rows in groupby(link_graph.iter_broken_links(), key=lambda row: row[0]):
+            entry = {"url": target, "linked_from": [source for _, source in rows]}
+            f.write(("," if broken_count else "") + "\n        " + json.dumps(entry))
+            broken_count += 1
+        f.write("\n    ]\n}\n" if broken_count else "]\n}\n")
+    link_graph.close()
+    link_graph = None
+    for suffix in ("", "-wal", "-shm"):
+        previous_path = os.path.join(export_folder, PREVIOUS_LINK_GRAPH_FILE + suffix)
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+    stats["orphan_pages"] = orphan_count
+    stats["broken_links"] = broken_count
+    logging.info(f"Link report: {page_count} pages and {link_count} links, {orphan_count} orphan pages, "
+                 f"{broken_count} broken link targets, saved to {report_path}")
+
+def checkpoint_crawl(force=False):
+    """Commit the frontier together with a snapshot of the statistics when a checkpoint is due"""
+    if crawl_frontier is None or not (force or crawl_frontier.checkpoint_due()):
+        return
+    with stats_lock:
+        crawl_frontier.set_meta("stats", stats)
+    if link_graph is not None:
+        link_graph.commit()
+    crawl_frontier.commit()
+
+def run_crawl(seed_urls, crawl_worker):
+    """Crawl concurrently from seed_urls and return the number of unique internal links found
+
+    seed_urls can be any iterable. crawl_worker(url) runs on a worker thread and returns
+    the set of internal links on
+    that page, or None if the page could not be fetched. The frontier lives in SQLite and
+    is only fed from the calling thread, so memory does not grow with queued URLs; the
+    links are read back with crawl_frontier.iter_urls(). crawl_worker records the links of
+    the pages it parses in the link graph when one is open, and pages that could not be
+    fetched are marked failed in it here.
+    """
+    frontier = crawl_frontier or open_crawl_frontier()
+    # Seed URLs are queued in batches, so they are never all held in memory
+    seed_urls = iter(seed_urls)
+    while batch := list(islice(seed_urls, 1000)):
+        if shard_queue is not None:
+            # Every worker reads the whole sitemap and keeps the URLs of its own shard
+            batch = [url for url in batch if get_url_shard(canonicalize_url(url)) == shard_index]
+        batch = admit_urls(frontier, batch)
+        frontier.add(batch, priorities=get_crawl_priorities(batch))
+    pending = {}
+    next_shard_poll = 0
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS, initializer=start_thread_profiler) as executor:
+        while True:
+            # Queue the links other shards found for this one
+            if shard_queue is not None and time.monotonic() >= next_shard_poll:
+                next_shard_poll = time.monotonic() + SHARD_POLL_INTERVAL
+                for url, discovered_from in shard_queue.take(shard_index):
+                    frontier.add(admit_urls(frontier, [url]), discovered_from, get_crawl_priorities([url]))
+            
+            # Keep every worker busy without loading the whole queue into memory
+            for url in frontier.claim(MAX_WORKERS * 2 - len(pending)):
+                pending[executor.submit(crawl_worker, url)] = url
+            if not pending:
+                # A shard is done once every worker is idle and no forwarded link is left
+                if shard_queue is None or shard_queue.finish(shard_index):
+                    break
+                time.sleep(SHARD_POLL_INTERVAL)
+                continue
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                current_url = pending.pop(future)
+                internal_links = future.result()
+                if internal_links is None:
+                    frontier.mark(current_url, "failed")
+                    if link_graph is not None:
+                        link_graph.set_state(current_url, "failed")
+                    continue
+                
+                # Add new links to the processing queue
+                frontier.mark(current_url, "done")
+                if shard_queue is not None:
+                    internal_links = route_shard_links(internal_links, current_url)
+                admitted_links = admit_urls(frontier, internal_links)
+                new_links = frontier.add(admitted_links, current_url, get_crawl_priorities(admitted_links))
+                
+                logging.info(f"Found {len(internal_links)} internal links on {current_url}, {len(new_links)} new")
+            
+            checkpoint_crawl()
+            logging.info(f"Progress: {stats['pages_processed']} pages processed, {frontier.counts()}")
+    
+    checkpoint_crawl(force=True)
+    link_count = frontier.count()
+    logging.info(f"Total unique links found across the site: {link_count}")
+    logging.info(f"Fetches avoided by URL canonicalisation and crawl rules: {stats['fetches_avoided']} "
+                 f"{frontier.skipped_counts()}")
+    return link_count
+
+def parse_shard(value):
+    """Parse an "index/count" shard specification into (index, count)"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard {value!r}, expected INDEX/COUNT such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"invalid shard {value!r}, INDEX must be between 0 and COUNT - 1")
+    return index, count
+
+def get_url_shard(url):
+    """Return the shard of a canonical URL, stable across workers and runs"""
+    return int(hashlib.sha1(url.encode("utf-8")).hexdigest()[:8], 16) % shard_count
+
+def route_shard_links(urls, discovered_from):
+    """Forward the links of other shards to the shard queue and return the ones of this shard"""
+    own_urls = []
+    forwarded = []
+    variants = []
+    for url in urls:
+        canonical = canonicalize_url(url)
+        shard = get_url_shard(canonical)
+        if shard == shard_index:
+            own_urls.append(url)
+            continue
+        forwarded.append((canonical, shard))
+        if canonical != url:
+            variants.append((url, "variant"))
+    shard_queue.forward(forwarded, discovered_from)
+    increment_stat("fetches_avoided", crawl_frontier.skip(variants))
+    return own_urls
+
+class ShardQueue:
+    """Queue of links forwarded between the workers of a sharded export, in a shared SQLite file
+
+    A link is stored once, for the shard that owns it, and taken by that shard's worker. Each
+    worker is registered as busy or idle; the export is finished when all shard_count
+    workers are idle and no link is waiting, because only busy workers forward links.
+    The rollback journal is used instead of WAL, which needs memory shared by all workers.
+    """
+
+    def __init__(self, path, shard_count):
+        self.shard_count = shard_count
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS links (
+                url TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                discovered_from TEXT,
+                taken INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS links_waiting ON links (shard, taken);
+            CREATE TABLE IF NOT EXISTS workers (shard INTEGER PRIMARY KEY, busy INTEGER NOT NULL, updated TEXT);
+        """)
+
+    def register(self, shard):
+        """Register a worker as busy; links taken by an earlier attempt of it are delivered again"""
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("UPDATE links SET taken = 0 WHERE shard = ?", (shard,))
+            self.connection.execute("INSERT OR REPLACE INTO workers (shard, busy, updated) VALUES (?, 1, ?)",
+                                    (shard, datetime.now().isoformat()))
+
+    def forward(self, links, discovered_from):
+        """Queue (url, shard) pairs for their shards; links forwarded before are ignored"""
+        if not links:
+            return
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO links (url, shard, discovered_from) VALUES (?, ?, ?)",
+                [(url, shard, discovered_from) for url, shard in links])
+
+    def take(self, shard):
+        """Return the (url, discovered_from) pairs waiting for a shard, marking its worker busy"""
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            links = self.connection.execute(
+                "SELECT url, discovered_from FROM links WHERE shard = ? AND taken = 0", (shard,)).fetchall()
+            if links:
+                self.connection.execute("UPDATE links SET taken = 1 WHERE shard = ? AND taken = 0", (shard,))
+                self.connection.execute("UPDATE workers SET busy = 1, updated = ? WHERE shard = ?",
+                                        (datetime.now().isoformat(), shard))
+        return links
+
+    def finish(self, shard):
+        """Mark a worker with nothing left to crawl idle and return True if the whole export is done"""
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            waiting = self.connection.execute("SELECT shard FROM links WHERE taken = 0").fetchall()
+            if (shard,) in waiting:
+                return False
+            self.connection.execute("UPDATE workers SET busy = 0, updated = ? WHERE shard = ?",
+                                    (datetime.now().isoformat(), shard))
+            idle = self.connection.execute("SELECT COUNT(*) FROM workers WHERE busy = 0").fetchone()[0]
+        return idle == self.shard_count and not waiting
+
+    def close(self):
+        """Close the queue"""
+        self.connection.close()
+
+def get_filesystem_type(path):
+    """Return the type of the file system holding path, read from /proc/mounts, or None when unknown"""
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    # The longest mount point containing the path is the one it is on
+    fs_type = None
+    longest = -1
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > longest:
+            fs_type, longest = mount_type, len(mount_point)
+    return fs_type
+
+def open_shard_queue(path):
+    """Open the shared shard queue and register this worker in it"""
+    global shard_queue
+    shard_queue = ShardQueue(path, shard_count)
+    shard_queue.register(shard_index)
+    return shard_queue
+
+def fetch_internal_links(current_url):
+    """Fetch a page and return its internal links (crawl worker for link discovery)"""
+    try:
+        logging.info(f"Fetching links from: {current_url}")
+        response = http_get(current_url)
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch {current_url}: {response.status_code}")
+            return None
+        started = time.perf_counter()
+        links = run_render_task(get_page_links_from_content, response.content, response.encoding, current_url)
+        record_timing("discover", time.perf_counter() - started, len(response.content))
+        record_page_links(current_url, links)
+        return links
+    except Exception as e:
+        logging.error(f"Error processing {current_url}: {e}")
+        return None
+
+def collect_all_internal_links():
+    """Collect all internal links from the sitemap into the frontier and return their number"""
+    # Get links from the sitemap
+    sitemap_link_count = read_sitemap(sitemap_url)
+    logging.info(f"Found {sitemap_link_count} links in sitemap")
+    
+    # Process each sitemap link to find additional internal links
+    return run_crawl(crawl_frontier.iter_sitemap_links(), fetch_internal_links)
+
+def add_local_asset(assets, asset_url, file_type="asset"):
+    """Record an asset on the target domain for download and return the URL of its local copy
+
+    Returns None for external assets, which keep their original URL.
+    """
+    if not is_target_host(urlparse(asset_url).netloc, include_subdomains=True):
+        logging.info(f"Skipping external URL: {asset_url}")
+        return None
+    # Get the path after the domain
+    asset_path = urlparse(asset_url).path.lstrip("/")
+    assets.append((asset_url, asset_path, file_type))
+    # Point to the root level path
+    return f"{url_to_replace}{asset_path}"
+
+def rewrite_srcset(srcset, page_url, assets):
+    """Rewrite every candidate of a srcset attribute to its local copy, dropping external ones"""
+    new_srcset = []
+    
+    # Split the srcset into individual sources
+    sources = [s.strip() for s in srcset.split(",")]
+    
+    for source in sources:
+        # Split into URL and size descriptor
+        parts = source.strip().split(" ")
+        if len(parts) >= 1:
+            # Make the URL absolute if it's relative
+            img_url = urljoin(page_url, parts[0])
+            size_descriptor = " ".join(parts[1:]) if len(parts) > 1 else ""
+            
+            new_url = add_local_asset(assets, img_url, "media")
+            if new_url:
+                new_srcset.append(f"{new_url} {size_descriptor}".strip())
+    
+    return ", ".join(new_srcset)
+
+def process_srcset_images(soup, page_url, assets):
+    """Process all images with srcset attributes, recording them in assets for download"""
+    for img in soup.find_all("img", srcset=True):
+        new_srcset = rewrite_srcset(img["srcset"], page_url, assets)
+        
+        # Update the srcset attribute with the new URLs
+        if new_srcset:
+            img["srcset"] = new_srcset
+
+def get_image_formats():
+    """Return the IMAGE_FORMATS that Pillow can write, smallest first ([] without Pillow)"""
+    global image_formats
+    if image_formats is None:
+        extensions = Image.registered_extensions() if Image is not None else {}
+        image_formats = [image_format for image_format in IMAGE_MIME_TYPES
+                         if image_format in IMAGE_FORMATS and f".{image_format}" in extensions]
+    return image_formats
+
+def get_picture_sources(src, srcset, sizes):
+    """Return the attributes of the <source> elements offering an <img>'s WebP/AVIF variants
+
+    Only images whose candidates are all local JPEG/PNG copies get sources, as optimize_images()
+    writes their variants next to them. Returns [] for every other image.
+    """
+    formats = get_image_formats()
+    candidates = [candidate.split() for candidate in (srcset or src or "").split(",")]
+    if not formats or not all(parts and parts[0].startswith(url_to_replace) and parts[0].lower().endswith(IMAGE_EXTENSIONS)
+                              for parts in candidates):
+        return []
+    sources = []
+    for image_format in formats:
+        attributes = {"type": IMAGE_MIME_TYPES[image_format],
+                      "srcset": ", ".join(" ".join([f"{parts[0]}.{image_format}"] + parts[1:]) for parts in candidates)}
+        if srcset and sizes:
+            attributes["sizes"] = sizes
+        sources.append(attributes)
+    return sources
+
+def wrap_images_in_picture(soup):
+    """Wrap the <img> tags of a page in <picture> elements offering their WebP/AVIF variants"""
+    for img in soup.find_all("img"):
+        if img.parent is not None and img.parent.name == "picture":
+            continue
+        sources = get_picture_sources(img.get("src"), img.get("srcset"), img.get("sizes"))
+        if sources:
+            img.wrap(soup.new_tag("picture"))
+            for attributes in sources:
+                img.insert_before(soup.new_tag("source", attrs=attributes))
+
+def wrap_images_in_picture_lxml(images):
+    """Wrap <img> elements of an lxml tree in <picture> elements offering their WebP/AVIF variants"""
+    for img in images:
+        parent = img.getparent()
+        # libxml2 does not know <source> is a void element, so an <img> after one is nested in it
+        if parent is None or next(img.iterancestors("picture"), None) is not None:
+            continue
+        sources = get_picture_sources(img.get("src"), img.get("srcset"), img.get("sizes"))
+        if not sources:
+            continue
+        picture = img.makeelement("picture", {})
+        picture.tail, img.tail = img.tail, None
+        parent.replace(img, picture)
+        for attributes in sources:
+            picture.append(img.makeelement("source", attributes))
+        picture.append(img)
+
+def get_page_folder(page_url):
+    """Return the export folder a page's index.html is saved in"""
+    path = urlparse(page_url).path.strip("/")
+    if not path:  # Homepage
+        return export_folder
+    # Create the full path maintaining the original structure
+    return os.path.join(export_folder, path)
+
+def claim_page_folder(page_url):
+    """Reserve a page's export folder, returning False if it is already exported or being exported"""
+    page_folder = get_page_folder(page_url)
+    # Incremental runs revisit pages saved by earlier runs in the same folder, and a resumed
+    # run redoes the pages that were not done at the last checkpoint, including pages
+    # exported after it
+    if not INCREMENTAL and os.path.exists(os.path.join(page_folder, "index.html")):
+        if not resuming_crawl or crawl_frontier.state(page_url) == "done":
+            return False
+    return crawl_frontier.claim_page_folder(page_folder)
+
+def render_page_bs4(html, page_url):
+    """Parse, extract and rewrite a page with BeautifulSoup (parse, rewrite, re-parse, prettify)"""
+    started = time.perf_counter()
+    soup = BeautifulSoup(html, "html.parser")
+    assets = []
+    timings = {"parse": time.perf_counter() - started}
+
+    # Links must be collected before the document is rewritten
+    internal_links = get_all_internal_links(soup, page_url)
+
+    # Extract WordPress data
+    page_data = extract_wordpress_data(soup, page_url)
+    
+    # Determine if it's a post or page
+    is_post = bool(soup.find("article", {"class": "post"}))
+    timings["extract"] = time.perf_counter() - started - timings["parse"]
+
+    # Process CSS
+    for link in soup.find_all("link", rel="stylesheet"):
+        if "href" in link.attrs:
+            css_url = add_local_asset(assets, urljoin(page_url, link["href"]))
+            if css_url:
+                link["href"] = css_url
+
+    # Process JS
+    for script in soup.find_all("script", src=True):
+        if "src" in script.attrs:
+            js_url = add_local_asset(assets, urljoin(page_url, script["src"]))
+            if js_url:
+                script["src"] = js_url
+
+    # Process Images
+    for img in soup.find_all("img", src=True):
+        if "src" in img.attrs:
+            img_url = add_local_asset(assets, urljoin(page_url, img["src"]), "media")
+            if img_url:
+                img["src"] = img_url
+    
+    # Process srcset images
+    process_srcset_images(soup, page_url, assets)
+    if IMAGE_FORMATS:
+        wrap_images_in_picture(soup)
+
+    # Replace all domain URLs with url_to_replace in one shot
+    soup = replace_domain_urls(soup, page_url)
+    html = serialize_soup(soup)
+    timings["rewrite"] = time.perf_counter() - started - timings["parse"] - timings["extract"]
+
+    return {
+        "html": html,
+        "data": page_data,
+        "content_type": "posts" if is_post else "pages",
+        "links": internal_links,
+        "assets": assets,
+        "timings": timings
+    }
+
+# Whitespace as defined by HTML; unlike \s it leaves non-breaking spaces alone
+HTML_WHITESPACE = re.compile(r"[ \t\n\r\f]+")
+
+# Elements whose content is written exactly as it is in compact and minify output
+PRESERVE_WHITESPACE_TAGS = ("pre", "textarea", "script", "style")
+
+def is_javascript(script_type):
+    """Return True if a <script type> holds JavaScript (not JSON, templates or other data blocks)"""
+    return not script_type or script_type.lower() in ("text/javascript", "application/javascript", "module")
+
+def minify_inline_code(tag_name, code, script_type=None):
+    """Minify the content of an inline <style> or <script> when rcssmin/rjsmin is installed"""
+    if tag_name == "style" and rcssmin is not None:
+        return rcssmin.cssmin(code)
+    if tag_name == "script" and rjsmin is not None and is_javascript(script_type):
+        return rjsmin.jsmin(code)
+    return code
+
+def serialize_soup(soup):
+    """Serialise a rewritten page in the HTML_OUTPUT layout"""
+    if HTML_OUTPUT not in ("compact", "minify"):
+        return soup.prettify()
+    minify = HTML_OUTPUT == "minify"
+
+    preserved = {id(string) for tag in soup.find_all(PRESERVE_WHITESPACE_TAGS) for string in tag.find_all(string=True)}
+    for string in soup.find_all(string=True):
+        if isinstance(string, Comment):
+            # Conditional comments are markup for old browsers, not comments
+            if minify and not string.startswith("[if"):
+                string.extract()
+        elif type(string) is NavigableString and id(string) not in preserved:
+            if string.parent.name in ("[document]", "html", "head") and not string.strip():
+                string.extract()
+            else:
+                collapsed = HTML_WHITESPACE.sub(" ", string)
+                if collapsed != string:
+                    string.replace_with(NavigableString(collapsed))
+
+    if minify:
+        for tag in soup.find_all(("style", "script")):
+            if tag.string and not tag.get("src"):
+                tag.string.replace_with(type(tag.string)(minify_inline_code(tag.name, tag.string, tag.get("type"))))
+    return str(soup)
+
+def parse_html_lxml(html):
+    """Parse an HTML document into an lxml tree"""
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+
+def find_by_class_lxml(element, tag, class_name):
+    """Return the first descendant with the given tag and CSS class, like soup.find(tag, {"class": ...})"""
+    for match in element.iterdescendants(tag):
+        if class_name in (match.get("class") or "").split():
+            return match
+    return None
+
+def get_text_lxml(element):
+    """Join the stripped text of an element with spaces, like BeautifulSoup's get_text(" ", strip=True)"""
+    texts = element.xpath(".//text()[not(parent::script) and not(parent::style)]")
+    return " ".join(stripped for text in texts if (stripped := text.strip()))
+
+def extract_wordpress_data_lxml(doc, url):
+    """Extract WordPress-specific data from an lxml tree (same fields as extract_wordpress_data)"""
+    data = {
+        "url": url,
+        "title": "",
+        "content": "",
+        "excerpt": "",
+        "categories": [],
+        "tags": [],
+        "author": "",
+        "date": "",
+        "modified_date": "",
+        "featured_image": "",
+        "meta": {}
+    }
+
+    # Extract title
+    title = doc.find(".//title")
+    if title is not None and title.text:
+        data["title"] = title.text.strip()
+
+    # Extract meta description, author, dates and featured image
+    metas = {}
+    for meta in doc.iter("meta"):
+        key = meta.get("name") or meta.get("property")
+        if key and key not in metas:
+            metas[key] = meta.get("content", "")
+    if "description" in metas:
+        data["meta"]["description"] = metas["description"]
+    data["author"] = metas.get("author", "")
+    data["date"] = metas.get("article:published_time", "")
+    data["modified_date"] = metas.get("article:modified_time", "")
+    data["featured_image"] = metas.get("og:image", "")
+
+    # Extract categories and tags
+    for term in doc.xpath('//a[@rel="category tag"]'):
+        rel = term.get("rel").split()
+        if "category" in rel:
+            data["categories"].append(term.text_content().strip())
+        if "tag" in rel:
+            data["tags"].append(term.text_content().strip())
+
+    # Extract main content
+    content_div = find_by_class_lxml(doc, "div", "entry-content")
+    if content_div is None:
+        content_div = doc.find(".//article")
+    if content_div is not None:
+        data["content"] = get_text_lxml(content_div)
+        # Try to get excerpt
+        excerpt = find_by_class_lxml(content_div, "div", "entry-summary")
+        if excerpt is not None:
+            data["excerpt"] = get_text_lxml(excerpt)
+
+    return data
+
+def remove_lxml_node(node):
+    """Remove a node from an lxml tree, keeping the text that follows it"""
+    parent = node.getparent()
+    if node.tail:
+        previous = node.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + node.tail
+        else:
+            parent.text = (parent.text or "") + node.tail
+    parent.remove(node)
+
+def compact_lxml(element, minify, preserve=False):
+    """Collapse whitespace in an lxml tree outside PRESERVE_WHITESPACE_TAGS, like serialize_soup()"""
+    preserve = preserve or element.tag in PRESERVE_WHITESPACE_TAGS
+    if element.text and not preserve:
+        element.text = "" if element.tag in ("html", "head") and not element.text.strip() else HTML_WHITESPACE.sub(" ", element.text)
+    if minify and element.tag in ("style", "script") and element.text and not element.get("src"):
+        element.text = minify_inline_code(element.tag, element.text, element.get("type"))
+
+    for child in list(element):
+        if child.tail and not preserve:
+            child.tail = "" if element.tag in ("html", "head") and not child.tail.strip() else HTML_WHITESPACE.sub(" ", child.tail)
+        if child.tag is lxml.etree.Comment:
+            if minify and not (child.text or "").startswith("[if"):
+                remove_lxml_node(child)
+        elif isinstance(child.tag, str):
+            compact_lxml(child, minify, preserve)
+
+def render_page_lxml(html, page_url):
+    """Parse, extract and rewrite a page in a single pass over an lxml tree
+
+    Links, asset URLs and domain URLs in attributes and text are all rewritten in one walk
+    over the document, which is then serialised once without re-parsing or pretty-printing.
+    """
+    started = time.perf_counter()
+    doc = parse_html_lxml(html)
+    assets = []
+    internal_links = set()
+    images = []
+    timings = {"parse": time.perf_counter() - started}
+
+    # Extract WordPress data before the document is rewritten
+    page_data = extract_wordpress_data_lxml(doc, page_url)
+    is_post = find_by_class_lxml(doc, "article", "post") is not None
+    timings["extract"] = time.perf_counter() - started - timings["parse"]
+
+    for element in doc.iter():
+        tag = element.tag
+        if isinstance(tag, str):
+            if tag == "a":
+                absolute_url = get_internal_link(element.get("href"), page_url)
+                if absolute_url:
+                    internal_links.add(absolute_url)
+            elif tag == "link" and element.get("href") and "stylesheet" in (element.get("rel") or "").split():
+                css_url = add_local_asset(assets, urljoin(page_url, element.get("href")))
+                if css_url:
+                    element.set("href", css_url)
+            elif tag == "script" and element.get("src"):
+                js_url = add_local_asset(assets, urljoin(page_url, element.get("src")))
+                if js_url:
+                    element.set("src", js_url)
+            elif tag == "img":
+                if element.get("src"):
+                    img_url = add_local_asset(assets, urljoin(page_url, element.get("src")), "media")
+                    if img_url:
+                        element.set("src", img_url)
+                if element.get("srcset"):
+                    new_srcset = rewrite_srcset(element.get("srcset"), page_url, assets)
+                    if new_srcset:
+                        element.set("srcset", new_srcset)
+                images.append(element)
+
+            # Replace domain URLs in every attribute
+            for name, value in element.attrib.items():
+                new_value = replace_domain_text(value)
+                if new_value != value:
+                    element.set(name, new_value)
+
+        # Replace domain URLs in text, inline scripts, styles and comments
+        if element.text:
+            element.text = replace_domain_text(element.text)
+        if element.tail:
+            element.tail = replace_domain_text(element.tail)
+
+    if IMAGE_FORMATS:
+        wrap_images_in_picture_lxml(images)
+    if HTML_OUTPUT in ("compact", "minify"):
+        compact_lxml(doc, HTML_OUTPUT == "minify")
+
+    doctype = doc.getroottree().docinfo.doctype
+    html = lxml.html.tostring(doc, encoding="unicode", doctype=doctype)
+    timings["rewrite"] = time.perf_counter() - started - timings["parse"] - timings["extract"]
+    return {
+        "html": html,
+        "data": page_data,
+        "content_type": "posts" if is_post else "pages",
+        "links": internal_links,
+        "assets": assets,
+        "timings": timings
+    }
+
+def render_page(html, page_url):
+    """Render a page with the configured HTML_ENGINE
+
+    Returns a dict with the rewritten "html", the extracted "data" record, its
+    "content_type", the internal "links", the "assets" to download and the "timings"
+    of the parse, extract and rewrite phases. Rendering has no
+    side effects, so it is safe to run anywhere.
+    """
+    if HTML_ENGINE == "lxml":
+        return render_page_lxml(html, page_url)
+    return render_page_bs4(html, page_url)
+
+def get_page_links(html, page_url):
+    """Return the internal links of a page using the configured HTML_ENGINE"""
+    if HTML_ENGINE == "lxml":
+        doc = parse_html_lxml(html)
+        links = (get_internal_link(link.get("href"), page_url) for link in doc.iter("a"))
+        return {link for link in links if link}
+    return get_all_internal_links(BeautifulSoup(html, "html.parser"), page_url)
+
+def decode_html(content, encoding):
+    """Decode a page body with the charset requests found for the response"""
+    return content.decode(encoding or "utf-8", errors="replace")
+
+def render_and_write_page(content, encoding, page_url):
+    """Render a page and write its HTML, returning the result of render_page() without the HTML
+
+    The "hash" of the written HTML is added instead, so only a compact message has to
+    travel back when this runs in a render worker process.
+    """
+    result = render_page(decode_html(content, encoding), page_url)
+    html = result.pop("html")
+    result["bytes_fetched"] = len(content)
+
+    # Save Modified HTML
+    started = time.perf_counter()
+    page_folder = get_page_folder(page_url)
+    os.makedirs(page_folder, exist_ok=True)
+    with open(os.path.join(page_folder, "index.html"), "w", encoding="utf-8") as file:
+        file.write(html)
+    result["timings"]["write"] = time.perf_counter() - started
+
+    html_bytes = html.encode("utf-8")
+    result["bytes_written"] = len(html_bytes)
+    result["hash"] = hashlib.sha1(html_bytes).hexdigest()
+    return result
+
+def get_page_links_from_content(content, encoding, page_url):
+    """Decode a page body and return its internal links"""
+    return get_page_links(decode_html(content, encoding), page_url)
+
+def start_render_pool():
+    """Start the render worker processes when PARSE_WORKERS is set"""
+    global render_pool
+    if PARSE_WORKERS > 0:
+        # Workers read their configuration from the environment; make sure they write into this export folder
+        os.environ["EXPORT_FOLDER"] = export_folder
+        render_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=process_context,
+                                          initializer=configure_worker_logging)
+        logging.info(f"Started {PARSE_WORKERS} render worker processes")
+
+def stop_render_pool():
+    """Shut the render worker processes down"""
+    if render_pool is not None:
+        render_pool.shutdown(wait=True)
+
+def run_render_task(function, *args):
+    """Run a CPU-bound parse task in the render pool if there is one, otherwise in the calling thread"""
+    if render_pool is None:
+        return function(*args)
+    return render_pool.submit(function, *args).result()
+
+def record_page(page_url, result):
+    """Merge a rendered page into the export: queue its assets and record its data and stats
+
+    Returns the paths of the assets the page references.
+    """
+    for asset_url, asset_path, file_type in result["assets"]:
+        schedule_asset_download(asset_url, os.path.join(export_folder, asset_path), file_type)
+
+    page_data = result["data"]
+    add_content_item(result["content_type"], page_data)
+    add_terms(page_data["categories"], page_data["tags"])
+    if result["content_type"] == "posts":
+        increment_stat("posts_found")
+
+    increment_stat("pages_processed")
+    increment_stat("html_bytes_fetched", result["bytes_fetched"])
+    increment_stat("html_bytes_written", result["bytes_written"])
+    increment_stat("html_bytes_saved", result["bytes_fetched"] - result["bytes_written"])
+    for phase, seconds in result["timings"].items():
+        record_timing(phase, seconds, result["bytes_written"] if phase == "write" else result["bytes_fetched"])
+    logging.info(f"Page exported: {os.path.join(get_page_folder(page_url), 'index.html')}")
+    return [asset_path for _, asset_path, _ in result["assets"]]
+
+def page_unchanged_in_sitemap(page_url, previous):
+    """Return True if the sitemap <lastmod> of a page matches the one recorded by the last export"""
+    lastmod = crawl_frontier.get_sitemap_lastmod(page_url)
+    return bool(lastmod) and lastmod == previous.get("lastmod")
+
+def record_page_links(page_url, links):
+    """Record the internal links found on a parsed page in the link graph, when one is open"""
+    if link_graph is not None:
+        link_graph.add_links(page_url, {canonicalize_url(url) for url in links})
+
+def keep_previous_page(page_url, previous):
+    """Carry a page exported by an earlier run over into this run's export, manifest and link graph"""
+    set_manifest_entry("pages", page_url, previous)
+    # The page is not parsed again, so its links are those of the previous run
+    if link_graph is not None:
+        link_graph.keep_links(page_url)
+    for asset_path in previous.get("assets", []):
+        keep_previous_asset(asset_path)
+
+    # Re-use the page's record from the previous export
+    content_type, page_data = read_previous_record(page_url)
+    add_content_item(content_type, page_data)
+    add_terms(page_data.get("categories", []), page_data.get("tags", []))
+    if content_type == "posts":
+        increment_stat("posts_found")
+    increment_stat("pages_unchanged")
+
+def process_page(page_url):
+    """Process a single page, save it to the export folder and return the internal links found on it
+
+    Returns None if the page could not be fetched or processed. The previous export of a
+    page that fails for any other reason than 404/410 is kept, so an outage during an
+    incremental run never deletes pages.
+    """
+    previous = None
+    try:
+        # Skip if not from target domain
+        if not is_target_host(urlparse(page_url).netloc):
+            logging.info(f"Skipping external page: {page_url}")
+            return set()
+
+        # Check if the page has already been processed
+        if not claim_page_folder(page_url):
+            logging.info(f"Page already processed, skipping: {page_url}")
+            return set()
+
+        # Pages exported by the previous incremental run are only re-rendered when they changed
+        if (INCREMENTAL and crawl_frontier.get_previous_record(page_url)
+                and os.path.exists(os.path.join(get_page_folder(page_url), "index.html"))):
+            previous = crawl_frontier.get_manifest_entry("pages", page_url, previous=True)
+        if previous and page_unchanged_in_sitemap(page_url, previous):
+            logging.info(f"Page unchanged in sitemap since last export, skipping: {page_url}")
+            keep_previous_page(page_url, previous)
+            return set()
+
+        logging.info(f"Processing page: {page_url}")
+        response = http_get(page_url, headers=conditional_headers(previous))
+        if response.status_code == 304 and previous:
+            logging.info(f"Page not modified since last export, skipping: {page_url}")
+            keep_previous_page(page_url, previous)
+            return set()
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch {page_url}: {response.status_code}")
+            # Keep the previous export of a page that is temporarily unavailable
+            if previous and response.status_code not in (404, 410):
+                keep_previous_page(page_url, previous)
+            return None
+
+        result = run_render_task(render_and_write_page, response.content, response.encoding, page_url)
+        internal_links = result["links"]
+        record_page_links(page_url, internal_links)
+    except Exception as e:
+        logging.error(f"Error processing page {page_url}: {e}")
+        increment_stat("errors")
+        # Connection errors and timeouts (after the retries) are transient too
+        if previous and crawl_frontier.get_manifest_entry("pages", page_url) is None:
+            keep_previous_page(page_url, previous)
+        return None
+
+    try:
+        asset_paths = record_page(page_url, result)
+        set_manifest_entry("pages", page_url, {
+            "path": os.path.relpath(os.path.join(get_page_folder(page_url), "index.html"), export_folder),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "lastmod": crawl_frontier.get_sitemap_lastmod(page_url),
+            "hash": result["hash"],
+            "assets": sorted(set(asset_paths))
+        })
+    except Exception as e:
+        logging.error(f"Error processing page {page_url}: {e}")
+        increment_stat("errors")
+    return internal_links
+
+def crawl_and_export():
+    """Crawl the site from the sitemap, exporting every page in the same pass that discovers its links"""
+    # Get links from the sitemap
+    sitemap_link_count = read_sitemap(sitemap_url)
+    logging.info(f"Found {sitemap_link_count} links in sitemap")
+    
+    # Pages of the previous incremental run are revisited even when no changed page links to them
+    previous_pages = (url for url, _ in crawl_frontier.iter_manifest("pages", previous=True))
+    return run_crawl(chain(crawl_frontier.iter_sitemap_links(), previous_pages), process_page)
+
+def iter_sitemap_chunks(response):
+    """Yield the body of a streamed sitemap response in chunks, gunzipping .xml.gz sitemaps on the fly"""
+    # requests undoes Content-Encoding: gzip; a gzipped sitemap file is still gzipped after that
+    decompressor = None
+    for chunk in response.iter_content(65536):
+        if decompressor is None:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(b"\x1f\x8b") else False
+        yield decompressor.decompress(chunk) if decompressor else chunk
+
+def iter_sitemap_elements(response):
+    """Parse a streamed sitemap response while it is downloaded, yielding (root, element) for every closed element"""
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    for chunk in iter_sitemap_chunks(response):
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if root is None:
+                root = elem
+            if event == "end":
+                yield root, elem
+    parser.close()
+
+def parse_priority(value):
+    """Parse a sitemap <priority>, returning None if it is missing or invalid"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_sitemap(sitemap_url):
+    """Fetch one sitemap and parse it incrementally while it is downloaded
+
+    Returns (entries, child_sitemaps): a dict with the loc, lastmod, changefreq and
+    priority of every <url>, and the locs of the sitemaps listed by a sitemap index.
+    Parsed elements are cleared as they are read, so memory does not grow with the
+    size of the sitemap.
+    """
+    entries = []
+    child_sitemaps = []
+    started = time.perf_counter()
+    with http_get(sitemap_url, stream=True) as response:
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch sitemap: {sitemap_url}")
+            return entries, child_sitemaps
+
+        fields = {}
+        for root, elem in iter_sitemap_elements(response):
+            if not elem.tag.startswith(SITEMAP_NAMESPACE):
+                continue
+            tag = elem.tag[len(SITEMAP_NAMESPACE):]
+            if tag in ("loc", "lastmod", "changefreq", "priority"):
+                fields[tag] = (elem.text or "").strip()
+            elif tag in ("url", "sitemap"):
+                loc = fields.get("loc")
+                if loc and (tag == "sitemap" or loc.endswith((".xml", ".xml.gz"))):
+                    child_sitemaps.append(loc)
+                elif loc:
+                    entries.append({
+                        "loc": loc,
+                        "lastmod": fields.get("lastmod") or None,
+                        "changefreq": fields.get("changefreq") or None,
+                        "priority": parse_priority(fields.get("priority"))
+                    })
+                fields = {}
+                # Drop the entries read so far from the tree
+                root.clear()
+    record_timing("sitemap", time.perf_counter() - started, response.raw.tell())
+    return entries, child_sitemaps
+
+def get_entry_priority(entry):
+    """Return the <priority> of a sitemap entry, 0.5 (the sitemap default) when it is omitted"""
+    return 0.5 if entry["priority"] is None else entry["priority"]
+
+def read_sitemap(sitemap_url):
+    """Record the entries of every URL listed by a sitemap or sitemap index and return their number
+
+    Child sitemaps are fetched and parsed concurrently by SITEMAP_WORKERS threads. Entries
+    are stored in the crawl frontier as each sitemap is parsed; its iter_sitemap_links()
+    yields them with the highest <priority> first (0.5 when omitted), most recently
+    modified first within the same priority.
+    """
+    frontier = crawl_frontier or open_crawl_frontier()
+    entry_count = 0
+    seen_sitemaps = {sitemap_url}
+    with ThreadPoolExecutor(max_workers=SITEMAP_WORKERS, thread_name_prefix="sitemap",
+                            initializer=start_thread_profiler) as executor:
+        pending = {}
+        if is_target_host(urlparse(sitemap_url).netloc):
+            pending[executor.submit(parse_sitemap, sitemap_url)] = sitemap_url
+        else:
+            logging.info(f"Skipping external sitemap: {sitemap_url}")
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    sitemap_entries_found, child_sitemaps = future.result()
+                except Exception as e:
+                    logging.error(f"Error processing sitemap {url}: {e}")
+                    continue
+                # Recorded so incremental exports can skip pages whose <lastmod> did not change
+                frontier.add_sitemap_entries(sitemap_entries_found)
+                entry_count += len(sitemap_entries_found)
+
+                for child_url in child_sitemaps:
+                    if child_url in seen_sitemaps:
+                        continue
+                    seen_sitemaps.add(child_url)
+                    # Skip if not from target domain
+                    if not is_target_host(urlparse(child_url).netloc):
+                        logging.info(f"Skipping external sitemap: {child_url}")
+                        continue
+                    pending[executor.submit(parse_sitemap, child_url)] = child_url
+
+    frontier.commit()
+    logging.info(f"Read {entry_count} entries from {len(seen_sitemaps)} sitemaps")
+    return entry_count
+
+def get_crawl_priorities(urls):
+    """Return the crawl priority of the URLs listed in the sitemap, keyed by URL
+
+    Other URLs, found only through links, get priority 0 and are crawled after them.
+    """
+    return crawl_frontier.get_sitemap_priorities(urls)
+
+def load_previous_export(resume=False):
+    """Load the manifest and content records of the previous export in the same folder"""
+    manifest_path = os.path.join(export_folder, "export_manifest.json")
+    if not os.path.exists(manifest_path):
+        logging.info("No previous export manifest found, exporting everything")
+        return
+
+    crawl_frontier.load_previous_manifest(iter_manifest_file(manifest_path))
+
+    # Keep the previous streaming export aside; unchanged records are copied from it by offset.
+    # A resumed run already moved it aside before it was interrupted.
+    stream_path = os.path.join(export_folder, EXPORT_STREAM_FILE)
+    index_path = os.path.join(export_folder, EXPORT_INDEX_FILE)
+    if resume and os.path.exists(f"{index_path}.previous"):
+        crawl_frontier.load_previous_records(f"{index_path}.previous")
+    elif os.path.exists(stream_path) and os.path.exists(index_path):
+        os.replace(stream_path, f"{stream_path}.previous")
+        os.replace(index_path, f"{index_path}.previous")
+        crawl_frontier.load_previous_records(f"{index_path}.previous")
+
+    logging.info(f"Loaded previous export: {crawl_frontier.count_manifest('pages', previous=True)} pages, "
+                 f"{crawl_frontier.count_manifest('assets', previous=True)} assets")
+
+def iter_manifest_file(manifest_path):
+    """Yield (kind, key, entry) for every entry of an export_manifest.json without loading it whole
+
+    The manifest is a {kind: {key: entry}} object. Its keys and entries are decoded one at
+    a time with JSONDecoder.raw_decode(), reading more of the file when one is incomplete.
+    """
+    decoder = json.JSONDecoder()
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+
+        def next_char():
+            """Skip whitespace and separators and return the next character"""
+            nonlocal buffer, position
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,:":
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                buffer, position = f.read(1 << 16), 0
+                if not buffer:
+                    raise ValueError(f"Unexpected end of {manifest_path}")
+
+        def decode():
+            """Decode the JSON value at the current position"""
+            nonlocal buffer, position
+            next_char()
+            while True:
+                try:
+                    value, position = decoder.raw_decode(buffer, position)
+                    return value
+                except json.JSONDecodeError:
+                    chunk = f.read(1 << 16)
+                    if not chunk:
+                        raise
+                    buffer, position = buffer[position:] + chunk, 0
+
+        if next_char() != "{":
+            raise ValueError(f"{manifest_path} is not a JSON object")
+        position += 1
+        while next_char() != "}":
+            kind = decode()
+            if next_char() != "{":
+                raise ValueError(f"{kind} of {manifest_path} is not a JSON object")
+            position += 1
+            while next_char() != "}":
+                key = decode()
+                yield kind, key, decode()
+            position += 1
+
+def save_manifest():
+    """Save the export manifest and the list of paths added, modified and removed since the last run
+
+    Both files are written entry by entry from the crawl frontier, so they are never held in memory.
+    """
+    crawl_frontier.commit()
+    change_counts = {}
+    changes_path = os.path.join(export_folder, "export_changes.json")
+    with open(changes_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for change in ("added", "modified", "removed"):
+            f.write(f'{"," if change_counts else ""}\n    "{change}": [')
+            change_counts[change] = 0
+            paths = crawl_frontier.iter_manifest_changes(change) if change != "removed" or INCREMENTAL else ()
+            for path in paths:
+                f.write(("," if change_counts[change] else "") + "\n        " + json.dumps(path))
+                change_counts[change] += 1
+                if change == "removed":
+                    remove_stale_file(path)
+            f.write("\n    ]" if change_counts[change] else "]")
+        f.write("\n}")
+
+    # Outside incremental mode, entries of skipped existing files are kept for the next run
+    if not INCREMENTAL:
+        crawl_frontier.keep_previous_manifest()
+        crawl_frontier.commit()
+
+    manifest_path = os.path.join(export_folder, "export_manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        f.write("{")
+        for kind in ("pages", "assets"):
+            f.write(f'{"," if kind == "assets" else ""}\n    "{kind}": {{')
+            count = 0
+            for key, entry in crawl_frontier.iter_manifest(kind):
+                f.write(("," if count else "") + f"\n        {json.dumps(key)}: {indent_json(entry, 2)}")
+                count += 1
+            f.write("\n    }" if count else "}")
+        f.write("\n}")
+    logging.info(f"Changes since last export: {change_counts['added']} added, {change_counts['modified']} modified, "
+                 f"{change_counts['removed']} removed")
+
+def remove_stale_file(path):
+    """Delete a page or asset that is no longer part of the site, with its compressed and image variants"""
+    file_path = os.path.join(export_folder, path)
+    if not os.path.exists(file_path):
+        return
+    os.remove(file_path)
+    logging.info(f"Removed stale file: {file_path}")
+    for suffix in (".gz", ".br", ".webp", ".avif"):
+        if os.path.exists(file_path + suffix):
+            os.remove(file_path + suffix)
+    # Clean up folders left empty, stopping at the first non-empty one
+    try:
+        os.removedirs(os.path.dirname(file_path))
+    except OSError:
+        pass
+
+def indent_json(value, level):
+    """Serialise a value the way json.dump(indent=4) would at the given nesting level"""
+    return json.dumps(value, indent=4).replace("\n", "\n" + "    " * level)
+
+def get_latest_records():
+    """Return the content type, offset and length of the latest streamed record of every media file and page folder"""
+    index_path = os.path.join(export_folder, EXPORT_INDEX_FILE)
+    latest_records = {}
+    if os.path.exists(index_path):
+        for key, record in load_export_index(index_path).items():
+            if record[0] != "media":
+                key = get_page_folder(key)
+            if key not in latest_records or record[1] > latest_records[key][1]:
+                latest_records[key] = record
+    return latest_records
+
+def iter_streamed_records(content_type, latest_records):
+    """Yield the records of one content type from the streaming export, one at a time
+
+    Only the latest record of each media file and page folder is yielded: a resumed run
+    re-exports the pages that were interrupted, which may already have a record, possibly
+    under another URL of the same page. Records are yielded in order of their page folder
+    or media path, not in the order the threads exported them, so the output of two runs
+    of the same site is identical.
+    """
+    stream_path = os.path.join(export_folder, EXPORT_STREAM_FILE)
+    if not os.path.exists(stream_path):
+        return
+    records = sorted((key, offset, length) for key, (record_type, offset, length) in latest_records.items()
+                     if record_type == content_type)
+    with open(stream_path, "rb") as stream:
+        for _, offset, length in records:
+            stream.seek(offset)
+            yield json.loads(stream.read(length))["data"]
+
+def write_streamed_records(f, content_type, latest_records):
+    """Copy the records of one content type from the streaming export into a JSON array
+
+    Returns the number of records.
+    """
+    f.write("[")
+    count = 0
+    for data in iter_streamed_records(content_type, latest_records):
+        f.write(",\n" if count else "\n")
+        f.write("            " + indent_json(data, 3))
+        count += 1
+    f.write("\n        ]" if count else "]")
+    return count
+
+def save_wordpress_export():
+    """Save the complete WordPress export data
+
+    wordpress_export.json is assembled record by record from the streaming export, so
+    memory use does not grow with the size of the site.
+    """
+    close_export_stream()
+    latest_records = get_latest_records()
+    
+    # Save the complete WordPress export
+    export_path = os.path.join(export_folder, "wordpress_export.json")
+    with open(export_path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        f.write(f'    "site_info": {indent_json(wordpress_data["site_info"], 1)},\n')
+        f.write('    "content": {\n')
+        counts = {}
+        for content_type in ("pages", "posts"):
+            f.write(f'        "{content_type}": ')
+            counts[content_type] = write_streamed_records(f, content_type, latest_records)
+            f.write(",\n")
+        # Count the posts actually exported, without pages a resumed run exported twice
+        stats["posts_found"] = counts["posts"]
+        # Convert sets to lists for JSON serialization
+        f.write(f'        "categories": {indent_json(sorted(wordpress_data["content"]["categories"]), 2)},\n')
+        f.write(f'        "tags": {indent_json(sorted(wordpress_data["content"]["tags"]), 2)},\n')
+        f.write('        "media": ')
+        write_streamed_records(f, "media", latest_records)
+        f.write(',\n        "menus": []\n    }\n}')
+    
+    # The previous run's streaming export is no longer needed once this one is complete
+    for file_name in (EXPORT_STREAM_FILE, EXPORT_INDEX_FILE):
+        previous_path = os.path.join(export_folder, f"{file_name}.previous")
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+
+def stem_search_term(word):
+    """Strip the first matching SEARCH_STEM_RULES suffix, keeping at least SEARCH_MIN_STEM_LENGTH characters"""
+    for suffix, replacement in SEARCH_STEM_RULES:
+        if word.endswith(suffix):
+            if len(word) - len(suffix) >= SEARCH_MIN_STEM_LENGTH:
+                return word[:-len(suffix)] + replacement
+            return word
+    return word
+
+def tokenize_search_text(text):
+    """Return the index terms of a text: lowercased, accents removed, stopwords dropped, stemmed"""
+    text = SEARCH_COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return [stem_search_term(token) for token in SEARCH_TOKEN_PATTERN.findall(text)
+            if len(token) > 1 and token not in SEARCH_STOPWORDS]
+
+def get_search_document(content_type, data):
+    """Return what the search client shows of a page or post"""
+    excerpt = data.get("excerpt") or data.get("meta", {}).get("description") or data.get("content", "")
+    return {
+        "url": urlparse(data["url"]).path or "/",
+        "title": data.get("title", ""),
+        "excerpt": excerpt[:SEARCH_EXCERPT_LENGTH],
+        "type": content_type,
+        "date": data.get("date", "")
+    }
+
+def write_search_block(postings, path):
+    """Write in-memory postings as a block file of [term, postings] lines sorted by term"""
+    with open(path, "w", encoding="utf-8") as f:
+        for term in sorted(postings):
+            f.write(json.dumps([term, postings[term]], separators=(",", ":")) + "\n")
+
+def iter_search_block(path):
+    """Yield the (term, postings) pairs of a block file"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def write_search_shard(folder, prefix, terms):
+    """Write the postings of the terms sharing a prefix to their shard file"""
+    with open(os.path.join(folder, "terms", f"{prefix}.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f, separators=(",", ":"), ensure_ascii=False)
+
+def build_search_index():
+    """Build the client-side search index of the exported pages and posts in search/
+
+    The index is built SPIMI-style: pages are read one at a time from the streaming export,
+    their postings ([document id, weighted term frequency]) are collected in memory and
+    written out as a sorted block whenever SEARCH_BLOCK_POSTINGS is reached, and the blocks
+    are merged into one shard file per term prefix. Memory use is bounded by the block size
+    and the largest shard, whatever the size of the site. Documents (URL, title, excerpt)
+    are written SEARCH_DOCS_PER_FILE per file. The finished index replaces the previous one
+    in one step.
+    """
+    search_folder = os.path.join(export_folder, SEARCH_FOLDER)
+    build_folder = f"{search_folder}.build"
+    if os.path.exists(build_folder):
+        shutil.rmtree(build_folder)
+    for subfolder in ("terms", "docs", "blocks"):
+        os.makedirs(os.path.join(build_folder, subfolder))
+
+    latest_records = get_latest_records()
+    postings = {}
+    posting_count = 0
+    blocks = []
+    documents = []
+    document_count = 0
+    for content_type in ("pages", "posts"):
+        for data in iter_streamed_records(content_type, latest_records):
+            weights = Counter()
+            for field, weight in SEARCH_FIELD_WEIGHTS:
+                value = data.get(field) or ""
+                for term in tokenize_search_text(" ".join(value) if isinstance(value, list) else value):
+                    weights[term] += weight
+            for term, weight in weights.items():
+                postings.setdefault(term, []).append([document_count, weight])
+            posting_count += len(weights)
+            documents.append(get_search_document(content_type, data))
+            document_count += 1
+
+            if len(documents) == SEARCH_DOCS_PER_FILE:
+                with open(os.path.join(build_folder, "docs", f"{document_count // SEARCH_DOCS_PER_FILE - 1}.json"),
+                          "w", encoding="utf-8") as f:
+                    json.dump(documents, f, separators=(",", ":"), ensure_ascii=False)
+                documents = []
+            if posting_count >= SEARCH_BLOCK_POSTINGS:
+                blocks.append(os.path.join(build_folder, "blocks", f"{len(blocks)}.ndjson"))
+                write_search_block(postings, blocks[-1])
+                postings = {}
+                posting_count = 0
+    if documents:
+        with open(os.path.join(build_folder, "docs", f"{document_count // SEARCH_DOCS_PER_FILE}.json"),
+                  "w", encoding="utf-8") as f:
+            json.dump(documents, f, separators=(",", ":"), ensure_ascii=False)
+    if postings:
+        blocks.append(os.path.join(build_folder, "blocks", f"{len(blocks)}.ndjson"))
+        write_search_block(postings, blocks[-1])
+        postings = {}
+
+    # Blocks hold consecutive document ids, so concatenating postings keeps them sorted
+    shard_count = 0
+    term_count = 0
+    prefix, terms = None, {}
+    for term, term_postings in heapq.merge(*(iter_search_block(path) for path in blocks), key=lambda item: item[0]):
+        if term[:SEARCH_PREFIX_LENGTH] != prefix:
+            if terms:
+                write_search_shard(build_folder, prefix, terms)
+                shard_count += 1
+            prefix, terms = term[:SEARCH_PREFIX_LENGTH], {}
+        if term not in terms:
+            term_count += 1
+        terms.setdefault(term, []).extend(term_postings)
+    if terms:
+        write_search_shard(build_folder, prefix, terms)
+        shard_count += 1
+    shutil.rmtree(os.path.join(build_folder, "blocks"))
+
+    with open(os.path.join(build_folder, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1,
+            "documents": document_count,
+            "terms": term_count,
+            "docs_per_file": SEARCH_DOCS_PER_FILE,
+            "prefix_length": SEARCH_PREFIX_LENGTH,
+            "min_stem_length": SEARCH_MIN_STEM_LENGTH,
+            "stem_rules": SEARCH_STEM_RULES,
+            "stopwords": sorted(SEARCH_STOPWORDS)
+        }, f, indent=4)
+    if os.path.exists(SEARCH_CLIENT_FILE):
+        shutil.copyfile(SEARCH_CLIENT_FILE, os.path.join(build_folder, "search.js"))
+
+    # Swap the new index in, so the previous one is served until this one is complete
+    if os.path.exists(search_folder):
+        os.replace(search_folder, f"{search_folder}.old")
+    os.replace(build_folder, search_folder)
+    if os.path.exists(f"{search_folder}.old"):
+        shutil.rmtree(f"{search_folder}.old")
+    logging.info(f"Search index: {document_count} documents, {term_count} terms in {shard_count} shards, "
+                 f"built from {len(blocks)} blocks")
+
+def save_statistics():
+    """Save the export statistics"""
+    effective_request_rate = get_effective_request_rate()
+    if effective_request_rate is not None:
+        stats["effective_request_rate"] = round(effective_request_rate, 2)
+    # Merged and resumed exports keep the peak of the runs before
+    stats["peak_rss_mb"] = max(stats["peak_rss_mb"], get_peak_rss_mb())
+    if resource is not None:
+        stats["peak_rss_workers_mb"] = max(stats["peak_rss_workers_mb"], get_peak_rss_mb(resource.RUSAGE_CHILDREN))
+    stats_path = os.path.join(export_folder, "export_statistics.json")
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=4)
+
+def get_phase_report(metrics):
+    """Return the JSON report of a phase, with cumulative histogram buckets like Prometheus"""
+    bounds = [str(bound) for bound in METRICS_BUCKETS] + ["+Inf"]
+    cumulative = 0
+    buckets = {}
+    for bound, count in zip(bounds, metrics["buckets"]):
+        cumulative += count
+        buckets[bound] = cumulative
+    return {
+        "count": metrics["count"],
+        "seconds": round(metrics["seconds"], 6),
+        "mean_seconds": round(metrics["seconds"] / metrics["count"], 6) if metrics["count"] else 0,
+        "bytes": metrics["bytes"],
+        "buckets": buckets
+    }
+
+def get_metrics_report():
+    """Return the stage durations and phase timings of this run"""
+    with metrics_lock:
+        phases = {phase: get_phase_report(metrics) for phase, metrics in sorted(phase_metrics.items())}
+    return {
+        "stages": {stage: round(seconds, 3) for stage, seconds in stage_durations.items()},
+        "stages_cpu": {stage: round(seconds, 3) for stage, seconds in stage_cpu_times.items()},
+        "stages_peak_rss_mb": dict(stage_peak_rss),
+        "phases": phases
+    }
+
+def write_file_atomically(path, data):
+    """Write data to path through a temporary file, so readers (nginx, Prometheus) never see a partial file"""
+    temp_path = f"{path}.{os.getpid()}.part"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def save_metrics(report=None):
+    """Save a metrics report (by default this run's) as export_metrics.json and export_metrics.prom
+
+    The .prom file is in the Prometheus text format, for node_exporter's textfile collector.
+    """
+    report = report or get_metrics_report()
+    phases = report["phases"]
+    with open(os.path.join(export_folder, "export_metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    lines = [
+        "# HELP wordpress_export_stage_seconds Wall-clock time of each stage of the export.",
+        "# TYPE wordpress_export_stage_seconds gauge"
+    ]
+    lines += [f'wordpress_export_stage_seconds{{stage="{stage}"}} {seconds}' for stage, seconds in report["stages"].items()]
+    lines += [
+        "# HELP wordpress_export_stage_cpu_seconds CPU time of the exporter process in each stage of the export.",
+        "# TYPE wordpress_export_stage_cpu_seconds gauge"
+    ]
+    lines += [f'wordpress_export_stage_cpu_seconds{{stage="{stage}"}} {seconds}' for stage, seconds in report["stages_cpu"].items()]
+    lines += [
+        "# HELP wordpress_export_stage_peak_rss_megabytes Peak resident set size of the exporter process at the end of each stage.",
+        "# TYPE wordpress_export_stage_peak_rss_megabytes gauge"
+    ]
+    lines += [f'wordpress_export_stage_peak_rss_megabytes{{stage="{stage}"}} {megabytes}'
+              for stage, megabytes in report.get("stages_peak_rss_mb", {}).items()]
+    lines += [
+        "# HELP wordpress_export_phase_seconds Latency of the operations of each export phase.",
+        "# TYPE wordpress_export_phase_seconds histogram"
+    ]
+    for phase, metrics in phases.items():
+        lines += [f'wordpress_export_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}'
+                  for bound, count in metrics["buckets"].items()]
+        lines.append(f'wordpress_export_phase_seconds_sum{{phase="{phase}"}} {metrics["seconds"]}')
+        lines.append(f'wordpress_export_phase_seconds_count{{phase="{phase}"}} {metrics["count"]}')
+    lines += [
+        "# HELP wordpress_export_phase_bytes_total Bytes read or written by each export phase.",
+        "# TYPE wordpress_export_phase_bytes_total counter"
+    ]
+    lines += [f'wordpress_export_phase_bytes_total{{phase="{phase}"}} {metrics["bytes"]}' for phase, metrics in phases.items()]
+    with stats_lock:
+        for name, value in stats.items():
+            lines.append(f"# TYPE wordpress_export_{name} gauge")
+            lines.append(f"wordpress_export_{name} {value}")
+    # Written atomically, so the textfile collector never reads a partial file
+    write_file_atomically(os.path.join(export_folder, "export_metrics.prom"), ("\n".join(lines) + "\n").encode("utf-8"))
+
+def download_allow_urls():
+    """Read URLs from the local allow-urls.txt file and download their content"""
+    try:
+        # Check if the file exists
+        if not os.path.exists("allow-urls.txt"):
+            logging.error("allow-urls.txt file not found in the current directory")
             return False
         
         # Read the file
@@ -455,6 +3430,7 @@ def download_allow_urls():
             urls = [line.strip() for line in f if line.strip()]
         
         logging.info(f"Read {len(urls)} URLs from allow-urls.txt")
+        os.makedirs(export_folder, exist_ok=True)
         
         # Download each URL
         success_count = 0
@@ -468,7 +3444,7 @@ def download_allow_urls():
                     filename = f"url_{i}.txt"
                 
                 # Download the content
-                response = requests.get(url, timeout=30)
+                response = http_get(url)
                 if response.status_code == 200:
                     # Save the file
                     file_path = os.path.join(export_folder, filename)
@@ -483,10 +3459,8 @@ def download_allow_urls():
             except Exception as e:
                 logging.error(f"Error downloading {url}: {e}")
         
-        # Save all URLs to a file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        urls_file = f"downloaded_urls_{timestamp}.txt"
-        urls_path = os.path.join(export_folder, urls_file)
+        # Save all URLs to a file, under a fixed name so the export archive does not change with the time
+        urls_path = os.path.join(export_folder, "downloaded_urls.txt")
         with open(urls_path, "w", encoding="utf-8") as f:
             for url in urls:
                 f.write(f"{url}\n")
@@ -500,38 +3474,580 @@ def download_allow_urls():
         logging.error(f"Error processing allow-urls.txt: {e}")
         return False
 
+def save_internal_links(sorted_links):
+    """Save the unique internal links, an iterable in sorted order, as text and JSON files
+
+    Both files are written while the links are read, so they are never all in memory.
+    """
+    links_file_path = os.path.join(export_folder, "all_internal_links.txt")
+    links_json_path = os.path.join(export_folder, "all_internal_links.json")
+    count = 0
+    with open(links_file_path, "w", encoding="utf-8") as f, open(links_json_path, "w", encoding="utf-8") as json_file:
+        # The JSON file is laid out like json.dump(links, indent=4)
+        json_file.write("[")
+        for link in sorted_links:
+            f.write(f"{link}\n")
+            json_file.write(("," if count else "") + "\n    " + json.dumps(link))
+            count += 1
+        json_file.write("\n]" if count else "]")
+    logging.info(f"Saved {count} unique links to {links_file_path}")
+    logging.info(f"Saved links to JSON file: {links_json_path}")
+
+def precompress_file(path, previous):
+    """Write the .gz (and .br) variants of a file unless it is unchanged since the last run
+
+    Runs in a precompression worker process. previous is the file's entry in the last
+    run's precompress manifest. A variant is only kept if it is smaller than the file.
+    Returns the file's new manifest entry and whether it was compressed.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = hashlib.sha1(data).hexdigest()
+    variants = {".gz": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = lambda: brotli.compress(data, quality=11)
+
+    entry = {"hash": content_hash, "variants": sorted(variants), "kept": []}
+    # Variants that were not worth keeping are missing, so the hash and the variants tried are
+    # compared; the kept ones must still exist, as folders rebuilt in one piece (search/) lose them
+    if (previous and all(previous.get(key) == entry[key] for key in ("hash", "variants")) and "kept" in previous
+            and all(os.path.exists(path + suffix) for suffix in previous["kept"])):
+        return previous, False
+
+    for suffix, compress in variants.items():
+        compressed = compress()
+        if len(compressed) < len(data):
+            write_file_atomically(path + suffix, compressed)
+            entry["kept"].append(suffix)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return entry, True
+
+def precompress_export():
+    """Write gzip and brotli variants of the exported text files for nginx gzip_static/brotli_static
+
+    Files are compressed by PRECOMPRESS_WORKERS processes. Their content hashes are kept in
+    precompress_manifest.json, so files unchanged since the last run are not compressed
+    again. Variants of files that were removed or shrank below PRECOMPRESS_MIN_SIZE are
+    deleted, like those of the PRECOMPRESS_EXCLUDED_FILES reports.
+    """
+    manifest_path = os.path.join(export_folder, PRECOMPRESS_MANIFEST_FILE)
+    previous_entries = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous_entries = json.load(f)
+
+    candidates = []
+    for folder, _, file_names in os.walk(export_folder):
+        for file_name in file_names:
+            path = os.path.join(folder, file_name)
+            source_path, suffix = os.path.splitext(path)
+            if suffix in (".gz", ".br") and source_path.endswith(PRECOMPRESS_EXTENSIONS):
+                if (not os.path.exists(source_path) or os.path.getsize(source_path) < PRECOMPRESS_MIN_SIZE
+                        or os.path.relpath(source_path, export_folder) in PRECOMPRESS_EXCLUDED_FILES):
+                    os.remove(path)
+                continue
+            relative_path = os.path.relpath(path, export_folder)
+            if (file_name.endswith(PRECOMPRESS_EXTENSIONS) and os.path.getsize(path) >= PRECOMPRESS_MIN_SIZE
+                    and relative_path not in PRECOMPRESS_EXCLUDED_FILES):
+                candidates.append(relative_path)
+
+    entries = {}
+    with ProcessPoolExecutor(max_workers=PRECOMPRESS_WORKERS, mp_context=process_context,
+                             initializer=configure_worker_logging) as executor:
+        paths = [os.path.join(export_folder, path) for path in candidates]
+        previous = [previous_entries.get(path) for path in candidates]
+        results = executor.map(precompress_file, paths, previous, chunksize=16)
+        for path, (entry, compressed) in zip(candidates, results):
+            entries[path] = entry
+            increment_stat("files_precompressed" if compressed else "precompressed_unchanged")
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=4, sort_keys=True)
+    logging.info(f"Precompressed {stats['files_precompressed']} files ({stats['precompressed_unchanged']} unchanged)"
+                 + ("" if brotli else ", install brotli for .br variants"))
+
+def get_image_variant_path(content_hash, image_format):
+    """Return the path in IMAGE_CACHE_DIR of an image variant"""
+    return os.path.join(IMAGE_CACHE_DIR, content_hash[:2], f"{content_hash[2:]}-q{IMAGE_QUALITY}.{image_format}")
+
+def optimize_image(path, formats):
+    """Write the WebP/AVIF variants of an image next to it, encoding only those not cached yet
+
+    Runs in an image worker process. Variants are encoded once into IMAGE_CACHE_DIR, with their
+    metadata stripped, and materialised into the export from there, so an image already
+    encoded by any earlier run or other export is not encoded again. Returns whether a variant
+    was encoded and the bytes saved by the smallest variant.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = hashlib.sha1(data).hexdigest()
+    variant_paths = {image_format: get_image_variant_path(content_hash, image_format) for image_format in formats}
+    missing = [image_format for image_format, cache_path in variant_paths.items() if not os.path.exists(cache_path)]
+
+    if missing:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "A" in image.mode or "transparency" in image.info else "RGB")
+            for image_format in missing:
+                variant = io.BytesIO()
+                image.save(variant, image_format.upper(), quality=IMAGE_QUALITY, exif=b"")
+                cache_path = variant_paths[image_format]
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                write_file_atomically(cache_path, variant.getvalue())
+                # Exports hardlink the variant, so it must not be changed in place
+                os.chmod(cache_path, 0o444)
+
+    for image_format, cache_path in variant_paths.items():
+        save_path = f"{path}.{image_format}"
+        if not os.path.exists(save_path) or not os.path.samefile(cache_path, save_path):
+            materialize_file(cache_path, save_path)
+        # The modification time marks the variant as recently used for AssetStore.gc()
+        os.utime(cache_path)
+    smallest = min(os.path.getsize(cache_path) for cache_path in variant_paths.values())
+    return bool(missing), max(len(data) - smallest, 0)
+
+def optimize_images():
+    """Write WebP/AVIF variants of the downloaded JPEG and PNG images
+
+    Images are encoded by IMAGE_WORKERS processes, or linked from IMAGE_CACHE_DIR when they
+    were encoded before. Every image gets all its variants, even ones larger than the image:
+    the pages offering them in <picture> elements are rendered before the images are
+    downloaded. Variants of images that no longer exist are deleted.
+    """
+    if Image is None:
+        logging.warning("IMAGE_FORMATS is set but Pillow is not installed (pip install Pillow), skipping images")
+        return
+    formats = get_image_formats()
+    for image_format in IMAGE_FORMATS:
+        if image_format not in formats:
+            logging.warning(f"Pillow cannot write {image_format} images, skipping them")
+    if not formats:
+        return
+
+    candidates = []
+    for folder, _, file_names in os.walk(export_folder):
+        for file_name in file_names:
+            path = os.path.join(folder, file_name)
+            source_path, suffix = os.path.splitext(path)
+            if suffix[1:] in IMAGE_MIME_TYPES and source_path.lower().endswith(IMAGE_EXTENSIONS):
+                if not os.path.exists(source_path):
+                    os.remove(path)
+                continue
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                candidates.append(os.path.relpath(path, export_folder))
+
+    with ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=process_context,
+                             initializer=configure_worker_logging) as executor:
+        futures = [executor.submit(optimize_image, os.path.join(export_folder, path), formats) for path in candidates]
+        for path, future in zip(candidates, futures):
+            try:
+                encoded, saved = future.result()
+            except Exception as e:
+                logging.error(f"Error optimizing image {path}: {e}")
+                increment_stat("errors")
+                continue
+            increment_stat("images_optimized" if encoded else "images_unchanged")
+            increment_stat("image_bytes_saved", saved)
+
+    logging.info(f"Optimized {stats['images_optimized']} images ({stats['images_unchanged']} from the cache), "
+                 f"{stats['image_bytes_saved']} bytes saved")
+
+# Files describing a whole export, which merge_shards() combines instead of copying
+SHARD_REPORT_FILES = (
+    "wordpress_export.json", EXPORT_STREAM_FILE, EXPORT_INDEX_FILE, "export_statistics.json",
+    "export_metrics.json", "export_metrics.prom", "export_manifest.json", "export_changes.json",
+    PRECOMPRESS_MANIFEST_FILE, "all_internal_links.txt", "all_internal_links.json",
+    FRONTIER_FILE, LINK_GRAPH_FILE, LINK_REPORT_FILE
+)
+
+# Statistics of shard exports that merge_shards() combines by taking the largest, not the sum
+SHARD_PEAK_STATS = ("peak_rss_mb", "peak_rss_workers_mb")
+
+def link_or_copy(source_path, target_path):
+    """Hardlink source_path to target_path, copying it when they are on different filesystems"""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+def merge_shard_metrics(reports):
+    """Combine the metrics reports of shards: phases are summed, stages take the slowest (or largest) shard"""
+    merged = {"stages": {}, "stages_cpu": {}, "stages_peak_rss_mb": {}, "phases": {}}
+    for report in reports:
+        for key in ("stages", "stages_cpu", "stages_peak_rss_mb"):
+            for stage, seconds in report.get(key, {}).items():
+                merged[key][stage] = max(merged[key].get(stage, 0), seconds)
+        for phase, metrics in report["phases"].items():
+            total = merged["phases"].setdefault(phase, {"count": 0, "seconds": 0, "bytes": 0, "buckets": {}})
+            total["count"] += metrics["count"]
+            total["seconds"] = round(total["seconds"] + metrics["seconds"], 6)
+            total["bytes"] += metrics["bytes"]
+            for bound, count in metrics["buckets"].items():
+                total["buckets"][bound] = total["buckets"].get(bound, 0) + count
+    for total in merged["phases"].values():
+        total["mean_seconds"] = round(total["seconds"] / total["count"], 6) if total["count"] else 0
+    return merged
+
+def merge_shards():
+    """Combine the shard exports in export_folder/shards into one export in export_folder
+
+    Exported files are hardlinked (or copied) into place, an asset downloaded by several
+    shards once. The streaming exports are merged record by record, media paths rewritten
+    to the merged folder, and wordpress_export.json is assembled from the result like in a
+    single run; the manifests are merged through a crawl frontier in the merged folder, so
+    neither is held in memory. Statistics, change and link lists are merged too. The shard
+    folders and the shard queue are deleted afterwards. Returns the merged metrics report,
+    or None if there are no shard exports.
+    """
+    shards_path = os.path.join(export_folder, SHARDS_FOLDER)
+    shard_folders = sorted((os.path.join(shards_path, name) for name in os.listdir(shards_path)
+                            if os.path.isdir(os.path.join(shards_path, name))),
+                           key=lambda path: int(os.path.basename(path)))
+    if not shard_folders:
+        logging.error(f"No shard exports found in {shards_path}")
+        return None
+    merged_stats = {}
+    manifests = {PRECOMPRESS_MANIFEST_FILE: {}}
+    metrics_reports = []
+    open_crawl_frontier()
+    open_export_stream()
+
+    for shard_folder in shard_folders:
+        logging.info(f"Merging shard {shard_folder}")
+        report_paths = {os.path.join(shard_folder, name) for name in SHARD_REPORT_FILES}
+        for folder, _, file_names in os.walk(shard_folder):
+            target_folder = os.path.join(export_folder, os.path.relpath(folder, shard_folder))
+            os.makedirs(target_folder, exist_ok=True)
+            for file_name in file_names:
+                path = os.path.join(folder, file_name)
+                if path in report_paths or os.path.splitext(path)[0] in report_paths:
+                    continue
+                if not os.path.exists(os.path.join(target_folder, file_name)):
+                    link_or_copy(path, os.path.join(target_folder, file_name))
+
+        # Media files downloaded by several shards are recorded once by add_content_item()
+        with open(os.path.join(shard_folder, EXPORT_STREAM_FILE), "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                item = record["data"]
+                if record["type"] == "media":
+                    item["local_path"] = os.path.join(export_folder, os.path.relpath(item["local_path"], shard_folder))
+                else:
+                    add_terms(item.get("categories", []), item.get("tags", []))
+                add_content_item(record["type"], item)
+
+        with open(os.path.join(shard_folder, "export_statistics.json"), "r", encoding="utf-8") as f:
+            for name, value in json.load(f).items():
+                if name in SHARD_PEAK_STATS:
+                    merged_stats[name] = max(merged_stats.get(name, 0), value)
+                elif name not in ("categories_found", "tags_found"):
+                    merged_stats[name] = merged_stats.get(name, 0) + value
+        for kind, key, entry in iter_manifest_file(os.path.join(shard_folder, "export_manifest.json")):
+            set_manifest_entry(kind, key, entry)
+        for file_name, entries in manifests.items():
+            if os.path.exists(os.path.join(shard_folder, file_name)):
+                with open(os.path.join(shard_folder, file_name), "r", encoding="utf-8") as f:
+                    entries.update(json.load(f))
+        if os.path.exists(os.path.join(shard_folder, "export_metrics.json")):
+            with open(os.path.join(shard_folder, "export_metrics.json"), "r", encoding="utf-8") as f:
+                metrics_reports.append(json.load(f))
+
+    # Categories, tags and posts are counted in the merged export
+    stats.update(merged_stats)
+    # Shards never have a previous export, so every merged path is listed as added, like in their own change lists
+    save_manifest()
+    save_wordpress_export()
+    close_crawl_frontier()
+    for file_name, entries in manifests.items():
+        if entries:
+            with open(os.path.join(export_folder, file_name), "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=4, sort_keys=True)
+    # The link lists of the shards are sorted and disjoint
+    link_files = [open(os.path.join(shard_folder, "all_internal_links.txt"), "r", encoding="utf-8")
+                  for shard_folder in shard_folders]
+    try:
+        save_internal_links(line.rstrip("\n") for line in heapq.merge(*link_files))
+    finally:
+        for link_file in link_files:
+            link_file.close()
+    open_link_graph()
+    for shard_folder in shard_folders:
+        if os.path.exists(os.path.join(shard_folder, LINK_GRAPH_FILE)):
+            link_graph.merge(os.path.join(shard_folder, LINK_GRAPH_FILE))
+    save_link_report()
+
+    # The merged folder holds hardlinks or copies of everything the shards exported
+    shutil.rmtree(shards_path)
+    queue_path = SHARD_QUEUE or os.path.join(export_folder, "shard_queue.sqlite")
+    if os.path.exists(queue_path):
+        os.remove(queue_path)
+    logging.info(f"Merged {len(shard_folders)} shards: {stats['pages_processed']} pages processed, "
+                 f"{stats['posts_found']} posts, {stats['categories_found']} categories, {stats['tags_found']} tags")
+    return merge_shard_metrics(metrics_reports)
+
+# Crawl state kept in the export folder that is not part of the exported site, and files
+# whose content depends on timing: the streaming export is in the order the threads
+# exported records (wordpress_export.json has them sorted) and the reports hold durations
+ARCHIVE_EXCLUDED_FILES = ({name + suffix for name in (FRONTIER_FILE, LINK_GRAPH_FILE, PREVIOUS_LINK_GRAPH_FILE)
+                           for suffix in ("", "-wal", "-shm")}
+                          | {name + suffix for name in (EXPORT_STREAM_FILE, EXPORT_INDEX_FILE, "export_statistics.json",
+                                                        "export_metrics.json", "export_metrics.prom")
+                             for suffix in ("", ".gz", ".br")})
+
+def iter_archive_members(folder):
+    """Yield (relative path, absolute path) of the folders and files of an export, sorted by path"""
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        relative_root = os.path.relpath(root, folder)
+        if relative_root != ".":
+            yield relative_root, root
+        for name in sorted(files):
+            if relative_root == "." and name in ARCHIVE_EXCLUDED_FILES or name.endswith(".part"):
+                continue
+            yield os.path.normpath(os.path.join(relative_root, name)), os.path.join(root, name)
+
+def open_archive_stream(path, output):
+    """Return the stream writing the archive at path to output, compressed by the suffix of path
+
+    Compression is deterministic too: gzip headers carry no name and no timestamp, and
+    multithreaded zstd output does not depend on the number of threads.
+    """
+    if path.endswith((".tar.gz", ".tgz")):
+        return gzip.GzipFile(filename="", mode="wb", fileobj=output, mtime=0)
+    if path.endswith((".tar.zst", ".tzst")):
+        return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL, threads=-1).stream_writer(output, closefd=False)
+    return output
+
+def write_export_archive(path):
+    """Write the export folder as a deterministic tar archive to path ("-" for standard output)
+
+    Members are added in sorted path order as plain files and folders, with ARCHIVE_MTIME as
+    modification time, no owner and mode 644/755, and the crawl state and timing-dependent
+    files (ARCHIVE_EXCLUDED_FILES) are left out, so the archive only depends on the
+    exported paths and contents. Hardlinks from the asset store are stored as files. The
+    archive is streamed, never held in memory, and written to a temporary file that
+    replaces path once complete.
+    """
+    started = time.perf_counter()
+    temp_path = f"{path}.{os.getpid()}.part"
+    output = sys.stdout.buffer if path == "-" else open(temp_path, "wb")
+    stream = open_archive_stream(path, output)
+    member_count = 0
+    try:
+        try:
+            with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+                for name, member_path in iter_archive_members(export_folder):
+                    info = tarfile.TarInfo(name)
+                    info.mtime = ARCHIVE_MTIME
+                    if os.path.isdir(member_path):
+                        info.type, info.mode = tarfile.DIRTYPE, 0o755
+                        archive.addfile(info)
+                    else:
+                        info.size, info.mode = os.path.getsize(member_path), 0o644
+                        with open(member_path, "rb") as f:
+                            archive.addfile(info, f)
+                    member_count += 1
+        finally:
+            if stream is not output:
+                stream.close()
+            if path == "-":
+                output.flush()
+            else:
+                output.close()
+        if path != "-":
+            os.replace(temp_path, path)
+    except BaseException:
+        # Leave no partial archive behind
+        if path != "-" and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logging.info(f"Archived {member_count} files and folders of {export_folder} to {path} "
+                 f"in {time.perf_counter() - started:.1f}s")
+
+def close_crawl_frontier():
+    """Close the crawl frontier and delete it once the export completed"""
+    if crawl_frontier is None:
+        return
+    crawl_frontier.close()
+    frontier_path = os.path.join(export_folder, FRONTIER_FILE)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(frontier_path + suffix):
+            os.remove(frontier_path + suffix)
+
 # Main execution
 if __name__ == "__main__":
-    logging.info("Starting WordPress site export...")
+    parser = argparse.ArgumentParser(description="Export a WordPress site as a static site")
+    parser.add_argument("--resume", metavar="EXPORT_FOLDER",
+                        help="continue an interrupted export in EXPORT_FOLDER where it stopped")
+    parser.add_argument("--html-output", choices=HTML_OUTPUT_MODES,
+                        help="layout of the exported HTML (default: HTML_OUTPUT or pretty)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the main and worker threads with cProfile and save the stats to FILE")
+    parser.add_argument("--shard", type=parse_shard, metavar="INDEX/COUNT",
+                        help="export only shard INDEX of COUNT (default: SHARD), see --merge-shards")
+    parser.add_argument("--merge-shards", action="store_true",
+                        help="combine the shard exports in EXPORT_FOLDER/shards into EXPORT_FOLDER, then exit")
+    parser.add_argument("--gc-asset-store", action="store_true",
+                        help="delete blobs of ASSET_STORE_DIR that no export references, then exit")
+    parser.add_argument("--archive", metavar="PATH", default=ARCHIVE_OUTPUT,
+                        help="also write the export as a deterministic .tar, .tar.gz or .tar.zst archive "
+                             "(- for standard output, default: ARCHIVE_OUTPUT); set SOURCE_DATE_EPOCH too, "
+                             "or the export_date in wordpress_export.json makes every archive differ")
+    parser.add_argument("--http-cache", choices=HTTP_CACHE_MODES,
+                        help="record responses to, or replay them from, HTTP_CACHE_DIR (default: HTTP_CACHE_MODE)")
+    args = parser.parse_args()
     
-    # First, collect all internal links from the site
-    all_internal_links = collect_all_internal_links()
+    if args.http_cache:
+        HTTP_CACHE_MODE = args.http_cache
+    if HTTP_CACHE_MODE not in HTTP_CACHE_MODES:
+        parser.error(f"HTTP_CACHE_MODE must be one of {', '.join(HTTP_CACHE_MODES)}")
+    if args.archive.endswith((".tar.zst", ".tzst")) and zstandard is None:
+        parser.error("a .tar.zst archive needs the zstandard package (pip install zstandard)")
     
-    # Save unique links to a file
-    links_file_path = os.path.join(export_folder, "all_internal_links.txt")
-    with open(links_file_path, "w", encoding="utf-8") as f:
-        for link in sorted(all_internal_links):
-            f.write(f"{link}\n")
-    logging.info(f"Saved {len(all_internal_links)} unique links to {links_file_path}")
+    if args.gc_asset_store:
+        if not ASSET_STORE_DIR:
+            logging.error("ASSET_STORE_DIR is not set, there is no asset store to collect")
+            sys.exit(1)
+        store = AssetStore(ASSET_STORE_DIR)
+        removed, removed_bytes = store.gc()
+        store.close()
+        logging.info(f"Asset store garbage collection: removed {removed} blobs ({removed_bytes} bytes)")
+        sys.exit(0)
     
-    # Also save links as JSON for easier programmatic access
-    links_json_path = os.path.join(export_folder, "all_internal_links.json")
-    with open(links_json_path, "w", encoding="utf-8") as f:
-        json.dump(all_internal_links, f, indent=4)
-    logging.info(f"Saved links to JSON file: {links_json_path}")
+    if args.html_output:
+        # Render worker processes read it from the environment
+        HTML_OUTPUT = os.environ["HTML_OUTPUT"] = args.html_output
+    
+    if args.merge_shards:
+        metrics_report = merge_shards()
+        if metrics_report is None:
+            sys.exit(1)
+        if SEARCH_INDEX:
+            build_search_index()
+        if PRECOMPRESS:
+            precompress_export()
+        save_statistics()
+        save_metrics(metrics_report)
+        if args.archive:
+            write_export_archive(args.archive)
+        sys.exit(0)
     
-    logging.info(f"Found {len(all_internal_links)} total links to process")
+    if args.shard or SHARD:
+        try:
+            shard_index, shard_count = args.shard or parse_shard(SHARD)
+        except argparse.ArgumentTypeError as e:
+            parser.error(f"SHARD: {e}")
+        if not os.getenv("EXPORT_FOLDER") or args.resume:
+            logging.error("A sharded export needs EXPORT_FOLDER on storage shared by all workers and cannot be resumed")
+            sys.exit(1)
+        shard_queue_path = SHARD_QUEUE or os.path.join(export_folder, "shard_queue.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(shard_queue_path)), exist_ok=True)
+        queue_filesystem = get_filesystem_type(os.path.dirname(os.path.abspath(shard_queue_path)))
+        if queue_filesystem in NETWORK_FILESYSTEMS:
+            logging.error(f"The shard queue {shard_queue_path} is on {queue_filesystem}, whose file locking SQLite "
+                          "cannot rely on; use shared storage with POSIX locks, such as CephFS, for SHARD_QUEUE")
+            sys.exit(1)
+        # Render worker processes read the export folder from the environment
+        export_folder = os.environ["EXPORT_FOLDER"] = os.path.join(export_folder, SHARDS_FOLDER, str(shard_index))
+        # A restarted worker redoes its shard from scratch: pages found on disk would be skipped
+        # and the links on them never forwarded again
+        if os.path.exists(export_folder):
+            shutil.rmtree(export_folder)
+        os.makedirs(export_folder, exist_ok=True)
+        open_shard_queue(shard_queue_path)
+        logging.info(f"Exporting shard {shard_index} of {shard_count} into {export_folder}")
+    
+    if args.resume:
+        export_folder = args.resume
+        if not os.path.exists(os.path.join(export_folder, FRONTIER_FILE)):
+            logging.error(f"No crawl state found in {export_folder}, cannot resume")
+            sys.exit(1)
+    os.makedirs(export_folder, exist_ok=True)
     
-    # Process each page
-    for page_url in all_internal_links:
-        process_page(page_url)
-        logging.info(f"Progress: {stats['pages_processed']}/{len(all_internal_links)} pages processed")
+    if args.profile:
+        thread_profilers = []
+        start_thread_profiler()
+    
+    logging.info("Starting WordPress site export...")
+    
+    if HTTP_CACHE_MODE != "off":
+        open_http_cache()
+    open_crawl_frontier(resume=bool(args.resume))
+    open_link_graph(resume=bool(args.resume))
+    if INCREMENTAL:
+        load_previous_export(resume=bool(args.resume))
+    open_export_stream(resume=bool(args.resume))
+    if ASSET_STORE_DIR:
+        open_asset_store()
+    if args.resume:
+        # Continue the statistics from the last checkpoint; the manifest is in the frontier
+        stats.update(crawl_frontier.get_meta("stats", {}))
+        resume_asset_downloads()
+    start_render_pool()
+    end_stage("setup")
+    
+    if CRAWL_MODE == "two-pass":
+        # First, collect all internal links from the site
+        link_count = collect_all_internal_links()
+        save_internal_links(crawl_frontier.iter_urls(sort=True))
+        
+        logging.info(f"Found {link_count} total links to process")
+        
+        # Process the pages concurrently
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS, initializer=start_thread_profiler) as executor:
+            for _ in executor.map(process_page, crawl_frontier.iter_urls()):
+                logging.info(f"Progress: {stats['pages_processed']}/{link_count} pages processed")
+    else:
+        # Discover and export every page in a single pass
+        crawl_and_export()
+        save_internal_links(crawl_frontier.iter_urls(sort=True))
+    save_link_report()
+    end_stage("crawl")
+    
+    # Let the background asset downloads finish before saving the statistics
+    stop_render_pool()
+    wait_for_asset_downloads()
+    checkpoint_crawl(force=True)
+    save_manifest()
+    if asset_store is not None:
+        asset_store.close()
+    end_stage("assets")
+
+    # Write WebP/AVIF variants of the images and offer them in <picture> elements
+    if IMAGE_FORMATS:
+        optimize_images()
+        end_stage("images")
     
     # Save the complete WordPress export
     save_wordpress_export()
+    close_crawl_frontier()
+    if shard_queue is not None:
+        shard_queue.close()
+    end_stage("export")
+
+    # Shard workers leave the search index to --merge-shards, which sees every page
+    if SEARCH_INDEX and shard_queue is None:
+        build_search_index()
+        end_stage("search")
 
     # Download allow-urls.txt file
     download_allow_urls()
+    end_stage("allow_urls")
+
+    # Write .gz/.br variants of the exported text files
+    if PRECOMPRESS:
+        precompress_export()
+        end_stage("precompress")
+    save_statistics()
+    save_metrics()
+    if http_cache is not None:
+        http_cache.close()
+
+    # Shard workers leave the archive to --merge-shards
+    if args.archive and shard_queue is None:
+        write_export_archive(args.archive)
 
     # Print final statistics
     logging.info("\nExport Statistics:")
@@ -540,5 +4056,14 @@ if __name__ == "__main__":
     logging.info(f"Categories Found: {stats['categories_found']}")
     logging.info(f"Tags Found: {stats['tags_found']}")
     logging.info(f"Assets Downloaded: {stats['assets_downloaded']}")
+    logging.info(f"Assets Failed: {stats['assets_failed']}")
+    logging.info(f"Unchanged Pages/Assets: {stats['pages_unchanged']}/{stats['assets_unchanged']}")
+    if asset_store is not None:
+        logging.info(f"Assets Linked From Store: {stats['assets_from_store']}")
+    if HTTP_CACHE_MODE == "replay":
+        logging.info(f"Requests Replayed From Cache: {stats['requests_replayed']}")
     logging.info(f"Errors Encountered: {stats['errors']}")
-    logging.info(f"Export completed! Files saved in: {export_folder}")
\ No newline at end of file
+    logging.info(f"Export completed! Files saved in: {export_folder}")
+    
+    if args.profile:
+        save_profile(args.profile)
\ No newline at end of file
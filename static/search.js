@@ -0,0 +1,100 @@
+/*
+ * Client for the search index written by export_website.py into search/.
+ *
+ * Queries are tokenised and stemmed with the rules from search/meta.json, so they match the
+ * index terms; only the term shards (terms/<prefix>.json) and document files (docs/<n>.json)
+ * a query needs are fetched, and are cached for later queries. Results are ranked by tf-idf.
+ *
+ * Usage:
+ *     <script src="/search/search.js"></script>
+ *     WordPressSearch.search("gardening tips").then(function (results) { ... });
+ *     // results: [{url, title, excerpt, type, date, score}, ...]
+ */
+(function (global) {
+    "use strict";
+
+    var script = document.currentScript;
+    var base = script ? script.src.replace(/[^\/]*$/, "") : "/search/";
+    var cache = {};
+    var metaPromise = null;
+
+    function fetchJson(path) {
+        if (!cache[path]) {
+            cache[path] = fetch(base + path).then(function (response) {
+                // Prefixes without any term have no shard
+                return response.ok ? response.json() : {};
+            });
+        }
+        return cache[path];
+    }
+
+    function loadMeta() {
+        if (!metaPromise) {
+            metaPromise = fetchJson("meta.json").then(function (meta) {
+                meta.stopwordSet = new Set(meta.stopwords);
+                return meta;
+            });
+        }
+        return metaPromise;
+    }
+
+    function stem(meta, word) {
+        for (var i = 0; i < meta.stem_rules.length; i++) {
+            var suffix = meta.stem_rules[i][0];
+            if (word.endsWith(suffix)) {
+                if (word.length - suffix.length >= meta.min_stem_length) {
+                    return word.slice(0, -suffix.length) + meta.stem_rules[i][1];
+                }
+                return word;
+            }
+        }
+        return word;
+    }
+
+    function tokenize(meta, text) {
+        var normalized = text.toLowerCase().normalize("NFKD").replace(/[\u0300-\u036f]/g, "");
+        var tokens = normalized.match(/[\p{L}\p{N}]+/gu) || [];
+        return tokens.filter(function (token) {
+            return token.length > 1 && !meta.stopwordSet.has(token);
+        }).map(function (token) {
+            return stem(meta, token);
+        });
+    }
+
+    function search(query, limit) {
+        limit = limit || 20;
+        return loadMeta().then(function (meta) {
+            var terms = Array.from(new Set(tokenize(meta, query)));
+            return Promise.all(terms.map(function (term) {
+                return fetchJson("terms/" + encodeURIComponent(Array.from(term).slice(0, meta.prefix_length).join("")) + ".json");
+            })).then(function (shards) {
+                var scores = new Map();
+                terms.forEach(function (term, i) {
+                    var postings = shards[i][term] || [];
+                    var idf = Math.log(1 + meta.documents / (postings.length || 1));
+                    postings.forEach(function (posting) {
+                        var score = scores.get(posting[0]) || {score: 0, matched: 0};
+                        score.score += posting[1] * idf;
+                        score.matched += 1;
+                        scores.set(posting[0], score);
+                    });
+                });
+                // Documents matching more of the query terms come first
+                var ranked = Array.from(scores.entries()).sort(function (a, b) {
+                    return b[1].matched - a[1].matched || b[1].score - a[1].score;
+                }).slice(0, limit);
+                return Promise.all(ranked.map(function (entry) {
+                    return fetchJson("docs/" + Math.floor(entry[0] / meta.docs_per_file) + ".json").then(function (docs) {
+                        var doc = Object.assign({}, docs[entry[0] % meta.docs_per_file]);
+                        doc.score = entry[1].score;
+                        return doc;
+                    });
+                }));
+            });
+        });
+    }
+
+    global.WordPressSearch = {search: search, tokenize: function (text) {
+        return loadMeta().then(function (meta) { return tokenize(meta, text); });
+    }};
+})(window);
@@ -0,0 +1,94 @@
+"""Shared setup of the export_website.py tests.
+
+export_website reads its configuration from the environment when it is imported, so the
+tests import it with a fixed target domain.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+os.environ.setdefault("TARGET_DOMAIN", "example.com")
+os.environ.setdefault("SITEMAP_URL", "https://example.com/sitemap_index.xml")
+os.environ.setdefault("URL_TO_REPLACE", "https://static.example.org/")
+os.environ.setdefault("EXPORT_FOLDER", tempfile.mkdtemp(prefix="test_export_"))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import hashlib  # noqa: E402
+import subprocess  # noqa: E402
+
+import pytest  # noqa: E402
+
+import export_website  # noqa: E402
+from synthetic_site import start_server  # noqa: E402
+
+EXPORTER = os.path.join(ROOT, "export_website.py")
+
+
+@pytest.fixture
+def serve():
+    """Return a function serving a SyntheticSite on a free port until the end of the test"""
+    servers = []
+
+    def serve(site):
+        servers.append(start_server(site))
+        return site
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def start_export(site, work_dir, *args, log="export.log", **env):
+    """Start export_website.py against site in work_dir, exporting into work_dir/export
+
+    env overrides the exporter's settings. SOURCE_DATE_EPOCH is fixed, so two exports of
+    the same content give the same files.
+    """
+    process_env = dict(os.environ)
+    process_env.update({
+        "TARGET_DOMAIN": site.host,
+        "SITEMAP_URL": f"http://{site.host}/sitemap_index.xml",
+        "URL_TO_REPLACE": "https://static.example.org/",
+        "EXPORT_FOLDER": "export",
+        "INCREMENTAL": "false",
+        "SOURCE_DATE_EPOCH": "1700000000",
+        "MAX_WORKERS": "4",
+        "ASSET_WORKERS": "4",
+    })
+    process_env.update(env)
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, log), "ab") as f:
+        return subprocess.Popen([sys.executable, EXPORTER, *args], cwd=work_dir, env=process_env,
+                                stdout=f, stderr=subprocess.STDOUT)
+
+
+def wait_export(process, work_dir, log="export.log"):
+    """Wait for an export started by start_export() and fail the test if it failed"""
+    if process.wait(timeout=300) != 0:
+        with open(os.path.join(work_dir, log), encoding="utf-8", errors="replace") as f:
+            tail = "".join(f.readlines()[-20:])
+        pytest.fail(f"export_website.py exited with {process.returncode}:\n{tail}")
+
+
+def run_export(site, work_dir, *args, **env):
+    """Run export_website.py against site in work_dir, exporting into work_dir/export"""
+    wait_export(start_export(site, work_dir, *args, **env), work_dir)
+    return os.path.join(work_dir, "export")
+
+
+def count_lines(path):
+    """Return the number of lines of a file, 0 if it does not exist yet"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def read_export(folder):
+    """Return {relative path: SHA-1} of the files of an export that go into its archive"""
+    return {name: hashlib.sha1(open(path, "rb").read()).hexdigest()
+            for name, path in export_website.iter_archive_members(folder) if os.path.isfile(path)}
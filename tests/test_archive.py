@@ -0,0 +1,38 @@
+"""Tests of the deterministic export archive (write_export_archive())"""
+import os
+import tarfile
+
+import pytest
+
+import export_website
+
+
+@pytest.fixture
+def export_folder(tmp_path, monkeypatch):
+    folder = tmp_path / "export"
+    (folder / "post-1").mkdir(parents=True)
+    (folder / "post-1" / "index.html").write_text("<p>Post 1</p>")
+    (folder / "index.html").write_text("<p>Home</p>")
+    (folder / "export_statistics.json").write_text("{}")
+    monkeypatch.setattr(export_website, "export_folder", str(folder))
+    return folder
+
+
+def test_archive_leaves_out_reports_and_is_reproducible(export_folder, tmp_path):
+    export_website.write_export_archive(str(tmp_path / "first.tar.gz"))
+    os.utime(export_folder / "index.html", (0, 0))
+    export_website.write_export_archive(str(tmp_path / "second.tar.gz"))
+    assert (tmp_path / "first.tar.gz").read_bytes() == (tmp_path / "second.tar.gz").read_bytes()
+    with tarfile.open(tmp_path / "first.tar.gz") as archive:
+        assert archive.getnames() == ["index.html", "post-1", "post-1/index.html"]
+
+
+def test_failed_archive_leaves_no_partial_file(export_folder, tmp_path, monkeypatch):
+    def iter_archive_members(folder):
+        yield "index.html", os.path.join(folder, "index.html")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(export_website, "iter_archive_members", iter_archive_members)
+    with pytest.raises(OSError):
+        export_website.write_export_archive(str(tmp_path / "export.tar"))
+    assert os.listdir(tmp_path) == ["export"]
@@ -0,0 +1,118 @@
+"""Tests of the shared content-addressed asset store (AssetStore)"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+import export_website
+from conftest import run_export
+from export_website import AssetStore
+from synthetic_site import SyntheticSite
+
+
+def add_blob(store, data):
+    """Store data as a blob and return its hash"""
+    content_hash = hashlib.sha1(data).hexdigest()
+    temp_path = store.temp_path()
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    store.add_blob(temp_path, content_hash)
+    return content_hash
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AssetStore(str(tmp_path / "store"))
+    yield store
+    store.close()
+
+
+def test_materialize_hardlinks_blobs(store, tmp_path):
+    content_hash = add_blob(store, b"body { color: red }")
+    # Adding the same content again keeps the one blob
+    assert add_blob(store, b"body { color: red }") == content_hash
+    store.materialize(content_hash, str(tmp_path / "export" / "style.css"))
+    assert os.path.samefile(tmp_path / "export" / "style.css", store.blob_path(content_hash))
+    assert os.stat(store.blob_path(content_hash)).st_mode & 0o777 == 0o444
+
+
+def test_materialize_falls_back_to_reflink_then_copy(store, tmp_path, monkeypatch):
+    content_hash = add_blob(store, b"console.log('store');")
+
+    def fail_link(source, target):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(os, "link", fail_link)
+    reflinked = []
+
+    def reflink_file(source, target):
+        reflinked.append(target)
+        shutil.copyfile(source, target)
+        return True
+
+    monkeypatch.setattr(export_website, "reflink_file", reflink_file)
+    store.materialize(content_hash, str(tmp_path / "export" / "reflinked.js"))
+    assert len(reflinked) == 1
+
+    monkeypatch.setattr(export_website, "reflink_file", lambda source, target: False)
+    store.materialize(content_hash, str(tmp_path / "export" / "copied.js"))
+    for name in ("reflinked.js", "copied.js"):
+        path = tmp_path / "export" / name
+        assert path.read_bytes() == b"console.log('store');"
+        assert not os.path.samefile(path, store.blob_path(content_hash))
+    assert sorted(os.listdir(tmp_path / "export")) == ["copied.js", "reflinked.js"]
+
+
+def test_gc_keeps_referenced_linked_and_recent_blobs(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_website, "ASSET_STORE_GC_MIN_AGE", 60)
+    referenced = add_blob(store, b"referenced")
+    linked = add_blob(store, b"linked")
+    recent = add_blob(store, b"recent")
+    unused = add_blob(store, b"unused")
+    variant = os.path.join(store.path, "images", "ab", "cdef-q80.webp")
+    os.makedirs(os.path.dirname(variant))
+    with open(variant, "wb") as f:
+        f.write(b"variant")
+
+    export_folder = tmp_path / "export"
+    export_folder.mkdir()
+    (export_folder / "export_manifest.json").write_text(json.dumps({"assets": {"a.css": {"hash": referenced}}}))
+    store.register_export(str(export_folder))
+    store.materialize(linked, str(tmp_path / "elsewhere" / "linked"))
+    deleted_folder = tmp_path / "deleted"
+    deleted_folder.mkdir()
+    store.register_export(str(deleted_folder))
+    deleted_folder.rmdir()
+    store.record("https://example.com/unused.css", None, None, unused)
+
+    old = time.time() - 120
+    for path in (store.blob_path(referenced), store.blob_path(linked), store.blob_path(unused), variant):
+        os.utime(path, (old, old))
+
+    assert store.gc() == (2, len(b"unused") + len(b"variant"))
+    assert [os.path.exists(store.blob_path(h)) for h in (referenced, linked, recent, unused)] == [True, True, True, False]
+    assert not os.path.exists(variant)
+    assert store.lookup("https://example.com/unused.css") is None
+    assert [row[0] for row in store.connection.execute("SELECT folder FROM exports")] == [str(export_folder)]
+
+
+def test_exports_share_assets_through_the_store(serve, tmp_path):
+    site = serve(SyntheticSite(pages=6, links=3, images=1, sitemaps=1, plugins=2, image_size=1000))
+    store_dir = str(tmp_path / "store")
+    first = run_export(site, tmp_path / "first", ASSET_STORE_DIR=store_dir)
+    second = run_export(site, tmp_path / "second", ASSET_STORE_DIR=store_dir)
+
+    with open(os.path.join(second, "export_manifest.json"), encoding="utf-8") as f:
+        assets = json.load(f)["assets"]
+    assert assets
+    # The site sends no validators, so assets are downloaded again but stored once
+    blobs = [name for _, _, names in os.walk(os.path.join(store_dir, "objects")) for name in names]
+    assert len(blobs) == len({entry["hash"] for entry in assets.values()})
+    for path, entry in assets.items():
+        # Both exports link the one blob of each asset
+        assert os.path.samefile(os.path.join(first, path), os.path.join(second, path))
+        assert os.path.samefile(os.path.join(second, path), os.path.join(store_dir, "objects", entry["hash"][:2],
+                                                                          entry["hash"][2:]))
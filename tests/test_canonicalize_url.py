@@ -0,0 +1,42 @@
+"""Tests of the canonical URL normalisation (canonicalize_url())"""
+import pytest
+
+from export_website import canonicalize_url
+
+
+@pytest.mark.parametrize("url, canonical", [
+    # Scheme, www. and default-port variants of the target collapse into one URL
+    ("http://example.com/about/", "https://example.com/about/"),
+    ("https://www.example.com/about/", "https://example.com/about/"),
+    ("http://example.com:80/about/", "https://example.com/about/"),
+    ("https://EXAMPLE.com:443/about/", "https://example.com/about/"),
+    # Permalinks get their trailing slash, files do not
+    ("https://example.com/about", "https://example.com/about/"),
+    ("https://example.com", "https://example.com/"),
+    ("https://example.com/wp-content/uploads/photo.jpg", "https://example.com/wp-content/uploads/photo.jpg"),
+    # Repeated slashes collapse and the fragment is dropped
+    ("https://example.com//blog///post/#comments", "https://example.com/blog/post/"),
+    # Tracking and reply parameters are dropped, the others sorted
+    ("https://example.com/?utm_source=feed&utm_medium=rss", "https://example.com/"),
+    ("https://example.com/post/?UTM_Campaign=x&fbclid=1&replytocom=5", "https://example.com/post/"),
+    ("https://example.com/?s=term&paged=2&gclid=abc", "https://example.com/?paged=2&s=term"),
+    # Other hosts keep their scheme and host
+    ("http://other.org/page", "http://other.org/page/"),
+    ("https://cdn.example.com/page/", "https://cdn.example.com/page/"),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+
+@pytest.mark.parametrize("url", [
+    "http://www.example.com//a/b?z=1&a=2&utm_term=x#top",
+    "https://example.com/wp-content/uploads/a.png?ver=6.4",
+    "https://example.com:8443/page",
+])
+def test_canonicalize_url_is_idempotent(url):
+    canonical = canonicalize_url(url)
+    assert canonicalize_url(canonical) == canonical
+
+
+def test_canonicalize_url_keeps_other_ports():
+    assert canonicalize_url("https://example.com:8443/page/") == "https://example.com:8443/page/"
@@ -0,0 +1,26 @@
+"""Tests of the SQLite crawl frontier (CrawlFrontier)"""
+from export_website import CrawlFrontier
+
+
+def count_states(frontier):
+    rows = frontier.connection.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall()
+    return dict(sorted(rows))
+
+
+def test_state_counts_follow_every_state_change(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / "frontier.sqlite"))
+    assert frontier.add([f"https://example.com/{i}/" for i in range(10)]) != []
+    assert frontier.add(["https://example.com/0/", "https://example.com/10/"]) == ["https://example.com/10/"]
+    claimed = frontier.claim(5)
+    frontier.mark(claimed[0], "done")
+    frontier.mark(claimed[1], "failed")
+    frontier.mark("https://example.com/unknown/", "done")
+    assert frontier.counts() == count_states(frontier) == {"done": 1, "failed": 1, "fetching": 3, "queued": 6}
+    assert frontier.count() == 11
+    frontier.close()
+
+    # A resumed crawl starts from the committed counts and queues the interrupted URLs again
+    frontier = CrawlFrontier(str(tmp_path / "frontier.sqlite"))
+    assert len(frontier.requeue_interrupted()) == 3
+    assert frontier.counts() == count_states(frontier) == {"done": 1, "failed": 1, "queued": 9}
+    frontier.close()
@@ -0,0 +1,29 @@
+"""Tests of recording a crawl into the HTTP cache and replaying it offline"""
+import json
+import os
+
+from conftest import run_export
+from synthetic_site import SyntheticSite, start_server
+
+
+def test_replayed_export_gives_a_byte_identical_archive(tmp_path):
+    site = SyntheticSite(pages=10, links=3, images=1, sitemaps=2, plugins=1, image_size=1000)
+    server = start_server(site)
+    cache_dir = str(tmp_path / "http_cache")
+    try:
+        run_export(site, tmp_path / "recorded", "--http-cache", "record", "--archive", "export.tar.gz",
+                   HTTP_CACHE_DIR=cache_dir)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # The site is gone: every response comes from the cache
+    replayed = run_export(site, tmp_path / "replayed", "--http-cache", "replay", "--archive", "export.tar.gz",
+                          HTTP_CACHE_DIR=cache_dir)
+    with open(os.path.join(replayed, "export_statistics.json"), encoding="utf-8") as f:
+        stats = json.load(f)
+    assert stats["requests_replayed"] > 0 and stats["requests_sent"] == 0 and stats["errors"] == 0
+
+    recorded_archive = (tmp_path / "recorded" / "export.tar.gz").read_bytes()
+    assert recorded_archive == (tmp_path / "replayed" / "export.tar.gz").read_bytes()
+    assert not [name for _, _, names in os.walk(cache_dir) for name in names if name.endswith(".part")]
@@ -0,0 +1,125 @@
+"""Tests of the image stage: cached WebP/AVIF variants and the <picture> elements offering them"""
+import hashlib
+import io
+import json
+import os
+import zlib
+
+import pytest
+from bs4 import BeautifulSoup
+
+import export_website
+from conftest import run_export
+from synthetic_site import SyntheticSite
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Images</title></head><body>
+<p>Text <img src="https://example.com/a.jpg" srcset="https://example.com/a-300x200.jpg 300w, /a.jpg 1200w"
+ sizes="(max-width: 1200px) 100vw, 1200px" alt="A"> after</p>
+<img src="/b.PNG" alt="B">
+<img src="https://cdn.example.net/c.jpg" alt="External">
+<img src="/d.gif" alt="GIF">
+<picture><source srcset="/e.avif" type="image/avif"><img src="/e.jpg" alt="Already wrapped"></picture>
+</body></html>
+"""
+
+
+class ImageSite(SyntheticSite):
+    """SyntheticSite serving real JPEG images, one flat colour per path"""
+
+    def respond(self, path):
+        path = path.split("?")[0]
+        if not path.endswith(".jpg"):
+            return super().respond(path)
+        from PIL import Image
+        checksum = zlib.crc32(path.encode())
+        image = Image.new("RGB", (64, 48), (checksum & 255, checksum >> 8 & 255, checksum >> 16 & 255))
+        body = io.BytesIO()
+        image.save(body, "JPEG", quality=95)
+        return 200, "image/jpeg", body.getvalue()
+
+
+def get_pictures(html):
+    """Return the <source> attributes and <img> src of every <picture> element of a page"""
+    soup = BeautifulSoup(html, "html.parser")
+    return [([source.attrs for source in picture.find_all("source")], picture.find("img")["src"])
+            for picture in soup.find_all("picture")]
+
+
+@pytest.fixture
+def image_formats(monkeypatch):
+    monkeypatch.setattr(export_website, "IMAGE_FORMATS", ["webp", "avif"])
+    monkeypatch.setattr(export_website, "image_formats", ["avif", "webp"])
+
+
+@pytest.mark.parametrize("render", [export_website.render_page_bs4, export_website.render_page_lxml])
+def test_local_images_are_wrapped_in_picture_elements(image_formats, render):
+    result = render(PAGE, "https://example.com/page/")
+    local = "https://static.example.org/"
+    srcset = f"{local}a-300x200.jpg 300w, {local}a.jpg 1200w"
+    sizes = "(max-width: 1200px) 100vw, 1200px"
+    assert get_pictures(result["html"]) == [
+        ([{"type": "image/avif", "srcset": srcset.replace(".jpg", ".jpg.avif"), "sizes": sizes},
+          {"type": "image/webp", "srcset": srcset.replace(".jpg", ".jpg.webp"), "sizes": sizes}], f"{local}a.jpg"),
+        ([{"type": "image/avif", "srcset": f"{local}b.PNG.avif"},
+          {"type": "image/webp", "srcset": f"{local}b.PNG.webp"}], f"{local}b.PNG"),
+        ([{"srcset": "/e.avif", "type": "image/avif"}], f"{local}e.jpg"),
+    ]
+    # The text around a wrapped image stays where it was
+    paragraph = BeautifulSoup(result["html"], "html.parser").p
+    assert [text.strip() for text in paragraph.find_all(string=True, recursive=False)] == ["Text", "after"]
+
+
+def test_engines_write_the_same_picture_elements(image_formats):
+    pages = [render(PAGE, "https://example.com/page/")["html"]
+             for render in (export_website.render_page_bs4, export_website.render_page_lxml)]
+    assert get_pictures(pages[0]) == get_pictures(pages[1])
+
+
+def test_images_are_not_wrapped_without_image_formats(monkeypatch):
+    monkeypatch.setattr(export_website, "IMAGE_FORMATS", [])
+    for render in (export_website.render_page_bs4, export_website.render_page_lxml):
+        assert get_pictures(render(PAGE, "https://example.com/page/")["html"]) == [
+            ([{"srcset": "/e.avif", "type": "image/avif"}], "https://static.example.org/e.jpg")]
+
+
+def load_stats(folder):
+    with open(os.path.join(folder, "export_statistics.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_image_variants_are_encoded_once_into_the_shared_cache(serve, tmp_path):
+    pytest.importorskip("PIL")
+    site = serve(ImageSite(pages=3, links=2, images=1, sitemaps=1, plugins=1))
+    cache = tmp_path / "image_cache"
+    settings = {"IMAGE_FORMATS": "webp", "IMAGE_CACHE_DIR": str(cache), "IMAGE_WORKERS": "2"}
+    first = run_export(site, tmp_path / "first", **settings)
+
+    images = sorted(os.path.relpath(os.path.join(folder, name), first)
+                    for folder, _, names in os.walk(first) for name in names if name.endswith(".jpg"))
+    assert images
+    for image in images:
+        variant = os.path.join(first, f"{image}.webp")
+        with open(variant, "rb") as f:
+            assert f.read(12)[8:] == b"WEBP"
+        # Variants are hardlinks of the cache entry named by the image's content hash
+        with open(os.path.join(first, image), "rb") as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+        assert os.path.samefile(variant, cache / content_hash[:2] / f"{content_hash[2:]}-q80.webp")
+    stats = load_stats(first)
+    assert stats["images_optimized"] == len(images) and stats["images_unchanged"] == 0
+
+    # Every <picture> offers variants that exist
+    with open(os.path.join(first, "post-1", "index.html"), encoding="utf-8") as f:
+        pictures = get_pictures(f.read())
+    assert pictures
+    for sources, _ in pictures:
+        for candidate in sources[0]["srcset"].split(", "):
+            url = candidate.split()[0]
+            assert os.path.exists(os.path.join(first, url[len("https://static.example.org/"):]))
+
+    # Another export of the same images encodes nothing
+    second = run_export(site, tmp_path / "second", **settings)
+    stats = load_stats(second)
+    assert stats["images_optimized"] == 0 and stats["images_unchanged"] == len(images)
+    assert not os.path.exists(os.path.join(second, "image_manifest.json"))
@@ -0,0 +1,95 @@
+"""Tests of incremental re-exports (INCREMENTAL=true): which pages are kept, re-exported or deleted"""
+import json
+import os
+
+from conftest import read_export, run_export
+from synthetic_site import SyntheticSite
+
+
+class EditableSite(SyntheticSite):
+    """SyntheticSite whose posts can be updated (new lastmod and content) or deleted between exports"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.updated = set()
+        self.deleted = set()
+
+    def page_lastmod(self, index):
+        return "2024-02-01T00:00:00+00:00" if index in self.updated else super().page_lastmod(index)
+
+    def get_page_index(self, path):
+        index = super().get_page_index(path)
+        return None if index in self.deleted else index
+
+    def render_page(self, index):
+        html = super().render_page(index)
+        return html.replace("</article>", "<p>Updated post</p></article>") if index in self.updated else html
+
+
+def load_json(folder, name):
+    with open(os.path.join(folder, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_unshared_post(manifest, site):
+    """Return the index of a post whose images no category or tag page shows"""
+    image_pages = {}
+    for page in manifest["pages"].values():
+        for asset in page["assets"]:
+            image_pages.setdefault(asset, set()).add(page["path"])
+    return next(index for index in range(3, site.pages)
+                if image_pages[f"wp-content/uploads/2024/01/image-{index}-0.jpg"] == {f"post-{index}/index.html"})
+
+
+def test_incremental_export_keeps_updates_and_deletes_pages(serve, tmp_path):
+    site = serve(EditableSite(pages=10, links=4, images=1, sitemaps=2, plugins=1, image_size=1000))
+    export_folder = run_export(site, tmp_path, INCREMENTAL="true")
+    previous_manifest = load_json(export_folder, "export_manifest.json")
+    unchanged_page = os.path.join(export_folder, "post-1", "index.html")
+    unchanged_mtime = os.stat(unchanged_page).st_mtime_ns
+
+    deleted = get_unshared_post(previous_manifest, site)
+    site.updated.add(2)
+    site.deleted.add(deleted)
+    run_export(site, tmp_path, INCREMENTAL="true")
+
+    changes = load_json(export_folder, "export_changes.json")
+    # Category and tag pages are not in the sitemap, so they are revalidated and may change too
+    assert [path for path in changes["modified"] if path.startswith("post-")] == ["post-2/index.html"]
+    assert f"post-{deleted}/index.html" in changes["removed"]
+    assert changes["added"] == []
+
+    # Pages whose sitemap lastmod is unchanged are kept without being written again
+    assert os.stat(unchanged_page).st_mtime_ns == unchanged_mtime
+    with open(os.path.join(export_folder, "post-2", "index.html"), encoding="utf-8") as f:
+        assert "Updated post" in f.read()
+    # A page answered 404 is deleted with the assets only it used
+    assert not os.path.exists(os.path.join(export_folder, f"post-{deleted}"))
+    manifest = load_json(export_folder, "export_manifest.json")
+    deleted_url = f"http://{site.host}/post-{deleted}/"
+    assert deleted_url not in manifest["pages"]
+    used_assets = {asset for page in manifest["pages"].values() for asset in page["assets"]}
+    orphaned_assets = set(previous_manifest["pages"][deleted_url]["assets"]) - used_assets
+    assert orphaned_assets
+    for asset in orphaned_assets:
+        assert asset in changes["removed"]
+        assert asset not in manifest["assets"]
+        assert not os.path.exists(os.path.join(export_folder, asset))
+
+
+def test_incremental_export_matches_full_export(serve, tmp_path):
+    site = serve(EditableSite(pages=10, links=4, images=1, sitemaps=2, plugins=1, image_size=1000))
+    incremental_folder = run_export(site, tmp_path / "incremental", INCREMENTAL="true")
+    # Deleting a post could orphan pages, which an incremental export revalidates and keeps
+    # but a full export no longer finds, so the site is only updated
+    site.updated.update((2, 5))
+    run_export(site, tmp_path / "incremental", INCREMENTAL="true")
+
+    full_folder = run_export(site, tmp_path / "full", INCREMENTAL="true")
+    incremental, full = read_export(incremental_folder), read_export(full_folder)
+    # Only the list of changes (and its precompression) differs: the full export added everything
+    for export in (incremental, full):
+        for name in ("export_changes.json", "export_changes.json.gz", "export_changes.json.br",
+                     "precompress_manifest.json"):
+            export.pop(name, None)
+    assert incremental == full
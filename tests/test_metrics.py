@@ -0,0 +1,74 @@
+"""Tests of the metrics reports: export_metrics.json and the Prometheus export_metrics.prom"""
+import json
+import re
+from collections import Counter
+
+import pytest
+
+import export_website
+
+# A sample line of the Prometheus text format: name, optional labels, value
+SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[a-z_]+="[^"]*"(?:,[a-z_]+="[^"]*")*\})? (\S+)$')
+
+
+@pytest.fixture
+def metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_website, "export_folder", str(tmp_path))
+    monkeypatch.setattr(export_website, "phase_metrics", {})
+    monkeypatch.setattr(export_website, "stage_durations", {"crawl": 2.5})
+    monkeypatch.setattr(export_website, "stage_cpu_times", {"crawl": 1.25})
+    monkeypatch.setattr(export_website, "stage_peak_rss", {"crawl": 80.5})
+    monkeypatch.setattr(export_website, "stats", Counter(pages_processed=3, errors=0))
+    for seconds, size in ((0.003, 100), (0.2, 200), (0.2, 300), (60, 400)):
+        export_website.record_timing("fetch", seconds, size)
+    export_website.save_metrics()
+    return tmp_path
+
+
+def read_samples(path):
+    """Return {(name, labels): value} of a Prometheus text file, checking every sample has a TYPE"""
+    samples = {}
+    types = {}
+    for line in path.read_text().splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split()
+            types[name] = metric_type
+            continue
+        if line.startswith("#"):
+            continue
+        match = SAMPLE_PATTERN.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        assert re.sub(r"_(bucket|sum|count)$", "", name) in types or name in types, name
+        samples[name, labels or ""] = float(value)
+    return samples
+
+
+def test_metrics_report_has_cumulative_histograms(metrics):
+    with open(metrics / "export_metrics.json", encoding="utf-8") as f:
+        report = json.load(f)
+    fetch = report["phases"]["fetch"]
+    assert (fetch["count"], fetch["bytes"]) == (4, 1000)
+    assert fetch["seconds"] == pytest.approx(60.403)
+    assert fetch["buckets"]["0.005"] == 1
+    assert fetch["buckets"]["0.25"] == 3
+    assert fetch["buckets"]["30"] == 3
+    assert fetch["buckets"]["+Inf"] == 4
+    assert report["stages"] == {"crawl": 2.5}
+
+
+def test_prometheus_file_is_valid_text_format(metrics):
+    samples = read_samples(metrics / "export_metrics.prom")
+    assert samples["wordpress_export_stage_seconds", '{stage="crawl"}'] == 2.5
+    assert samples["wordpress_export_stage_cpu_seconds", '{stage="crawl"}'] == 1.25
+    assert samples["wordpress_export_stage_peak_rss_megabytes", '{stage="crawl"}'] == 80.5
+    assert samples["wordpress_export_phase_seconds_bucket", '{phase="fetch",le="0.25"}'] == 3
+    assert samples["wordpress_export_phase_seconds_bucket", '{phase="fetch",le="+Inf"}'] == 4
+    assert samples["wordpress_export_phase_seconds_count", '{phase="fetch"}'] == 4
+    assert samples["wordpress_export_phase_seconds_sum", '{phase="fetch"}'] == pytest.approx(60.403)
+    assert samples["wordpress_export_phase_bytes_total", '{phase="fetch"}'] == 1000
+    assert samples["wordpress_export_pages_processed", ""] == 3
+    # Buckets are cumulative
+    buckets = [value for (name, labels), value in samples.items() if name.endswith("_bucket")]
+    assert buckets == sorted(buckets)
+    assert not list(metrics.glob("*.part"))
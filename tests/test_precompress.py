@@ -0,0 +1,75 @@
+"""Tests of the gzip/brotli precompression stage and its manifest"""
+import gzip
+import hashlib
+import json
+import os
+from collections import Counter
+
+import pytest
+
+import export_website
+
+PAGE = ("<p>Some compressible text.</p>\n" * 200).encode()
+
+
+@pytest.fixture
+def export_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_website, "export_folder", str(tmp_path))
+    monkeypatch.setattr(export_website, "stats", Counter())
+    (tmp_path / "post-1").mkdir()
+    (tmp_path / "post-1" / "index.html").write_bytes(PAGE)
+    (tmp_path / "small.css").write_bytes(b"body { margin: 0 }")
+    # Random bytes do not compress, so no variant is kept
+    (tmp_path / "random.json").write_bytes(os.urandom(4096))
+    (tmp_path / "export_statistics.json").write_bytes(b" " * 4096)
+    (tmp_path / "export_statistics.json.gz").write_bytes(b"stale")
+    return tmp_path
+
+
+def load_manifest(folder):
+    with open(folder / export_website.PRECOMPRESS_MANIFEST_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def precompress(monkeypatch):
+    monkeypatch.setattr(export_website, "stats", Counter())
+    export_website.precompress_export()
+    return export_website.stats
+
+
+def test_precompress_writes_smaller_variants_and_manifest(export_folder, monkeypatch):
+    stats = precompress(monkeypatch)
+    suffixes = [".gz", ".br"] if export_website.brotli is not None else [".gz"]
+    manifest = load_manifest(export_folder)
+
+    assert sorted(manifest) == ["post-1/index.html", "random.json"]
+    page = manifest["post-1/index.html"]
+    assert page["hash"] == hashlib.sha1(PAGE).hexdigest()
+    assert page["variants"] == page["kept"] == sorted(suffixes)
+    assert gzip.decompress((export_folder / "post-1" / "index.html.gz").read_bytes()) == PAGE
+    assert manifest["random.json"]["kept"] == []
+    assert not any(name.startswith(("random.json.", "small.css.", "export_statistics.json."))
+                   for name in os.listdir(export_folder))
+    assert stats["files_precompressed"] == 2
+
+
+def test_precompress_skips_unchanged_files(export_folder, monkeypatch):
+    precompress(monkeypatch)
+    variant = export_folder / "post-1" / "index.html.gz"
+    mtime = variant.stat().st_mtime_ns
+    stats = precompress(monkeypatch)
+    assert (stats["files_precompressed"], stats["precompressed_unchanged"]) == (0, 2)
+    assert variant.stat().st_mtime_ns == mtime
+
+    # A changed file is compressed again, a missing variant is written again and the
+    # variants of a deleted file are removed
+    (export_folder / "post-1" / "index.html").write_bytes(PAGE * 2)
+    (export_folder / "page.html").write_bytes(PAGE)
+    precompress(monkeypatch)
+    (export_folder / "page.html.gz").unlink()
+    os.remove(export_folder / "random.json")
+    stats = precompress(monkeypatch)
+    assert (stats["files_precompressed"], stats["precompressed_unchanged"]) == (1, 1)
+    assert gzip.decompress(variant.read_bytes()) == PAGE * 2
+    assert gzip.decompress((export_folder / "page.html.gz").read_bytes()) == PAGE
+    assert sorted(load_manifest(export_folder)) == ["page.html", "post-1/index.html"]
@@ -0,0 +1,95 @@
+"""Tests of the per-host AIMD rate controller and of retries against a failing origin"""
+import json
+import os
+import time
+
+import pytest
+
+from conftest import read_export, run_export
+from export_website import RateController
+from synthetic_site import SyntheticSite
+
+
+def send(controller, **result):
+    controller.acquire()
+    controller.release(**result)
+
+
+def test_throttling_halves_concurrency_and_rate_once_per_second():
+    controller = RateController(8, max_rate=100)
+    send(controller, throttled=True)
+    assert (controller.limit, controller.rate) == (4, 50)
+    # A burst of failures counts as one signal
+    send(controller, throttled=True)
+    send(controller, latency=10)
+    assert (controller.limit, controller.rate) == (4, 50)
+    controller.last_decrease -= 1
+    send(controller, latency=10)
+    assert (controller.limit, controller.rate) == (2, 25)
+
+
+def test_unlimited_rate_starts_at_half_the_effective_rate():
+    controller = RateController(4)
+    for _ in range(9):
+        send(controller)
+    controller.first_request = controller.last_request - 1
+    # The tenth request ends the one second in which ten were sent
+    send(controller, throttled=True)
+    assert controller.rate == pytest.approx(5, rel=0.01)
+
+
+def test_successes_increase_concurrency_and_rate_additively():
+    controller = RateController(4, max_rate=10)
+    controller.limit, controller.rate = 1.0, 2.0
+    send(controller)
+    assert (controller.limit, controller.rate) == (2, 2.5)
+    send(controller)
+    assert (controller.limit, controller.rate) == (2.5, pytest.approx(2.9))
+    for _ in range(100):
+        controller.next_slot = 0
+        send(controller)
+    assert (controller.limit, controller.rate) == (4, 10)
+
+
+def test_retry_after_pauses_every_request_to_the_host():
+    controller = RateController(4)
+    controller.pause(0.3)
+    started = time.monotonic()
+    send(controller)
+    assert time.monotonic() - started >= 0.29
+
+
+def test_effective_rate_counts_requests_per_second():
+    controller = RateController(4, max_rate=20)
+    started = time.monotonic()
+    for _ in range(11):
+        send(controller)
+    elapsed = time.monotonic() - started
+    # 11 requests 1/20 s apart are sent over half a second
+    assert elapsed >= 0.45
+    assert controller.get_effective_rate() == pytest.approx(22, rel=0.05)
+
+
+def load_stats(folder):
+    with open(os.path.join(folder, "export_statistics.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_failed_and_throttled_requests_are_retried(serve, tmp_path):
+    site = serve(SyntheticSite(pages=12, links=3, images=1, sitemaps=2, plugins=1, image_size=1000))
+    reliable_folder = run_export(site, tmp_path / "reliable")
+
+    # A third of the pages and assets fail twice before they recover, and requests beyond
+    # 30/s are answered 429 with Retry-After
+    site.fail_rate, site.fail_count, site.max_rps = 0.3, 2, 30
+    export_folder = run_export(site, tmp_path / "flaky", MAX_RETRIES="3", RETRY_BACKOFF="0.05")
+
+    assert read_export(export_folder) == read_export(reliable_folder)
+    stats = load_stats(export_folder)
+    failures = sum(site.failures.values())
+    assert failures > 0 and stats["errors"] == 0
+    # Every 500 and 429 is retried and slows the controller down
+    assert stats["requests_retried"] >= failures
+    assert stats["requests_throttled"] >= failures
+    assert stats["requests_sent"] == load_stats(reliable_folder)["requests_sent"] + stats["requests_retried"]
+    assert stats["effective_request_rate"] > 0
@@ -0,0 +1,10 @@
+"""Tests of rendering pages in worker processes (PARSE_WORKERS)"""
+from conftest import read_export, run_export
+from synthetic_site import SyntheticSite
+
+
+def test_render_workers_export_the_same_site(serve, tmp_path):
+    site = serve(SyntheticSite(pages=10, links=3, images=1, sitemaps=2, plugins=1, image_size=1000))
+    in_threads = read_export(run_export(site, tmp_path / "threads"))
+    in_workers = read_export(run_export(site, tmp_path / "workers", PARSE_WORKERS="2"))
+    assert in_workers == in_threads
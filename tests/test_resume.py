@@ -0,0 +1,79 @@
+"""Tests of resuming an interrupted export (--resume)"""
+import json
+import os
+import signal
+import time
+
+import export_website
+from conftest import count_lines, read_export, run_export, start_export, wait_export
+from synthetic_site import SyntheticSite
+
+# Every response is delayed, so the export can be stopped halfway through
+SLOW_SITE = dict(pages=12, links=4, images=2, sitemaps=2, plugins=1, image_size=1000, slow_rate=1.0, slow_delay=0.1)
+SLOW_EXPORT = dict(MAX_WORKERS="2", ASSET_WORKERS="2", CHECKPOINT_INTERVAL="0.2")
+
+
+def kill_export_halfway(site, work_dir):
+    """Start an export and kill it once a few pages are exported; return its export folder"""
+    process = start_export(site, work_dir, **SLOW_EXPORT)
+    stream_path = os.path.join(work_dir, "export", "wordpress_export.ndjson")
+    deadline = time.monotonic() + 60
+    while count_lines(stream_path) < 4 and process.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert process.poll() is None, "the export finished before it could be interrupted"
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+    return os.path.join(work_dir, "export")
+
+
+def test_resumed_export_matches_uninterrupted_export(serve, tmp_path):
+    site = serve(SyntheticSite(**SLOW_SITE))
+    export_folder = kill_export_halfway(site, tmp_path / "resumed")
+    assert os.path.exists(os.path.join(export_folder, "crawl_frontier.sqlite"))
+    assert not os.path.exists(os.path.join(export_folder, "wordpress_export.json"))
+
+    wait_export(start_export(site, tmp_path / "resumed", "--resume", "export", **SLOW_EXPORT), tmp_path / "resumed")
+    assert not os.path.exists(os.path.join(export_folder, "crawl_frontier.sqlite"))
+
+    full_folder = run_export(site, tmp_path / "full", **SLOW_EXPORT)
+    assert read_export(export_folder) == read_export(full_folder)
+
+
+def test_export_resumed_twice_matches_uninterrupted_export(serve, tmp_path):
+    site = serve(SyntheticSite(**SLOW_SITE))
+    export_folder = kill_export_halfway(site, tmp_path / "resumed")
+    process = start_export(site, tmp_path / "resumed", "--resume", "export", **SLOW_EXPORT)
+    time.sleep(0.5)
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+    wait_export(start_export(site, tmp_path / "resumed", "--resume", "export", **SLOW_EXPORT), tmp_path / "resumed")
+
+    full_folder = run_export(site, tmp_path / "full", **SLOW_EXPORT)
+    assert read_export(export_folder) == read_export(full_folder)
+
+
+def test_resume_rebuilds_the_index_of_the_streaming_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_website, "export_folder", str(tmp_path))
+    monkeypatch.setattr(export_website, "crawl_frontier", export_website.CrawlFrontier(str(tmp_path / "frontier.sqlite")))
+    export_website.open_export_stream()
+    export_website.add_content_item("pages", {"url": "https://example.com/", "title": "Home"})
+    export_website.add_content_item("media", {"url": "https://example.com/a.jpg", "local_path": "a.jpg"})
+    export_website.close_export_stream()
+    # Interrupted after a record was flushed but before its index line, and in the middle of the next record
+    with open(tmp_path / export_website.EXPORT_STREAM_FILE, "ab") as f:
+        f.write(json.dumps({"type": "posts", "data": {"url": "https://example.com/post/", "tags": ["t"]}}).encode() + b"\n")
+        f.write(b'{"type": "posts", "da')
+
+    export_website.open_export_stream(resume=True)
+    export_website.add_content_item("posts", {"url": "https://example.com/next/"})
+    export_website.close_export_stream()
+
+    index = export_website.load_export_index(str(tmp_path / export_website.EXPORT_INDEX_FILE))
+    assert list(index) == ["https://example.com/", "a.jpg", "https://example.com/post/", "https://example.com/next/"]
+    stream_path = str(tmp_path / export_website.EXPORT_STREAM_FILE)
+    assert [export_website.read_export_record(stream_path, offset, length)[1].get("url")
+            for _, offset, length in index.values()] == [
+        "https://example.com/", "https://example.com/a.jpg", "https://example.com/post/", "https://example.com/next/"]
+    # Media already exported are not recorded twice
+    assert not export_website.crawl_frontier.add_media("a.jpg")
+    export_website.crawl_frontier.close()
@@ -0,0 +1,106 @@
+"""Tests of the client-side search index: tokenizer, stemmer, search.js and the SPIMI build"""
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import export_website
+from conftest import ROOT, run_export
+from export_website import stem_search_term, tokenize_search_text
+from synthetic_site import SyntheticSite, start_server
+
+TEXTS = [
+    "The Gardeners were gardening: relational organizations and happiness",
+    "Café crème, naïve résumé — Ærøskøbing",
+    "Don't split snake_case or HTML5, but 2024 and x² are kept",
+    "Running runs quickly; classes, buses and analysis",
+    "a I of to, the",
+]
+
+# Runs search.js in Node with a stub browser, printing the tokens of each text read from stdin
+TOKENIZE_SCRIPT = """
+const fs = require("fs");
+const input = JSON.parse(fs.readFileSync(0, "utf-8"));
+global.window = {};
+global.document = {currentScript: null};
+global.fetch = () => Promise.resolve({ok: true, json: () => Promise.resolve(input.meta)});
+eval(fs.readFileSync(input.client, "utf-8"));
+Promise.all(input.texts.map((text) => window.WordPressSearch.tokenize(text)))
+    .then((tokens) => console.log(JSON.stringify(tokens)));
+"""
+
+
+@pytest.mark.parametrize("word, stem", [
+    ("relational", "relate"), ("organization", "organize"), ("happiness", "happi"), ("classes", "class"),
+    ("ponies", "pony"), ("gardening", "garden"), ("quickly", "quick"), ("runs", "run"), ("analysis", "analysis"),
+    ("bus", "bus"), ("sing", "sing"), ("is", "is"),
+])
+def test_stemmer_strips_the_first_matching_suffix(word, stem):
+    assert stem_search_term(word) == stem
+
+
+def test_tokenizer_normalises_drops_stopwords_and_stems():
+    assert tokenize_search_text(TEXTS[0]) == ["gardener", "garden", "relate", "organization", "happi"]
+    assert tokenize_search_text(TEXTS[1]) == ["cafe", "creme", "naive", "resume", "ærøskøb"]
+    assert tokenize_search_text(TEXTS[2]) == ["don", "split", "snake", "case", "html5", "2024", "x2", "kept"]
+    assert tokenize_search_text(TEXTS[4]) == []
+
+
+@pytest.fixture(scope="module")
+def search_exports(tmp_path_factory):
+    """Export a site twice: with one in-memory postings block, and with blocks of 50 postings"""
+    site = SyntheticSite(pages=20, links=3, images=1, sitemaps=2, plugins=1, image_size=1000, paragraphs=5)
+    server = start_server(site)
+    work_dir = tmp_path_factory.mktemp("search")
+    try:
+        yield (run_export(site, work_dir / "one_block"),
+               run_export(site, work_dir / "small_blocks", SEARCH_BLOCK_POSTINGS="50"))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def read_search_index(export_folder):
+    folder = os.path.join(export_folder, export_website.SEARCH_FOLDER)
+    index = {}
+    for root, _, names in os.walk(folder):
+        for name in names:
+            with open(os.path.join(root, name), "rb") as f:
+                index[os.path.relpath(os.path.join(root, name), folder)] = f.read()
+    return index
+
+
+def test_small_blocks_give_the_same_index(search_exports):
+    one_block, small_blocks = (read_search_index(folder) for folder in search_exports)
+    assert any(name.startswith("terms/") for name in one_block)
+    assert small_blocks == one_block
+
+
+def test_terms_are_sharded_by_prefix(search_exports):
+    terms_folder = os.path.join(search_exports[0], export_website.SEARCH_FOLDER, "terms")
+    with open(os.path.join(search_exports[0], export_website.SEARCH_FOLDER, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    document_ids = set()
+    for name in os.listdir(terms_folder):
+        prefix = name[:-len(".json")]
+        with open(os.path.join(terms_folder, name), encoding="utf-8") as f:
+            terms = json.load(f)
+        assert terms and all(term[:meta["prefix_length"]] == prefix for term in terms)
+        for postings in terms.values():
+            ids = [document_id for document_id, _ in postings]
+            assert ids == sorted(set(ids))
+            document_ids.update(ids)
+    assert document_ids == set(range(meta["documents"]))
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs Node.js")
+def test_search_client_tokenizes_like_the_index(search_exports):
+    folder = os.path.join(search_exports[0], export_website.SEARCH_FOLDER)
+    with open(os.path.join(folder, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    client = os.path.join(ROOT, "static", "search.js")
+    result = subprocess.run(["node", "-e", TOKENIZE_SCRIPT], check=True, capture_output=True, text=True,
+                            input=json.dumps({"meta": meta, "client": client, "texts": TEXTS}))
+    assert json.loads(result.stdout) == [tokenize_search_text(text) for text in TEXTS]
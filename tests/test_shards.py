@@ -0,0 +1,48 @@
+"""Tests of sharded exports (--shard) and of merging them (--merge-shards)"""
+import os
+import signal
+import time
+
+from conftest import count_lines, read_export, run_export, start_export, wait_export
+from synthetic_site import SyntheticSite
+
+SITE = dict(pages=30, links=6, images=1, sitemaps=3, plugins=2, image_size=1000)
+
+
+def run_sharded_export(site, work_dir, count):
+    """Run count shard workers at once, merge their shards and return the export folder"""
+    workers = [start_export(site, work_dir, "--shard", f"{index}/{count}", log=f"shard{index}.log",
+                            SHARD_POLL_INTERVAL="0.1")
+               for index in range(count)]
+    for index, worker in enumerate(workers):
+        wait_export(worker, work_dir, log=f"shard{index}.log")
+    return run_export(site, work_dir, "--merge-shards")
+
+
+def test_merged_shards_match_single_export(serve, tmp_path):
+    site = serve(SyntheticSite(**SITE))
+    merged_folder = run_sharded_export(site, tmp_path / "sharded", 3)
+    assert not os.path.exists(os.path.join(merged_folder, "shards"))
+    assert not os.path.exists(os.path.join(merged_folder, "shard_queue.sqlite"))
+
+    single_folder = run_export(site, tmp_path / "single")
+    assert read_export(merged_folder) == read_export(single_folder)
+
+
+def test_restarted_shard_worker_redoes_its_shard(serve, tmp_path):
+    site = serve(SyntheticSite(**SITE))
+    work_dir = tmp_path / "sharded"
+    # The first attempt of worker 0 exports pages, forwards links and waits for worker 1,
+    # which has not started, until it is killed
+    worker = start_export(site, work_dir, "--shard", "0/2", log="shard0.log", SHARD_POLL_INTERVAL="0.1")
+    stream_path = os.path.join(work_dir, "export", "shards", "0", "wordpress_export.ndjson")
+    deadline = time.monotonic() + 60
+    while count_lines(stream_path) < 3 and worker.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert worker.poll() is None
+    worker.send_signal(signal.SIGKILL)
+    worker.wait()
+
+    merged_folder = run_sharded_export(site, work_dir, 2)
+    single_folder = run_export(site, tmp_path / "single")
+    assert read_export(merged_folder) == read_export(single_folder)